@@ -0,0 +1,44 @@
+import typer
+from pipeline.utils import get_logger
+from pipeline.gazetteer import Gazetteer
+
+
+def build_gazetteer(
+    dump_path: str,
+    gazetteer_path: str = "./cache/gazetteer.sqlite",
+    min_population: int = 0,
+    feature_classes: str = "PA",
+    country_info_path: str = None,
+    admin1_path: str = None,
+    log_level: str = "INFO",
+):
+    """
+    Build the offline gazetteer used by the weather tool from a GeoNames dump
+    ---
+    Args:
+    - dump_path: Path to a GeoNames dump (e.g. cities500.zip from https://download.geonames.org/export/dump/)
+    - gazetteer_path: Path to the gazetteer index to build
+    - min_population: Minimum population of imported places
+    - feature_classes: GeoNames feature classes to import (P = populated places, A = administrative areas)
+    - country_info_path: Path to the GeoNames country names (countryInfo.txt), to resolve country qualifiers
+    - admin1_path: Path to the GeoNames state/province names (admin1CodesASCII.txt), to resolve state qualifiers
+    - log_level: Level of logs to be reported
+    """
+
+    # Logger
+    logger = get_logger(log_level)
+
+    # Build index
+    gazetteer = Gazetteer(gazetteer_path)
+    count = gazetteer.build(
+        dump_path,
+        min_population=min_population,
+        feature_classes=feature_classes,
+        country_info_path=country_info_path,
+        admin1_path=admin1_path,
+    )
+    logger.info(f"Gazetteer {gazetteer_path} holds {count} places")
+
+
+if __name__ == "__main__":
+    typer.run(build_gazetteer)
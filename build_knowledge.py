@@ -0,0 +1,30 @@
+import typer
+from pipeline.utils import get_logger
+from pipeline.knowledge import KnowledgeIndex
+
+
+def build_knowledge(
+    dump_path: str,
+    knowledge_path: str = "./cache/knowledge.sqlite",
+    log_level: str = "INFO",
+):
+    """
+    Build the offline knowledge index used by the search tool from an abstracts dump
+    ---
+    Args:
+    - dump_path: Path to a DBpedia short abstracts dump (e.g. short-abstracts_lang=en.ttl.bz2) or a JSON lines file with "title" and "abstract" keys
+    - knowledge_path: Path to the knowledge index to build
+    - log_level: Level of logs to be reported
+    """
+
+    # Logger
+    logger = get_logger(log_level)
+
+    # Build index
+    index = KnowledgeIndex(knowledge_path)
+    count = index.build(dump_path)
+    logger.info(f"Knowledge index {knowledge_path} holds {count} articles")
+
+
+if __name__ == "__main__":
+    typer.run(build_knowledge)
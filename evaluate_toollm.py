@@ -1,74 +1,473 @@
 from pipeline.asr import ASR  # ASR first (bug fix)
-from pipeline.wakeword import Wakeword
-from pipeline.utils import get_logger, get_config, name
-from pipeline.audio import play_wave_file
-from pipeline.microphone import Microphone
+from pipeline.utils import get_logger
 from pipeline.llm import LLM
 from pipeline.toolllm import ToolLLM
-from pipeline.tts import TTS
+from pipeline.tools import Weather, Search, NoResultsError
+from pipeline.metrics import get_metrics
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+import contextvars
+import threading
+import json
 import time
+import csv
 import os
-import logging
+import re
 import typer
 
+# Evaluation tasks, with the expected answers (any of which is correct, None = not scored)
+# NOTE: Answers depending on live data (the weather) can only be scored with mocked tools
+TASKS = [
+    # Simple instructions not requiring tool execution
+    {"prompt": "What is your name?", "expected": ["Sola"]},
+    {"prompt": "What can you help me with?", "expected": None},
+    {"prompt": "Write me a poem about the tools you have access to.", "expected": None},
+    # Simple questions requiring one tool
+    {
+        "prompt": "What is the current weather in Columbia University, NYC?",
+        "expected": None,
+        "mock_expected": [21.3],
+    },
+    {
+        "prompt": "What is fifty seven multiplied by three hundred and twenty one minus four?",
+        "expected": [18293],
+    },
+    {"prompt": "In what city did the 2020 olympic games take place?", "expected": ["Tokyo"]},
+    # More difficult questions requiring two tools
+    {
+        "prompt": "What is the current weather in the city where the 2020 olympic games took place?",
+        "expected": None,
+        "mock_expected": [21.3],
+    },
+    {
+        "prompt": "What is the sum of the current temperature and humidity at Columbia University?",
+        "expected": None,
+        "mock_expected": [85.3],
+    },
+    {
+        "prompt": "What is the product of all the numbers of the year when the Olympic Games were held in Beijjing?",
+        "expected": [0],
+    },
+    # Difficult questions requiring all three tools, or two tools and creativity
+    {
+        "prompt": "Write a poem about the current weather in the city where the 2020 olympic games took place.",
+        "expected": None,
+    },
+    {
+        "prompt": "What is the sum of the current temperature and humidity in the city where the 2020 olympic games took place?",
+        "expected": None,
+        "mock_expected": [85.3],
+    },
+]
+
+# Counters of the task being evaluated (shared with the tool threads it starts)
+task_stats = contextvars.ContextVar("task_stats", default=None)
+task_stats_lock = threading.Lock()
+
+
+def record(name, value=1):
+    """
+    Add to a counter of the task being evaluated
+    ---
+    Args:
+    - name: Name of the counter
+    - value (default = 1): Value to add
+    """
+
+    stats = task_stats.get()
+    if stats is not None:
+        with task_stats_lock:
+            stats[name] += value
+
+
+class InstrumentedLLM:
+    """
+    InstrumentedLLM counts the LLM calls of each task, including pure LLM fallbacks
+    ---
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def _record_call(self, tags):
+        record("llm_calls")
+        if (tags or {}).get("iteration") == "fallback":
+            record("fallbacks")
+
+    def __call__(self, prompt, *args, tags=None, **kwargs):
+        self._record_call(tags)
+        return self.llm(prompt, *args, tags=tags, **kwargs)
+
+    def stream(self, prompt, *args, tags=None, **kwargs):
+        self._record_call(tags)
+        return self.llm.stream(prompt, *args, tags=tags, **kwargs)
+
+    def call_tools(self, messages, tool_schemas, tags=None):
+        self._record_call(tags)
+        return self.llm.call_tools(messages, tool_schemas, tags=tags)
+
+
+class InstrumentedToolLLM(ToolLLM):
+    """
+    InstrumentedToolLLM counts the tool calls and parse failures of each task
+    ---
+    """
+
+    def _parse_llm_result(self, result):
+        try:
+            return super()._parse_llm_result(result)
+        except (AssertionError, json.JSONDecodeError):
+            record("parse_failures")
+            raise
+
+    def _run_tool(self, tool_name, tool_arg, tools_called, deadline=None, cancel=None):
+        message, success = super()._run_tool(
+            tool_name, tool_arg, tools_called, deadline, cancel
+        )
+        record("tool_calls")
+        if not success:
+            record("tool_errors")
+        return message, success
+
+
+class MockWeather(Weather):
+    """
+    MockWeather reports the same fixed weather at every location, for offline evaluation
+    ---
+    """
+
+    weather_data = {
+        "temperature_2m": "21.3 °C",
+        "relative_humidity_2m": "64 %",
+        "precipitation_probability": "10 %",
+        "precipitation": "0.0 mm",
+        "wind_speed_10m": "12.6 km/h",
+    }
+
+    def lookup(self, locations):
+        return [dict(self.weather_data) for _ in locations]
+
+
+class MockSearch(Search):
+    """
+    MockSearch answers the keywords of the evaluation tasks from fixed descriptions, for offline evaluation
+    ---
+    """
+
+    descriptions = [
+        (
+            r"olymp.*(2020|tokyo)|(2020|tokyo).*olymp",
+            "The 2020 Summer Olympics were an international multi-sport event held from 23 July to 8 August 2021 in Tokyo, Japan.",
+        ),
+        (
+            r"olymp.*(2008|beij)|(2008|beij).*olymp|^beij",
+            "The 2008 Summer Olympics were an international multi-sport event held from 8 to 24 August 2008 in Beijing, China.",
+        ),
+        (
+            r"columbia",
+            "Columbia University is a private research university in the Morningside Heights neighborhood of New York City.",
+        ),
+        (
+            r"tokyo",
+            "Tokyo is the capital and most populous city of Japan.",
+        ),
+    ]
+
+    def __call__(self, keyword):
+        for pattern, description in self.descriptions:
+            if re.search(pattern, keyword.lower()):
+                return description
+        raise NoResultsError(f"No results for keyword {keyword}")
+
+
+# Mocked tools by label
+mock_tools = {
+    "weather": MockWeather,
+    "search": MockSearch,
+}
+
+
+def extract_numbers(text):
+    """
+    Extract the numbers from a text
+    ---
+    Args:
+    - text: Text (e.g. "The result is 18,293.")
+
+    Returns:
+    - numbers: List of numbers
+    """
+
+    numbers = re.findall(r"-?\d[\d,]*(?:\.\d+)?", text)
+    return [float(number.replace(",", "")) for number in numbers]
+
+
+def score_response(response, expected, tolerance=0.01):
+    """
+    Score a response against the expected answers
+    ---
+    Args:
+    - response: Response of the ToolLLM
+    - expected: List of expected answers (numbers or strings), any of which is correct (None = not scored)
+    - tolerance (default = 0.01): Maximum relative difference of numerical answers
+
+    Returns:
+    - correct: Whether the response contains an expected answer, or None if not scored
+    """
+
+    if expected is None or response is None:
+        return None
+    numbers = extract_numbers(response)
+    for answer in expected:
+        if isinstance(answer, str):
+            if answer.lower() in response.lower():
+                return True
+        elif any(
+            abs(number - answer) <= tolerance * max(abs(answer), 1) for number in numbers
+        ):
+            return True
+    return False
+
+
+def evaluate_task(llm, index, task, mock, max_iterations):
+    """
+    Evaluate one task
+    ---
+    Args:
+    - llm: InstrumentedToolLLM instance
+    - index: Index of the task
+    - task: Task dictionary (prompt, expected answers)
+    - mock: Whether the tools are mocked
+    - max_iterations: Maximum number of tool loop iterations
+
+    Returns:
+    - result: Dictionary with the response, score and counters of the task
+    """
+
+    logger = get_logger()
+    stats = Counter()
+    task_stats.set(stats)
+    expected = task.get("mock_expected", task["expected"]) if mock else task["expected"]
+
+    # Run task
+    logger.info(f"Evaluating task {index}:\n{task['prompt']}")
+    response, error = None, None
+    start_time = time.time()
+    try:
+        response = llm(task["prompt"], max_iterations=max_iterations)
+    except Exception as err:
+        error = f"{err}"
+    wall_time = time.time() - start_time
+    logger.info(f"Response to task {index} ({wall_time:.2f}s):\n{response}")
+
+    return {
+        "task": index,
+        "prompt": task["prompt"],
+        "response": response,
+        "error": error,
+        "expected": expected,
+        "correct": score_response(response, expected),
+        "wall_time": wall_time,
+        "llm_calls": stats["llm_calls"],
+        "tool_calls": stats["tool_calls"],
+        "tool_errors": stats["tool_errors"],
+        "parse_failures": stats["parse_failures"],
+        "fallback": stats["fallbacks"] > 0,
+    }
+
+
+def summarize(results, wall_time):
+    """
+    Summarize the task results of a run
+    ---
+    Args:
+    - results: List of task results
+    - wall_time: Wall time of the run
+
+    Returns:
+    - summary: Dictionary with the accuracy and totals of the run
+    """
+
+    scored = [result for result in results if result["correct"] is not None]
+    correct = sum(result["correct"] for result in scored)
+    return {
+        "tasks": len(results),
+        "scored": len(scored),
+        "correct": correct,
+        "accuracy": correct / len(scored) if len(scored) else None,
+        "errors": sum(result["error"] is not None for result in results),
+        "fallbacks": sum(result["fallback"] for result in results),
+        "llm_calls": sum(result["llm_calls"] for result in results),
+        "tool_calls": sum(result["tool_calls"] for result in results),
+        "tool_errors": sum(result["tool_errors"] for result in results),
+        "parse_failures": sum(result["parse_failures"] for result in results),
+        "task_time": sum(result["wall_time"] for result in results),
+        "wall_time": wall_time,
+    }
+
+
+def evaluate_run(config, mock, workers, max_iterations):
+    """
+    Evaluate all tasks with one provider & model
+    ---
+    NOTE: Tasks are run concurrently, except on the in-process llama-cpp provider
+
+    Args:
+    - config: Configuration dictionary
+    - mock: Whether to mock the weather and search tools
+    - workers: Number of tasks run concurrently
+    - max_iterations: Maximum number of tool loop iterations
+
+    Returns:
+    - run: Dictionary with the configuration, summary, task results and metrics of the run
+    """
+
+    logger = get_logger()
+    logger.info(f"Evaluating {config['llm_provider']} ({config['llm_model']})")
+    if config["llm_provider"] == "llama-cpp" and workers > 1:
+        logger.warning("llama-cpp models run one prompt at a time, evaluating with 1 worker")
+        workers = 1
+
+    # Initialize instrumented ToolLLM
+    metrics = get_metrics()
+    metrics.reset()
+    llm_model = InstrumentedLLM(LLM(config))
+    llm = InstrumentedToolLLM(config, llm_model, config["llm_tools"])
+    if mock:
+        for label in llm.tools:
+            if label in mock_tools:
+                llm.tools[label] = mock_tools[label]()
+
+    # Evaluate tasks concurrently, each in its own context
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="task") as executor:
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                evaluate_task,
+                llm,
+                index,
+                task,
+                mock,
+                max_iterations,
+            )
+            for index, task in enumerate(TASKS)
+        ]
+        results = [future.result() for future in futures]
+    wall_time = time.time() - start_time
+    llm.executor.shutdown()
+
+    return {
+        "provider": config["llm_provider"],
+        "model": config["llm_model"],
+        "tool_mode": config["llm_tool_mode"],
+        "mock_tools": mock,
+        "workers": workers,
+        "summary": summarize(results, wall_time),
+        "tasks": results,
+        "metrics": metrics.summary(),
+    }
+
+
+def write_report(runs, report_path):
+    """
+    Write the evaluation report as JSON, and the task results of all runs as CSV
+    ---
+    Args:
+    - runs: List of evaluated runs
+    - report_path: Path to the JSON report (the CSV file gets the same name)
+    """
+
+    directory = os.path.dirname(report_path)
+    if len(directory):
+        os.makedirs(directory, exist_ok=True)
+    with open(report_path, "w") as f:
+        json.dump({"runs": runs}, f, indent=2, default=str)
+
+    columns = ["provider", "model", "tool_mode", "mock_tools"]
+    task_columns = [key for key in runs[0]["tasks"][0] if key != "expected"]
+    with open(f"{os.path.splitext(report_path)[0]}.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns + task_columns)
+        for run in runs:
+            for result in run["tasks"]:
+                writer.writerow(
+                    [run[key] for key in columns] + [result[key] for key in task_columns]
+                )
+
 
 def evaluate_toollm(
     llm_provider="llama-edge",
     llm_model="Meta-Llama-3-8B-Instruct",
     llm_provider_url=None,
+    llm_tool_mode="prompt",
+    llm_cache: bool = False,
+    llm_cache_path="./cache/evaluate_toollm.sqlite",
+    llm_record_provider="llama-edge",
+    llm_record_path="./recordings/evaluate_toollm.jsonl",
+    mock_tools: bool = False,
+    workers: int = 4,
+    max_iterations: int = 5,
+    report_path="./logs/evaluate_toollm.json",
     log_level="INFO",
 ):
     """
     ToolLLM Task Evaluation
     ---
     Args:
-    - llm_provider: Provider of the LLM
-    - llm_model: Model of the LLM
+    - llm_provider: Provider of the LLM (comma-separated to compare providers, one per model)
+    - llm_model: Model of the LLM (comma-separated to compare models)
+    - llm_provider_url: Base url of the LLM provider
+    - llm_tool_mode: Tool calling mode ("prompt" or "native")
+    - llm_cache: Whether to cache LLM responses between runs
+    - llm_cache_path: Path to the on-disk LLM response cache
+    - llm_record_provider: Provider wrapped by the "record" provider
+    - llm_record_path: Path to the recordings of the "record" / "replay" providers
+    - mock_tools: Whether to mock the weather and search tools (offline, and scores weather answers)
+    - workers: Number of tasks evaluated concurrently
+    - max_iterations: Maximum number of tool loop iterations
+    - report_path: Path to the JSON report (task results are also written to a CSV file next to it)
     - log_level: Level of logs to be reported
     """
 
     # Logger
     logger = get_logger(log_level)
 
-    # Construct config
-    config = {
-        "llm_provider": llm_provider,
-        "llm_provider_url": llm_provider_url,
-        "llm_model": llm_model,
-        "llm_skip": False,
-        "llm_use_tools": True,
-        "llm_tools": None,
-        "llm_system_message": "Your name is Sola, you are a helpful voice assistant. Keep responses short.",
-    }
+    # Providers & models to compare
+    models = llm_model.split(",")
+    providers = llm_provider.split(",")
+    if len(providers) == 1:
+        providers = providers * len(models)
+    assert len(providers) == len(models), "Give one provider, or one provider per model"
 
-    # Initialize ToolLLM
-    llm_model = LLM(config)
-    llm = ToolLLM(config, llm_model, config["llm_tools"])
-
-    # Tasks
-    task_prompts = [
-        # Simple instructions not requiring tool execution
-        "What is your name?",
-        "What can you help me with?",
-        "Write me a poem about the tools you have access to.",
-        # Simple questions requiring one tool
-        "What is the current weather in Columbia University, NYC?",
-        "What is fifty seven multiplied by three hundred and twenty one minus four?",
-        "In what city did the 2020 olympic games take place?",
-        # More difficult questions requiring two tools
-        "What is the current weather in the city where the 2020 olympic games took place?",
-        "What is the sum of the current temperature and humidity at Columbia University?",
-        "What is the product of all the numbers of the year when the Olympic Games were held in Beijjing?",
-        # Difficult questions requiring all three tools, or two tools and creativity
-        "Write a poem about the current weather in the city where the 2020 olympic games took place.",
-        "What is the sum of the current temperature and humidity in the city where the 2020 olympic games took place?",
-    ]
+    # Evaluate each provider & model
+    runs = []
+    for provider, model in zip(providers, models):
+        config = {
+            "llm_provider": provider.strip(),
+            "llm_provider_url": llm_provider_url,
+            "llm_model": model.strip(),
+            "llm_cache": llm_cache,
+            "llm_cache_path": llm_cache_path,
+            "llm_record_provider": llm_record_provider,
+            "llm_record_path": llm_record_path,
+            "llm_skip": False,
+            "llm_use_tools": True,
+            "llm_tools": None,
+            "llm_tool_mode": llm_tool_mode,
+            "llm_system_message": "Your name is Sola, you are a helpful voice assistant. Keep responses short.",
+            "tool_cache": False,
+        }
+        runs.append(evaluate_run(config, mock_tools, workers, max_iterations))
 
-    # Evaluate task prompts
-    for i, prompt in enumerate(task_prompts):
-        logger.info(f"Evaluating task {i}:\n{prompt}")
-        response = llm(prompt)
-        logger.info(f"Response:\n{response}")
+    # Report
+    write_report(runs, report_path)
+    for run in runs:
+        logger.info(f"{run['provider']} ({run['model']}): {run['summary']}")
+    logger.info(f"Report written to {report_path}")
 
 
 # Run evaluation
@@ -5,7 +5,10 @@ from .audio import play_wave_file
 from .microphone import Microphone
 from .llm import LLM
 from .toolllm import ToolLLM
+from .asyncllm import AsyncLLM, AsyncToolLLM, AsyncRunner
 from .tts import TTS
+from .memory import ConversationMemory
+from .router import Router
 import time
 import os
 
@@ -27,6 +30,10 @@ def run_pipeline(config_path, log_level):
     config = get_config(config_path)
     llm_skip = config["llm_skip"]
     llm_use_tools = config["llm_use_tools"]
+    tts_stream = config.get("tts_stream", False)
+    llm_barge_in = config.get("llm_barge_in", False)
+    use_memory = config.get("memory", False)
+    use_router = config.get("router", False)
 
     # Initialize voice pipeline models
     logger.debug("Initializing Assistant Pipeline")
@@ -39,24 +46,47 @@ def run_pipeline(config_path, log_level):
     if llm_skip:
         # Skipping over LLM execution
         llm = None
+    elif llm_barge_in:
+        # Async LLM, cancelled when the wakeword is detected during generation
+        runner = AsyncRunner()
+        llm_model = AsyncLLM(config)
+        if llm_use_tools:
+            llm = AsyncToolLLM(config, llm_model, config["llm_tools"])
+        else:
+            llm = llm_model
     elif llm_use_tools:
         # LLM with Tool Usage
         llm_model = LLM(config)
         llm = ToolLLM(config, llm_model, config["llm_tools"])
     else:
         # Basic LLM
-        llm = LLM(config)
+        llm_model = LLM(config)
+        llm = llm_model
+
+    # Initialize conversation memory (summarizing with a plain LLM)
+    memory = None
+    if use_memory and not llm_skip:
+        summarizer = LLM(config) if llm_barge_in else llm_model
+        memory = ConversationMemory(config, summarizer)
+
+    # Initialize local intent router (answers simple prompts without the LLM)
+    router = None
+    if use_router and not llm_skip:
+        router = Router(config)
 
     # Run pipeline
     logger.info("Running Assistant Pipeline")
+    barged_in = False
     while True:
-        # Detect wakeword
-        wakeword_detected = wakeword.detect()
+        # Detect wakeword (unless it interrupted the previous response)
+        if not barged_in:
+            wakeword_detected = wakeword.detect()
 
-        # Handle wakeword detection
-        if not wakeword_detected:
-            logger.info("Wakeword detection exited, shutting down.")
-            break
+            # Handle wakeword detection
+            if not wakeword_detected:
+                logger.info("Wakeword detection exited, shutting down.")
+                break
+        barged_in = False
 
         # Play wakeword chime
         if os.path.exists(config["wakeword_sound"]):
@@ -77,14 +107,35 @@ def run_pipeline(config_path, log_level):
             time.sleep(0.25)
             continue
 
-        # Process prompt
-        if llm_skip:
+        # Process prompt & speak response
+        history = memory.get_history() if memory is not None else None
+        response = router.route(prompt) if router is not None else None
+        if response is not None:
+            # Answered locally
+            tts.speak(response)
+        elif llm_skip:
             response = prompt
+            tts.speak(response)
+        elif llm_barge_in:
+            # Generate in the background, while listening for the wakeword
+            future = runner.submit(llm(prompt, history=history))
+            barged_in = wakeword.detect(verbose=False, stop=future.done)
+            if barged_in:
+                logger.info("Wakeword detected during generation, cancelling")
+                runner.cancel(future)
+                continue
+            response = future.result()
+            tts.speak(response)
+        elif tts_stream:
+            # Synthesize & play sentences while the response is being generated
+            response = tts.speak_stream(llm.stream(prompt, history=history))
         else:
-            response = llm(prompt)
+            response = llm(prompt, history=history)
+            tts.speak(response)
 
-        # Speak response
-        tts.speak(response)
+        # Remember conversation turn
+        if memory is not None:
+            memory.add(prompt, response)
 
         # Play TTS done chime
         logger.debug("Sleeping...")
@@ -0,0 +1,241 @@
+import re
+import ast
+import math
+import time
+import operator
+
+# Spoken numbers
+UNITS = {
+    word: value
+    for value, word in enumerate(
+        "zero one two three four five six seven eight nine ten eleven twelve thirteen "
+        "fourteen fifteen sixteen seventeen eighteen nineteen".split()
+    )
+}
+TENS = {
+    word: 10 * value
+    for value, word in enumerate(
+        "twenty thirty forty fifty sixty seventy eighty ninety".split(), start=2
+    )
+}
+SCALES = {"hundred": 100, "thousand": 10**3, "million": 10**6, "billion": 10**9}
+
+# Spoken operators (phrases are rewritten first)
+SPOKEN_PHRASES = [
+    ("multiplied by", " * "),
+    ("divided by", " / "),
+    ("to the power of", " ** "),
+    ("raised to", " ** "),
+    ("squared", " ** 2 "),
+    ("cubed", " ** 3 "),
+    ("open parenthesis", " ( "),
+    ("close parenthesis", " ) "),
+]
+SPOKEN_WORDS = {
+    "plus": "+",
+    "minus": "-",
+    "times": "*",
+    "x": "*",
+    "over": "/",
+    "modulo": "%",
+    "mod": "%",
+}
+
+# Operators allowed in expressions
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+
+class ExpressionError(ValueError):
+    """
+    ExpressionError is raised when an expression is invalid or exceeds the evaluation limits
+    ---
+    """
+
+
+def parse_spoken_expression(text):
+    """
+    Convert an arithmetic expression with spoken numbers and operators to symbols
+    ---
+    Args:
+    - text: Expression (e.g. "fifty seven times three hundred and twenty one", "(2 + 3) squared")
+
+    Returns:
+    - expression: Expression with digits and operators (e.g. "57 * 321")
+    """
+
+    text = text.lower().replace(",", "").replace("^", " ** ")
+    text = re.sub(r"[=?!]+\s*$", "", text)
+    for phrase, replacement in SPOKEN_PHRASES:
+        text = text.replace(phrase, replacement)
+    words = re.findall(r"\d+(?:\.\d+)?|[a-z]+|\*\*|//|[+\-*/%()]|\S", text)
+
+    terms = []
+    total, current, decimals, spoken = 0, 0, None, False
+    for word in words:
+        if word in UNITS and decimals is not None:
+            if UNITS[word] > 9:
+                raise ExpressionError(f"Invalid decimal digit: {word}")
+            decimals += f"{UNITS[word]}"
+        elif word in UNITS or word in TENS:
+            current += UNITS.get(word, TENS.get(word))
+            spoken = True
+        elif word in SCALES and spoken:
+            current = max(current, 1) * SCALES[word]
+            if SCALES[word] > 100:
+                total, current = total + current, 0
+        elif word in SCALES and len(terms) and re.match(r"^\d", terms[-1]):
+            # Digits followed by a scale (e.g. "2.5 million")
+            value = float(terms[-1]) * SCALES[word]
+            terms[-1] = f"{int(value)}" if value.is_integer() else f"{value}"
+        elif word == "point" and spoken and decimals is None:
+            decimals = ""
+        elif word == "and" and spoken:
+            continue
+        else:
+            # Flush the spoken number before any other term
+            if spoken:
+                terms.append(f"{total + current}" + (f".{decimals}" if decimals else ""))
+                total, current, decimals, spoken = 0, 0, None, False
+            if re.match(r"^\d", word) or word in ("**", "//", "(", ")") or word in "+-*/%":
+                terms.append(word)
+            elif word in SPOKEN_WORDS:
+                terms.append(SPOKEN_WORDS[word])
+            else:
+                raise ExpressionError(f"Unknown term: {word}")
+    if spoken:
+        terms.append(f"{total + current}" + (f".{decimals}" if decimals else ""))
+
+    return " ".join(terms)
+
+
+class Evaluator:
+    """
+    Evaluator computes arithmetic expressions safely, from their syntax tree
+    ---
+    NOTE: Only numbers, parentheses and whitelisted operators are allowed. Multiplications and powers are checked
+    before they are computed, so no operation can produce a result over max_digits (or take unbounded time).
+    """
+
+    def __init__(self, max_digits=100, timeout=0.1, max_length=1000):
+        """
+        Initialize the evaluator
+        ---
+        Args:
+        - max_digits (default = 100): Maximum number of digits of integer results (including intermediate ones)
+        - timeout (default = 0.1): Maximum evaluation time in seconds
+        - max_length (default = 1000): Maximum length of an expression
+        """
+
+        self.max_bits = math.ceil(max_digits * math.log2(10))
+        self.max_digits = max_digits
+        self.timeout = timeout
+        self.max_length = max_length
+
+    def __call__(self, expression):
+        """
+        Evaluate an expression
+        ---
+        Args:
+        - expression: Arithmetic expression (e.g. "(57 * 321 - 4) ** 2")
+
+        Returns:
+        - value: Value of the expression (int or float)
+        """
+
+        if len(expression) > self.max_length:
+            raise ExpressionError(f"Expression is longer than {self.max_length} characters")
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except (SyntaxError, RecursionError, MemoryError):
+            raise ExpressionError(f"Invalid expression: {expression}")
+
+        deadline = time.monotonic() + self.timeout
+        try:
+            return self._evaluate(tree.body, deadline)
+        except ZeroDivisionError:
+            raise ExpressionError("Division by zero")
+        except (OverflowError, RecursionError):
+            raise ExpressionError("Result is too large")
+
+    def _evaluate(self, node, deadline):
+        if time.monotonic() > deadline:
+            raise ExpressionError("Evaluation took too long")
+
+        # Numbers
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise ExpressionError(f"Invalid number: {node.value!r}")
+            return self._check(node.value)
+
+        # Signs
+        if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+            return UNARY_OPERATORS[type(node.op)](self._evaluate(node.operand, deadline))
+
+        # Arithmetic
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+            left = self._evaluate(node.left, deadline)
+            right = self._evaluate(node.right, deadline)
+            if isinstance(node.op, ast.Mult):
+                self._check_bits(self._bits(left) + self._bits(right))
+            elif isinstance(node.op, ast.Pow):
+                self._check_power(left, right)
+            return self._check(BINARY_OPERATORS[type(node.op)](left, right))
+
+        raise ExpressionError(f"Unsupported expression: {ast.unparse(node)}")
+
+    @staticmethod
+    def _bits(value):
+        # Bits of an integer (floats have a fixed size)
+        return abs(value).bit_length() if isinstance(value, int) else 0
+
+    def _check_bits(self, bits):
+        if bits > self.max_bits:
+            raise ExpressionError(f"Result has more than {self.max_digits} digits")
+
+    def _check_power(self, base, exponent):
+        # Estimate the size of the result before computing it
+        if isinstance(base, int) and isinstance(exponent, int) and abs(base) > 1 and exponent > 0:
+            self._check_bits(math.ceil(exponent * math.log2(abs(base))))
+        elif isinstance(base, float) and abs(base) > 1:
+            if abs(exponent) * math.log10(abs(base)) > 308:
+                raise ExpressionError("Result is too large")
+        if base < 0 and isinstance(exponent, float) and not exponent.is_integer():
+            raise ExpressionError("Fractional power of a negative number")
+
+    def _check(self, value):
+        if isinstance(value, int):
+            self._check_bits(self._bits(value))
+        elif not math.isfinite(value):
+            raise ExpressionError("Result is too large")
+        return value
+
+
+def format_number(value):
+    """
+    Format the value of an expression
+    ---
+    Args:
+    - value: Integer or float
+
+    Returns:
+    - text: Integer digits (also for exactly integral floats), or the float rounded to 15 significant digits
+      (e.g. 0.1 + 0.2 -> "0.3")
+    """
+
+    if isinstance(value, int):
+        return f"{value}"
+    if value.is_integer() and abs(value) < 2**53:
+        return f"{int(value)}"
+    return f"{value:.15g}"
@@ -0,0 +1,456 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import openai
+import httpx
+import aiohttp
+from dotenv import load_dotenv
+from .utils import get_logger
+from .llm import LLM, LLMModel
+from .cache import get_cache
+from .metrics import get_metrics
+from .session import get_session
+from .endpoints import EndpointPool
+from .toolllm import ToolLLM
+from .tools import ToolContext, tool_context
+from .jsonstream import JSONStreamParser
+from .compaction import LoopContext
+
+
+class AsyncLLM:
+    """
+    AsyncLLM implements the LLM interface with asyncio, so in-flight generation can be cancelled
+    ---
+    NOTE: Responses are cached and call metrics recorded like in LLM. Identical calls are not coalesced,
+    since each of them can be cancelled on its own.
+    """
+
+    # Cache keys and call metrics are shared with LLM
+    _get_cache_key = LLM._get_cache_key
+    _record_call_metrics = LLM._record_call_metrics
+
+    def __init__(self, config):
+        """
+        Initialize the LLM
+        ---
+        Args:
+        - config: Configuration dictionary
+        """
+
+        # Logger
+        self.logger = get_logger()
+        self.logger.debug("Configuring async LLM")
+
+        # Config
+        self.provider = config.get("llm_provider")
+
+        # Initialize model
+        self.model = async_providers[self.provider]["class"](config)
+
+        # Initialize response cache
+        self.cache = get_cache(config, "llm")
+
+    def warmup(self, system_prompt=None):
+        """
+        Prepare the LLM for prompts with the given system prompt
+        ---
+        Args:
+        - system_prompt: System prompt to prepare for
+        """
+
+        self.model.warmup(system_prompt=system_prompt)
+
+    async def __call__(
+        self, prompt, system_prompt=None, history=None, use_cache=True, tags=None
+    ):
+        """
+        Prompt the LLM
+        ---
+        NOTE: Cancelling the awaiting task aborts the request and closes its connection
+
+        Args:
+        - prompt: Prompt to send to the LLM
+        - system_prompt: System prompt to send to the LLM
+        - history: Previous chat messages to send before the prompt
+        - use_cache (default = True): Whether to use the response cache (if enabled)
+        - tags: Dictionary of extra metric tags (e.g. ToolLLM iteration)
+
+        Returns:
+        - response: Response from the LLM
+        """
+
+        response = ""
+        async for chunk in self.stream(prompt, system_prompt, history, use_cache, tags):
+            response += chunk
+        return response
+
+    async def stream(
+        self, prompt, system_prompt=None, history=None, use_cache=True, tags=None
+    ):
+        """
+        Prompt the LLM and stream the response as it is generated
+        ---
+        Args:
+        - prompt: Prompt to send to the LLM
+        - system_prompt: System prompt to send to the LLM
+        - history: Previous chat messages to send before the prompt
+        - use_cache (default = True): Whether to use the response cache (if enabled)
+        - tags: Dictionary of extra metric tags (e.g. ToolLLM iteration)
+
+        Returns:
+        - chunks: Async generator of response text chunks
+        """
+
+        self.logger.info(f"Prompting LLM (async)")
+        self.logger.info(f"Prompt:\n{prompt}")
+        if system_prompt is not None:
+            self.logger.debug(f"System prompt: {system_prompt}")
+        tags = {"provider": self.provider, "model": self.model.model_name, **(tags or {})}
+        metrics = get_metrics()
+
+        # Look up cached response
+        use_cache = use_cache and self.cache is not None
+        if use_cache:
+            cache_key = self._get_cache_key(prompt, system_prompt, history)
+            response = self.cache.get(cache_key)
+            if response is not None:
+                self.logger.info(f"LLM response (cached):\n{response}")
+                metrics.increment("llm_cache_hits", tags=tags)
+                yield response
+                return
+
+        # Generate response
+        self.model._start_call()
+        start_time = time.time()
+        first_token_time = None
+        response = ""
+        messages = self.model._get_messages(prompt, system_prompt, history)
+        chunks = self.model.stream(prompt, system_prompt=system_prompt, history=history)
+        try:
+            async for chunk in chunks:
+                if first_token_time is None:
+                    first_token_time = time.time()
+                response += chunk
+                yield chunk
+        except asyncio.CancelledError:
+            self.logger.info("LLM call cancelled")
+            metrics.increment("llm_cancelled", tags=tags)
+            raise
+        except GeneratorExit:
+            # Consumer stopped early (e.g. tool call complete): don't cache
+            self.logger.info(f"LLM response (stopped early):\n{response}")
+            metrics.increment("llm_early_stops", tags=tags)
+            self._record_call_metrics(
+                messages, response, start_time, first_token_time, time.time(), tags
+            )
+            raise
+        finally:
+            await chunks.aclose()
+        self.logger.info(f"LLM response:\n{response}")
+
+        # Record call metrics & cache complete response
+        self._record_call_metrics(
+            messages, response, start_time, first_token_time, time.time(), tags
+        )
+        if use_cache:
+            self.cache.set(cache_key, response)
+
+
+class AsyncOpenAIModel(LLMModel):
+    """
+    AsyncOpenAIModel interfaces with OpenAI's large language model using the async client
+    ---
+    NOTE: It requires an OpenAI API key to be set in the environment
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+
+        # Load OpenAI API key
+        load_dotenv()
+        self.client = openai.AsyncClient(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=self.base_url,
+            timeout=httpx.Timeout(
+                config.get("llm_read_timeout", 120),
+                connect=config.get("llm_connect_timeout", 5),
+            ),
+            max_retries=config.get("llm_max_retries", 2),
+        )
+
+    async def __call__(self, prompt, system_prompt=None, history=None):
+        response_text = ""
+        async for chunk in self.stream(prompt, system_prompt, history):
+            response_text += chunk
+        return response_text
+
+    async def stream(self, prompt, system_prompt=None, history=None):
+        # Construct messages
+        messages = self._get_messages(prompt, system_prompt, history)
+
+        # Call API
+        self.logger.debug("Calling OpenAI API (async)")
+        self._mark_sent()
+        chat = await self.client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        # Yield response deltas, closing the connection when done or cancelled
+        try:
+            async for chunk in chat:
+                if chunk.usage is not None:
+                    self._set_usage(chunk.usage.model_dump())
+                if not len(chunk.choices):
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            await chat.close()
+
+
+class AsyncLlamaEdgeModel(LLMModel):
+    """
+    AsyncLlamaEdgeModel interfaces with LlamaEdge's large language model using aiohttp
+    ---
+    NOTE: It requires a LlamaEdge instance running on the configured IP address.
+    When multiple urls are configured, requests are balanced over the instances (without hedging).
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        # Default base url for LLamaEdge
+        if self.base_url is None:
+            self.base_url = "http://localhost:8080/v1"
+
+        # Endpoint pool (health checks use the shared keep-alive session)
+        urls = self.base_url if isinstance(self.base_url, list) else [self.base_url]
+        self.pool = EndpointPool(urls, get_session(config, "llm"), config)
+
+        # Timeouts
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=config.get("llm_connect_timeout", 5),
+            sock_read=config.get("llm_read_timeout", 120),
+        )
+        self.session = None
+
+    def _get_session(self):
+        # Sessions are bound to the running event loop, so create them lazily
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=self.timeout)
+        return self.session
+
+    async def __call__(self, prompt, system_prompt=None, history=None):
+        response_text = ""
+        async for chunk in self.stream(prompt, system_prompt, history):
+            response_text += chunk
+        return response_text
+
+    async def stream(self, prompt, system_prompt=None, history=None):
+        # Construct messages
+        messages = self._get_messages(prompt, system_prompt, history)
+
+        payload = {
+            "messages": messages,
+            "model": self.model_name,
+            "stream": True,
+        }
+
+        # Try endpoints until one responds
+        # NOTE: Selection may health check endpoints (blocking), so it runs in a thread
+        tried = []
+        while True:
+            endpoint = await asyncio.to_thread(self.pool.select, tried)
+            if endpoint is None:
+                raise Exception("Error calling API: no endpoint available")
+            tried.append(endpoint)
+            self.logger.debug(f"Calling Llama Edge API ({endpoint.url}, async)")
+            self._mark_sent()
+            start_time = time.time()
+            try:
+                response = await self._get_session().post(
+                    f"{endpoint.url}/chat/completions", json=payload
+                )
+                if response.status != 200:
+                    text = await response.text()
+                    response.release()
+                    raise Exception(f"Error calling API: {text}")
+                break
+            except asyncio.CancelledError:
+                self.pool.release(endpoint)
+                raise
+            except Exception as err:
+                self.logger.warning(f"{endpoint.url}: {err}")
+                self.pool.release(endpoint, error=True)
+
+        first_token_latency = None
+        total_latency = None
+        error = False
+        try:
+            # Parse server-sent events
+            async for line in response.content:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                data = json.loads(data)
+                if data.get("usage"):
+                    self._set_usage(data["usage"])
+                choices = data.get("choices", [])
+                if not len(choices):
+                    continue
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    if first_token_latency is None:
+                        first_token_latency = time.time() - start_time
+                    yield delta
+            total_latency = time.time() - start_time
+            response.release()
+        except BaseException as err:
+            # Close the socket (rather than returning it to the pool), so the server stops generating
+            error = isinstance(err, Exception)
+            response.close()
+            raise
+        finally:
+            self.pool.release(endpoint, first_token_latency, total_latency, error)
+
+
+class AsyncToolLLM(ToolLLM):
+    """
+    AsyncToolLLM runs the ToolLLM loop with an AsyncLLM, so the loop can be cancelled between and during calls
+    ---
+    NOTE: Tools are always described in the prompt (native function calling is not supported)
+    """
+
+    def __init__(self, config, llm, tool_selection=None):
+        super().__init__({**config, "llm_tool_mode": "prompt"}, llm, tool_selection)
+
+    async def _generate_tool_call(self, prompt, history, tags=None):
+        # Stop generation once the JSON tool call is complete
+        parser = JSONStreamParser()
+        chunks = self.llm.stream(
+            prompt, system_prompt=self.system_prompt, history=history, tags=tags
+        )
+        try:
+            async for chunk in chunks:
+                if parser.feed(chunk):
+                    break
+        finally:
+            await chunks.aclose()
+        return parser.text
+
+    async def __call__(
+        self, prompt: str, max_iterations: int = 5, history: list = None
+    ) -> str:
+        # Keep track of response, message history & tools called
+        conversation = list(history or [])
+        response = ""
+        context = LoopContext(conversation, self.context_max_tokens, self.system_tokens)
+        initial_prompt = prompt
+        full_prompt = prompt
+        tools_called = []
+
+        # Tool calls of the request share its latency budget
+        request_context = self._get_request_context()
+
+        # Prompt the LLM until we have a final response
+        for iteration in range(max_iterations):
+            # Prompt LLM
+            history, prompt = context.build(prompt, full_prompt)
+            result = await self._generate_tool_call(
+                prompt, history, tags={"iteration": iteration}
+            )
+            context.add(result)
+
+            # Parse LLM response & run tool (off the event loop, stopping the tool when cancelled)
+            cancel = threading.Event()
+            token = tool_context.set(ToolContext(cancel=cancel, parent=request_context))
+            try:
+                response, prompt, full_prompt = await asyncio.to_thread(
+                    self._step, result, tools_called
+                )
+            except asyncio.CancelledError:
+                cancel.set()
+                raise
+            finally:
+                tool_context.reset(token)
+            if response is not None:
+                break
+        else:
+            # Loop did not break - warning
+            self.logger.warning(
+                f"Max iterations ({max_iterations}) reached. Falling back to pure LLM."
+            )
+            # Return pure LLM response to initial prompt
+            return await self.llm(
+                initial_prompt, history=conversation, tags={"iteration": "fallback"}
+            )
+
+        return response
+
+    async def stream(self, prompt: str, max_iterations: int = 5, history: list = None):
+        yield await self(prompt, max_iterations=max_iterations, history=history)
+
+
+class AsyncRunner:
+    """
+    AsyncRunner runs coroutines on an event loop in a background thread, so they can be cancelled from the pipeline thread
+    ---
+    """
+
+    def __init__(self):
+        self.logger = get_logger()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def submit(self, coroutine):
+        """
+        Schedule a coroutine on the background event loop
+        ---
+        Args:
+        - coroutine: Coroutine to run
+
+        Returns:
+        - future: concurrent.futures.Future of the coroutine result
+        """
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def cancel(self, future):
+        """
+        Cancel a submitted coroutine
+        ---
+        Args:
+        - future: Future returned by submit()
+        """
+
+        if not future.done():
+            self.logger.info("Cancelling LLM request")
+            future.cancel()
+
+    def close(self):
+        """
+        Stop the background event loop
+        ---
+        """
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+async_providers = {
+    "openai": {
+        "class": AsyncOpenAIModel,
+    },
+    "llama-edge": {
+        "class": AsyncLlamaEdgeModel,
+    },
+}
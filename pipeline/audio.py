@@ -26,3 +26,69 @@ def play_wave_file(file_path, chunk=1024):
     stream.close()
     audio.terminate()
     wave_file.close()
+
+
+class WavePlayer:
+    """
+    WavePlayer plays consecutive wave files over a single output stream
+    ---
+    NOTE: Keeping the stream open between files avoids gaps in playback
+    """
+
+    def __init__(self, chunk=1024):
+        """
+        Initialize the player
+        ---
+        Args:
+        - chunk (default = 1024): Chunk size for reading the files
+        """
+
+        self.chunk = chunk
+        self.audio = pyaudio.PyAudio()
+        self.stream = None
+        self.stream_format = None
+
+    def play(self, file_path):
+        """
+        Play a wave file, reusing the output stream if the audio format matches
+        ---
+        Args:
+        - file_path: Path to the wav file
+        """
+
+        wave_file = wave.open(file_path, "rb")
+        stream_format = (
+            wave_file.getsampwidth(),
+            wave_file.getnchannels(),
+            wave_file.getframerate(),
+        )
+
+        # (Re)open stream on format change
+        if self.stream is None or stream_format != self.stream_format:
+            if self.stream is not None:
+                self.stream.close()
+            self.stream = self.audio.open(
+                format=self.audio.get_format_from_width(stream_format[0]),
+                channels=stream_format[1],
+                rate=stream_format[2],
+                output=True,
+            )
+            self.stream_format = stream_format
+
+        # Write audio to stream
+        data = wave_file.readframes(self.chunk)
+        while data:
+            self.stream.write(data)
+            data = wave_file.readframes(self.chunk)
+        wave_file.close()
+
+    def close(self):
+        """
+        Close the output stream
+        ---
+        """
+
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self.audio.terminate()
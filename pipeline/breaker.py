@@ -0,0 +1,124 @@
+import time
+import threading
+from .utils import get_logger
+from .metrics import get_metrics
+
+
+class CircuitBreaker:
+    """
+    CircuitBreaker fails fast on an upstream that keeps failing
+    ---
+    NOTE: After failure_threshold consecutive failures the breaker opens and requests are refused.
+    Once reset_timeout seconds have passed, a single trial request is let through (half-open):
+    success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30):
+        """
+        Initialize the breaker
+        ---
+        Args:
+        - name: Name of the upstream, used in logs and metric tags
+        - failure_threshold (default = 3): Number of consecutive failures opening the breaker
+        - reset_timeout (default = 30): Seconds before a trial request is let through an open breaker
+        """
+
+        self.logger = get_logger()
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self):
+        """
+        State of the breaker: "closed", "open" or "half-open"
+        ---
+        """
+
+        if self.opened_at is None:
+            return "closed"
+        if self.probing or time.time() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """
+        Check if a request may be sent to the upstream
+        ---
+        Returns:
+        - allowed: Whether the request may be sent
+        """
+
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.probing and time.time() - self.opened_at >= self.reset_timeout:
+                self.probing = True
+                return True
+        get_metrics().increment("breaker_rejected", tags={"upstream": self.name})
+        return False
+
+    def release(self):
+        """
+        Release a request without recording its outcome (e.g. it was abandoned by the caller)
+        ---
+        NOTE: A trial request of a half-open breaker is released, so the next request may be let through
+        """
+
+        with self.lock:
+            self.probing = False
+
+    def record(self, success):
+        """
+        Record the outcome of a request
+        ---
+        Args:
+        - success: Whether the upstream handled the request
+        """
+
+        with self.lock:
+            if success:
+                if self.opened_at is not None:
+                    self.logger.info(f"Circuit breaker for {self.name} closed")
+                self.failures = 0
+                self.opened_at = None
+                self.probing = False
+                return
+            self.failures += 1
+            self.probing = False
+            if self.opened_at is None and self.failures < self.failure_threshold:
+                return
+            if self.opened_at is None:
+                self.logger.warning(
+                    f"Circuit breaker for {self.name} opened after {self.failures} failures"
+                )
+                get_metrics().increment("breaker_opened", tags={"upstream": self.name})
+            self.opened_at = time.time()
+
+
+# Shared breakers by upstream name
+breakers = {}
+breakers_lock = threading.Lock()
+
+
+def get_breaker(name, failure_threshold=3, reset_timeout=30):
+    """
+    Get the shared circuit breaker of an upstream
+    ---
+    Args:
+    - name: Name of the upstream (e.g. host name)
+    - failure_threshold (default = 3): Number of consecutive failures opening the breaker (used on creation)
+    - reset_timeout (default = 30): Seconds before a trial request is let through (used on creation)
+
+    Returns:
+    - breaker: Shared CircuitBreaker instance
+    """
+
+    with breakers_lock:
+        if name not in breakers:
+            breakers[name] = CircuitBreaker(name, failure_threshold, reset_timeout)
+        return breakers[name]
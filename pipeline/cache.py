@@ -0,0 +1,346 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from .utils import get_logger
+
+
+class LRUCache:
+    """
+    LRUCache implements an in-memory least-recently-used cache with per-entry expiry
+    ---
+    """
+
+    def __init__(self, max_size=256, ttl=None):
+        """
+        Initialize the cache
+        ---
+        Args:
+        - max_size (default = 256): Maximum number of entries
+        - ttl (default = None): Default time-to-live of entries in seconds (None = no expiry)
+        """
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Get an entry from the cache
+        ---
+        Args:
+        - key: Key of the entry
+        - default (default = None): Value returned on a miss
+
+        Returns:
+        - value: Cached value, or default if missing or expired
+        """
+
+        with self.lock:
+            if key not in self.entries:
+                return default
+            value, expires = self.entries[key]
+            if expires is not None and expires < time.time():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Add an entry to the cache, evicting the least recently used entries if full
+        ---
+        Args:
+        - key: Key of the entry
+        - value: Value of the entry
+        - ttl (default = None): Time-to-live in seconds, defaults to the cache ttl
+        """
+
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.time() + ttl
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all entries from the cache
+        ---
+        """
+
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SQLiteCache:
+    """
+    SQLiteCache implements an on-disk cache that survives restarts
+    ---
+    """
+
+    def __init__(self, path, max_size=10000, ttl=None):
+        """
+        Initialize the cache
+        ---
+        Args:
+        - path: Path to the SQLite database file
+        - max_size (default = 10000): Maximum number of entries
+        - ttl (default = None): Default time-to-live of entries in seconds (None = no expiry)
+        """
+
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        # Open database
+        directory = os.path.dirname(path)
+        if len(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)"
+        )
+        self.db.commit()
+
+    def get(self, key, default=None):
+        """
+        Get an entry from the cache
+        ---
+        Args:
+        - key: Key of the entry
+        - default (default = None): Value returned on a miss
+
+        Returns:
+        - value: Cached value, or default if missing or expired
+        """
+
+        return self.get_with_expiry(key, default)[0]
+
+    def get_with_expiry(self, key, default=None):
+        """
+        Get an entry from the cache with its expiry time
+        ---
+        Args:
+        - key: Key of the entry
+        - default (default = None): Value returned on a miss
+
+        Returns:
+        - value: Cached value, or default if missing or expired
+        - expires: Time (time.time()) the entry expires (None = no expiry or a miss)
+        """
+
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return default, None
+            value, expires = row
+            if expires is not None and expires < now:
+                self.db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.db.commit()
+                return default, None
+            self.db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self.db.commit()
+        return json.loads(value), expires
+
+    def set(self, key, value, ttl=None):
+        """
+        Add an entry to the cache, evicting expired and least recently used entries if full
+        ---
+        Args:
+        - key: Key of the entry
+        - value: JSON-serializable value of the entry
+        - ttl (default = None): Time-to-live in seconds, defaults to the cache ttl
+        """
+
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else now + ttl
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires, now),
+            )
+            # Evict expired entries, then least recently used entries
+            self.db.execute("DELETE FROM cache WHERE expires < ?", (now,))
+            self.db.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+            self.db.commit()
+
+    def clear(self):
+        """
+        Remove all entries from the cache
+        ---
+        """
+
+        with self.lock:
+            self.db.execute("DELETE FROM cache")
+            self.db.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class Cache:
+    """
+    Cache combines an in-memory LRU tier with an optional on-disk SQLite tier and keeps hit/miss statistics
+    ---
+    """
+
+    def __init__(self, memory_size=256, disk_path=None, disk_size=10000, ttl=None):
+        """
+        Initialize the cache
+        ---
+        Args:
+        - memory_size (default = 256): Maximum number of entries in memory
+        - disk_path (default = None): Path to the SQLite database (None = memory only)
+        - disk_size (default = 10000): Maximum number of entries on disk
+        - ttl (default = None): Default time-to-live of entries in seconds (None = no expiry)
+        """
+
+        self.logger = get_logger()
+        self.ttl = ttl
+        self.memory = LRUCache(memory_size, ttl)
+        self.disk = None
+        if disk_path is not None:
+            self.disk = SQLiteCache(disk_path, disk_size, ttl)
+        self.lock = threading.Lock()
+        self.counts = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(*parts):
+        """
+        Build a cache key from its parts
+        ---
+        Args:
+        - *parts: JSON-serializable key parts
+
+        Returns:
+        - key: Hex digest of the key parts
+        """
+
+        data = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _count(self, label):
+        with self.lock:
+            self.counts[label] += 1
+
+    def get(self, key, default=None):
+        """
+        Get an entry from the cache, promoting disk hits to memory
+        ---
+        Args:
+        - key: Key of the entry
+        - default (default = None): Value returned on a miss
+
+        Returns:
+        - value: Cached value, or default on a miss
+        """
+
+        missing = object()
+
+        # Memory tier
+        value = self.memory.get(key, missing)
+        if value is not missing:
+            self._count("memory_hits")
+            return value
+
+        # Disk tier (promoted entries keep their own expiry)
+        if self.disk is not None:
+            value, expires = self.disk.get_with_expiry(key, missing)
+            if value is not missing:
+                self._count("disk_hits")
+                if expires is None:
+                    self.memory.set(key, value)
+                elif expires > time.time():
+                    self.memory.set(key, value, expires - time.time())
+                return value
+
+        self._count("misses")
+        return default
+
+    def set(self, key, value, ttl=None):
+        """
+        Add an entry to all cache tiers
+        ---
+        Args:
+        - key: Key of the entry
+        - value: JSON-serializable value of the entry
+        - ttl (default = None): Time-to-live in seconds, defaults to the cache ttl
+        """
+
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl)
+
+    def clear(self):
+        """
+        Remove all entries from all cache tiers
+        ---
+        """
+
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        """
+        Hit/miss statistics of the cache
+        ---
+        Returns:
+        - stats: Dictionary with hit and miss counts and the hit rate
+        """
+
+        with self.lock:
+            stats = dict(self.counts)
+        stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        stats["memory_entries"] = len(self.memory)
+        return stats
+
+
+def get_cache(config, prefix):
+    """
+    Build a cache from configuration, if enabled
+    ---
+    Args:
+    - config: Configuration dictionary
+        - {prefix}_cache: Whether to enable the cache.
+        - {prefix}_cache_size: Maximum number of entries in memory.
+        - {prefix}_cache_path: Path to the on-disk cache (null = memory only).
+        - {prefix}_cache_disk_size: Maximum number of entries on disk.
+        - {prefix}_cache_ttl: Time-to-live of entries in seconds (null = no expiry).
+    - prefix: Prefix of the configuration keys
+
+    Returns:
+    - cache: Cache instance, or None if the cache is disabled
+    """
+
+    if not config.get(f"{prefix}_cache", False):
+        return None
+    return Cache(
+        memory_size=config.get(f"{prefix}_cache_size", 256),
+        disk_path=config.get(f"{prefix}_cache_path"),
+        disk_size=config.get(f"{prefix}_cache_disk_size", 10000),
+        ttl=config.get(f"{prefix}_cache_ttl"),
+    )
@@ -0,0 +1,187 @@
+import json
+from .utils import get_logger, count_tokens, truncate_text
+from .metrics import get_metrics
+
+
+class LoopContext:
+    """
+    LoopContext keeps the messages of one ToolLLM tool loop, compacted to fit a token budget
+    ---
+    NOTE: Every iteration re-sends the whole loop, so each message saved is saved on all later calls.
+    Repeated prompts (e.g. the same warning) only keep their latest exchange. Over budget, the oldest
+    exchanges are dropped, except for the first (the user prompt) and the last (the latest tool call).
+    """
+
+    def __init__(self, conversation, max_tokens=None, reserved_tokens=0):
+        """
+        Initialize the loop context
+        ---
+        Args:
+        - conversation: Previous chat messages of the conversation
+        - max_tokens (default = None): Token budget of the messages sent to the LLM (None = no budget)
+        - reserved_tokens (default = 0): Tokens of the budget taken by the system prompt
+        """
+
+        self.logger = get_logger()
+        self.conversation = [
+            {**message, "tokens": count_tokens(message["content"])}
+            for message in conversation
+        ]
+        self.max_tokens = max_tokens
+        self.reserved_tokens = reserved_tokens
+
+        # Exchanges of the loop: prompt sent, LLM result and their token counts
+        self.exchanges = []
+        self.pending = None
+
+        # Tokens of the messages that would have been sent without compaction
+        self.full_tokens = reserved_tokens + sum(m["tokens"] for m in self.conversation)
+
+    def build(self, prompt, full_prompt=None):
+        """
+        Build the history to send with the next prompt, within the token budget
+        ---
+        Args:
+        - prompt: Next prompt
+        - full_prompt (default = None): Next prompt before compaction (None = not compacted)
+
+        Returns:
+        - history: Chat messages to send before the prompt
+        - prompt: Prompt to send (marked when it repeats earlier prompts, truncated if over budget)
+        """
+
+        # Keep only the latest exchange of a repeated prompt
+        repeated = [e for e in self.exchanges[1:] if e["key"] == prompt]
+        repeats = 1 + sum(e["repeats"] for e in repeated)
+        self.pending = {"key": prompt, "repeats": repeats, "full_prompt": full_prompt or prompt}
+        if len(repeated):
+            self.exchanges = [e for e in self.exchanges if e not in repeated]
+            prompt = f"{prompt} (repeated {repeats} times)"
+            self.logger.debug(f"Collapsed {len(repeated)} repeated prompts")
+
+        # Drop the oldest exchanges, then the oldest conversation turns, until within budget
+        prompt_tokens = count_tokens(prompt)
+        if self.max_tokens is not None:
+            while self._count_tokens() + prompt_tokens > self.max_tokens:
+                if len(self.exchanges) > 2:
+                    self.exchanges.pop(1)
+                elif len(self.conversation):
+                    self.conversation = self.conversation[2:]
+                else:
+                    break
+            remaining = self.max_tokens - self._count_tokens()
+            if prompt_tokens > remaining:
+                prompt = truncate_text(prompt, max(remaining, 0) * 4)
+                prompt_tokens = count_tokens(prompt)
+        self.pending["prompt"] = prompt
+
+        # Report tokens saved by compaction on this call
+        saved = self.full_tokens + count_tokens(self.pending["full_prompt"])
+        saved -= self._count_tokens() + prompt_tokens
+        if saved > 0:
+            self.logger.debug(f"Context compaction saved {saved} prompt tokens")
+            get_metrics().increment("llm_prompt_tokens_saved", saved)
+
+        history = [
+            {"role": m["role"], "content": m["content"]} for m in self.conversation
+        ]
+        for exchange in self.exchanges:
+            history += [
+                {"role": "user", "content": exchange["prompt"]},
+                {"role": "assistant", "content": exchange["result"]},
+            ]
+        return history, prompt
+
+    def add(self, result):
+        """
+        Add the LLM result to the prompt of the last built history
+        ---
+        Args:
+        - result: LLM response text
+        """
+
+        exchange = {**self.pending, "result": result}
+        exchange["tokens"] = count_tokens(exchange["prompt"]) + count_tokens(result)
+        self.exchanges.append(exchange)
+        self.full_tokens += count_tokens(exchange["full_prompt"]) + count_tokens(result)
+
+    def _count_tokens(self):
+        # Tokens of the system prompt, conversation and loop exchanges
+        return (
+            self.reserved_tokens
+            + sum(m["tokens"] for m in self.conversation)
+            + sum(e["tokens"] for e in self.exchanges)
+        )
+
+
+def count_message_tokens(message):
+    """
+    Estimate the number of tokens of a chat message, including its tool calls
+    ---
+    Args:
+    - message: Chat message
+
+    Returns:
+    - count: Number of tokens
+    """
+
+    tokens = count_tokens(message.get("content") or "")
+    if message.get("tool_calls"):
+        tokens += count_tokens(json.dumps(message["tool_calls"]))
+    return tokens
+
+
+def compact_messages(messages, exchanges, max_tokens=None, reserved_tokens=0):
+    """
+    Compact the messages of a native function calling loop to fit a token budget
+    ---
+    NOTE: As in LoopContext, the oldest exchanges are dropped first, then the oldest conversation turns.
+    The system prompt, user prompt and latest exchange are always kept, the results of the latest exchange
+    are truncated if they are still over budget.
+
+    Args:
+    - messages: System prompt, conversation and user prompt messages
+    - exchanges: Exchanges of the loop, each an assistant message with tool calls followed by its tool messages
+    - max_tokens (default = None): Token budget of the messages sent to the LLM (None = no budget)
+    - reserved_tokens (default = 0): Tokens of the budget taken by the tool schemas
+
+    Returns:
+    - messages: Messages to send to the LLM
+    """
+
+    full = [*messages, *[m for exchange in exchanges for m in exchange]]
+    if max_tokens is None:
+        return full
+    system, conversation, prompt = messages[:1], messages[1:-1], messages[-1:]
+    exchanges = list(exchanges)
+
+    # Drop the oldest exchanges, then the oldest conversation turns, until within budget
+    def count(*groups):
+        return reserved_tokens + sum(
+            count_message_tokens(m) for group in groups for m in group
+        )
+
+    while count(system, conversation, prompt, *exchanges) > max_tokens:
+        if len(exchanges) > 1:
+            exchanges.pop(0)
+        elif len(conversation):
+            conversation = conversation[2:]
+        else:
+            break
+
+    # Truncate the results of the latest exchange
+    if len(exchanges) and count(system, conversation, prompt, *exchanges) > max_tokens:
+        call, results = exchanges[-1][0], exchanges[-1][1:]
+        remaining = max_tokens - count(system, conversation, prompt, [call])
+        max_chars = max(remaining, 0) * 4 // max(len(results), 1)
+        exchanges[-1] = [call] + [
+            {**m, "content": truncate_text(m["content"], max_chars)} for m in results
+        ]
+
+    # Report tokens saved by compaction on this call
+    compacted = [*system, *conversation, *prompt, *[m for e in exchanges for m in e]]
+    saved = count(full) - count(compacted)
+    if saved > 0:
+        get_logger().debug(f"Context compaction saved {saved} prompt tokens")
+        get_metrics().increment("llm_prompt_tokens_saved", saved)
+    return compacted
@@ -0,0 +1,196 @@
+import time
+import threading
+from collections import deque
+from .utils import get_logger
+from .metrics import percentile
+
+
+class Endpoint:
+    """
+    Endpoint keeps track of the load, health and latency of one LLM server
+    ---
+    """
+
+    def __init__(self, url, window=100):
+        """
+        Initialize the endpoint
+        ---
+        Args:
+        - url: Base url of the server
+        - window (default = 100): Number of recent requests to compute latency statistics over
+        """
+
+        self.url = url
+        self.outstanding = 0
+        self.healthy = True
+        self.last_check = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.hedges_won = 0
+        self.first_token_latencies = deque(maxlen=window)
+        self.total_latencies = deque(maxlen=window)
+
+    def stats(self):
+        """
+        Statistics of the endpoint
+        ---
+        Returns:
+        - stats: Dictionary with load, health and latency statistics
+        """
+
+        first_token_latencies = list(self.first_token_latencies)
+        total_latencies = list(self.total_latencies)
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "hedges_won": self.hedges_won,
+            "first_token_p50": percentile(first_token_latencies, 50),
+            "first_token_p95": percentile(first_token_latencies, 95),
+            "total_p50": percentile(total_latencies, 50),
+            "total_p95": percentile(total_latencies, 95),
+        }
+
+
+class EndpointPool:
+    """
+    EndpointPool routes requests over multiple LLM servers
+    ---
+    NOTE: Requests go to the healthy endpoint with the least outstanding requests.
+    Unhealthy endpoints are re-checked after the health check interval.
+    """
+
+    def __init__(self, urls, session, config):
+        """
+        Initialize the pool
+        ---
+        Args:
+        - urls: List of server base urls
+        - session: HTTPSession used for health checks
+        - config: Configuration dictionary
+            - llm_health_check_interval: Seconds between health checks of unhealthy endpoints.
+            - llm_hedge: Whether to send a hedged request to a second endpoint.
+            - llm_hedge_delay: Hedge delay (seconds) until enough latency samples are available.
+            - llm_hedge_percentile: Percentile of the time-to-first-token used as hedge delay.
+        """
+
+        self.logger = get_logger()
+        self.session = session
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.health_check_interval = config.get("llm_health_check_interval", 30)
+        self.hedge = config.get("llm_hedge", False) and len(self.endpoints) > 1
+        self.hedge_delay_default = config.get("llm_hedge_delay", 2.0)
+        self.hedge_percentile = config.get("llm_hedge_percentile", 95)
+        self.lock = threading.Lock()
+
+    def check_health(self, endpoint):
+        """
+        Check whether an endpoint is reachable
+        ---
+        Args:
+        - endpoint: Endpoint to check
+
+        Returns:
+        - healthy: Whether the endpoint responded successfully
+        """
+
+        endpoint.last_check = time.time()
+        try:
+            response = self.session.get(
+                f"{endpoint.url}/models",
+                timeout=(self.session.connect_timeout, self.session.connect_timeout),
+            )
+            endpoint.healthy = response.status_code == 200
+        except Exception as err:
+            self.logger.debug(f"Health check of {endpoint.url} failed: {err}")
+            endpoint.healthy = False
+        return endpoint.healthy
+
+    def select(self, exclude=()):
+        """
+        Select the endpoint for a new request
+        ---
+        Args:
+        - exclude: Endpoints which should not be selected
+
+        Returns:
+        - endpoint: Selected endpoint, or None if no endpoint is left
+        """
+
+        # Re-check unhealthy endpoints
+        now = time.time()
+        for endpoint in self.endpoints:
+            if (
+                not endpoint.healthy
+                and endpoint not in exclude
+                and now - endpoint.last_check > self.health_check_interval
+            ):
+                self.check_health(endpoint)
+
+        with self.lock:
+            candidates = [e for e in self.endpoints if e not in exclude]
+            if not len(candidates):
+                return None
+            # Prefer healthy endpoints, but fall back to any endpoint
+            healthy = [e for e in candidates if e.healthy]
+            if len(healthy):
+                candidates = healthy
+            endpoint = min(
+                candidates,
+                key=lambda e: (
+                    e.outstanding,
+                    percentile(list(e.first_token_latencies), 50) or 0.0,
+                ),
+            )
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint, first_token_latency=None, total_latency=None, error=False):
+        """
+        Register the end of a request
+        ---
+        Args:
+        - endpoint: Endpoint the request was sent to
+        - first_token_latency: Seconds until the first token was received (None if cancelled before)
+        - total_latency: Seconds until the response was complete (None if cancelled or failed)
+        - error: Whether the request failed
+        """
+
+        with self.lock:
+            endpoint.outstanding -= 1
+            if first_token_latency is not None:
+                endpoint.first_token_latencies.append(first_token_latency)
+            if total_latency is not None:
+                endpoint.total_latencies.append(total_latency)
+            if error:
+                endpoint.errors += 1
+                endpoint.healthy = False
+                endpoint.last_check = time.time()
+
+    def hedge_delay(self):
+        """
+        Delay after which a hedged request is sent, derived from recent time-to-first-token
+        ---
+        Returns:
+        - delay: Hedge delay in seconds
+        """
+
+        latencies = []
+        for endpoint in self.endpoints:
+            latencies.extend(endpoint.first_token_latencies)
+        if len(latencies) < 10:
+            return self.hedge_delay_default
+        return percentile(latencies, self.hedge_percentile)
+
+    def stats(self):
+        """
+        Statistics of all endpoints
+        ---
+        Returns:
+        - stats: List of endpoint statistics
+        """
+
+        return [endpoint.stats() for endpoint in self.endpoints]
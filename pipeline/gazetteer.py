@@ -0,0 +1,331 @@
+import os
+import io
+import re
+import csv
+import sqlite3
+import zipfile
+import threading
+import unicodedata
+from difflib import SequenceMatcher
+from .utils import get_logger
+
+
+def normalize_name(name):
+    """
+    Normalize a place name for matching
+    ---
+    Args:
+    - name: Place name
+
+    Returns:
+    - name: Lowercase ASCII name without punctuation
+    """
+
+    name = unicodedata.normalize("NFKD", name)
+    name = name.encode("ascii", "ignore").decode("ascii").lower()
+    name = re.sub(r"[^a-z0-9]+", " ", name)
+    return name.strip()
+
+
+class Gazetteer:
+    """
+    Gazetteer geocodes place names offline from a SQLite index built from a GeoNames dump
+    ---
+    NOTE: Exact (alternate) name matches are served from a B-tree index. Other names are matched fuzzily through
+    a trigram index, so ASR misspellings still resolve. Ambiguous names resolve to a populated place (city, town, ...)
+    before an administrative area (state, country) of the same name, then to the most populated one.
+    Qualifiers after the place name (e.g. "Paris, Texas", "Halle, BE") are resolved to countries and
+    first-level administrative areas, and restrict the match to them.
+    """
+
+    def __init__(self, path, fuzzy_threshold=0.8):
+        """
+        Open the gazetteer index
+        ---
+        Args:
+        - path: Path to the SQLite index (created if it does not exist)
+        - fuzzy_threshold (default = 0.8): Minimum similarity (0-1) of a fuzzy match
+        """
+
+        self.logger = get_logger()
+        self.path = path
+        self.fuzzy_threshold = fuzzy_threshold
+        self.lock = threading.Lock()
+
+        # Open database
+        directory = os.path.dirname(path)
+        if len(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS places (
+                id INTEGER PRIMARY KEY, name TEXT, country TEXT, admin1 TEXT,
+                latitude REAL, longitude REAL, population INTEGER, feature_class TEXT
+            );
+            CREATE TABLE IF NOT EXISTS names (name TEXT, place_id INTEGER);
+            CREATE INDEX IF NOT EXISTS names_name ON names (name);
+            CREATE TABLE IF NOT EXISTS regions (name TEXT, country TEXT, admin1 TEXT);
+            CREATE INDEX IF NOT EXISTS regions_name ON regions (name);
+            """
+        )
+
+        # Add the feature class to indices built before it was stored
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(places)")]
+        if "feature_class" not in columns:
+            self.db.execute("ALTER TABLE places ADD COLUMN feature_class TEXT")
+
+        # Indices built before regions were stored cannot resolve qualifiers (e.g. "Paris, Texas")
+        if self.db.execute("SELECT 1 FROM places LIMIT 1").fetchone() is not None:
+            if self.db.execute("SELECT 1 FROM regions LIMIT 1").fetchone() is None:
+                self.logger.warning(f"Gazetteer {path} has no regions, rebuild it to resolve states and countries")
+
+        # Trigram index for fuzzy matching (requires SQLite 3.34+)
+        try:
+            self.db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS names_trigram USING fts5(name, tokenize = 'trigram')"
+            )
+            self.fuzzy = True
+        except sqlite3.OperationalError as err:
+            self.logger.warning(f"Fuzzy place matching unavailable: {err}")
+            self.fuzzy = False
+        self.db.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM places").fetchone()[0]
+
+    def build(
+        self,
+        dump_path,
+        min_population=0,
+        feature_classes="PA",
+        batch_size=10000,
+        country_info_path=None,
+        admin1_path=None,
+    ):
+        """
+        Import a GeoNames dump into the index, replacing its contents
+        ---
+        NOTE: Countries and first-level administrative areas of the dump are always imported as regions
+        (for qualifiers like "Paris, Texas"). Dumps of cities only should be built with the country and admin1 name files.
+
+        Args:
+        - dump_path: Path to a GeoNames dump (e.g. cities500.txt, allCountries.txt, or the zip file containing it)
+        - min_population (default = 0): Minimum population of imported places
+        - feature_classes (default = "PA"): GeoNames feature classes to import (P = populated places, A = administrative areas)
+        - batch_size (default = 10000): Number of places inserted per batch
+        - country_info_path (default = None): Path to the GeoNames country names (countryInfo.txt)
+        - admin1_path (default = None): Path to the GeoNames first-level administrative area names (admin1CodesASCII.txt)
+
+        Returns:
+        - count: Number of imported places
+        """
+
+        self.logger.info(f"Building gazetteer {self.path} from {dump_path}")
+        with self.lock:
+            self.db.execute("DELETE FROM places")
+            self.db.execute("DELETE FROM names")
+            self.db.execute("DELETE FROM regions")
+            if self.fuzzy:
+                self.db.execute("DELETE FROM names_trigram")
+
+            # Region names: country & admin1 codes, then names from the name files and the dump
+            regions = set()
+            if country_info_path is not None:
+                for row in self._read_dump(country_info_path):
+                    if len(row) > 4 and not row[0].startswith("#"):
+                        regions.add((normalize_name(row[4]), row[0], None))
+            if admin1_path is not None:
+                for row in self._read_dump(admin1_path):
+                    if len(row) > 2 and "." in row[0]:
+                        country, admin1 = row[0].split(".", 1)
+                        for name in (row[1], row[2]):
+                            regions.add((normalize_name(name), country, admin1))
+
+            # GeoNames columns: geonameid, name, asciiname, alternatenames, latitude, longitude, feature class,
+            # feature code, country code, cc2, admin1 code, admin2 code, admin3 code, admin4 code, population, ...
+            count = 0
+            places, names = [], []
+            for row in self._read_dump(dump_path):
+                if len(row) < 15:
+                    continue
+                if row[7].startswith("PCL") or row[7] == "ADM1":
+                    admin1 = row[10] if row[7] == "ADM1" else None
+                    for name in [row[1], row[2], *row[3].split(",")]:
+                        regions.add((normalize_name(name), row[8], admin1))
+                if row[6] not in feature_classes:
+                    continue
+                population = int(row[14] or 0)
+                if population < min_population:
+                    continue
+                place_id = int(row[0])
+                places.append(
+                    (
+                        place_id, row[1], row[8], row[10],
+                        float(row[4]), float(row[5]), population, row[6],
+                    )
+                )
+                place_names = set(
+                    normalize_name(name) for name in [row[1], row[2], *row[3].split(",")]
+                )
+                names += [(name, place_id) for name in place_names if len(name)]
+                count += 1
+                if len(places) >= batch_size:
+                    self._insert(places, names)
+                    places, names = [], []
+            self._insert(places, names)
+
+            # Codes of the imported countries, and alphabetic admin1 codes (e.g. US states)
+            countries = set(c for (c,) in self.db.execute("SELECT DISTINCT country FROM places"))
+            regions |= set((normalize_name(c), c, None) for c in countries if len(c))
+            regions |= set(
+                (normalize_name(admin1), c, admin1)
+                for _, c, admin1 in list(regions)
+                if admin1 is not None and re.match(r"^[A-Z]{2,3}$", admin1)
+            )
+            self.db.executemany(
+                "INSERT INTO regions VALUES (?, ?, ?)",
+                [region for region in regions if len(region[0])],
+            )
+
+            # Distinct names for fuzzy candidates
+            if self.fuzzy:
+                self.db.execute(
+                    "INSERT INTO names_trigram (name) SELECT DISTINCT name FROM names"
+                )
+            self.db.commit()
+            self.db.execute("ANALYZE")
+
+        self.logger.info(f"Imported {count} places")
+        return count
+
+    def _read_dump(self, dump_path):
+        # Read tab-separated rows, from a zip archive or a text file
+        if dump_path.endswith(".zip"):
+            with zipfile.ZipFile(dump_path) as archive:
+                member = next(n for n in archive.namelist() if n.endswith(".txt"))
+                with archive.open(member) as f:
+                    text = io.TextIOWrapper(f, encoding="utf-8")
+                    yield from csv.reader(text, delimiter="\t", quoting=csv.QUOTE_NONE)
+        else:
+            with open(dump_path, "r", encoding="utf-8") as f:
+                yield from csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+
+    def _insert(self, places, names):
+        self.db.executemany("INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?, ?, ?, ?)", places)
+        self.db.executemany("INSERT INTO names VALUES (?, ?)", names)
+
+    def _find(self, names, qualifiers=()):
+        # Populated place (else administrative area) with one of the names, most populated first,
+        # within one of the regions of every qualifier
+        query = f"""
+            SELECT p.name, p.country, p.latitude, p.longitude, p.population
+            FROM names n JOIN places p ON p.id = n.place_id
+            WHERE n.name IN ({', '.join('?' * len(names))})
+        """
+        params = list(names)
+        for regions in qualifiers:
+            conditions = []
+            for country, admin1 in regions:
+                if admin1 is None:
+                    conditions.append("p.country = ?")
+                    params.append(country)
+                else:
+                    conditions.append("(p.country = ? AND p.admin1 = ?)")
+                    params += [country, admin1]
+            query += f" AND ({' OR '.join(conditions)})"
+        query += " ORDER BY p.feature_class = 'P' DESC, p.population DESC LIMIT 1"
+        return self.db.execute(query, params).fetchone()
+
+    def _find_regions(self, name):
+        # Countries (admin1 = None) and admin1 areas with the name
+        return self.db.execute(
+            "SELECT DISTINCT country, admin1 FROM regions WHERE name = ?", (name,)
+        ).fetchall()
+
+    def _fuzzy_names(self, name, limit=50):
+        # Candidate names sharing trigrams with the name, ranked by similarity
+        trigrams = set(name[i : i + 3] for i in range(len(name) - 2))
+        if not len(trigrams):
+            return []
+        match = " OR ".join('"' + t.replace('"', '""') + '"' for t in trigrams)
+        candidates = self.db.execute(
+            "SELECT name FROM names_trigram WHERE names_trigram MATCH ? ORDER BY rank LIMIT ?",
+            (match, limit),
+        ).fetchall()
+        scored = [(SequenceMatcher(None, name, c).ratio(), c) for (c,) in candidates]
+        best = max((score for score, _ in scored), default=0)
+        if best < self.fuzzy_threshold:
+            return []
+        return [c for score, c in scored if score == best]
+
+    def lookup(self, location):
+        """
+        Find the coordinates of a place
+        ---
+        Args:
+        - location: Place name, optionally followed by its state and/or country (e.g. "Paris", "Paris, Texas", "Halle, BE")
+
+        Returns:
+        - coords: Coordinates (latitude, longitude), or None if the place is unknown
+        """
+
+        names = [normalize_name(part) for part in location.split(",")]
+        names = [name for name in names if len(name)]
+        if not len(names):
+            return None
+
+        with self.lock:
+            # Resolve qualifiers, leaving unknown ones to the online geocoder
+            qualifiers = []
+            for name in names[1:]:
+                regions = self._find_regions(name)
+                if not len(regions):
+                    self.logger.debug(f"Gazetteer: unknown region {name} in {location}")
+                    return None
+                qualifiers.append(regions)
+
+            # Exact match on the place name
+            row = self._find([names[0]], qualifiers)
+
+            # Fuzzy match for misspellings
+            if row is None and self.fuzzy:
+                candidates = self._fuzzy_names(names[0])
+                if len(candidates):
+                    row = self._find(candidates, qualifiers)
+
+        if row is None:
+            return None
+        name, country, lat, lon, population = row
+        self.logger.debug(f"Gazetteer: {location} -> {name} ({country}, population {population})")
+        return lat, lon
+
+
+# Shared gazetteers by path
+gazetteers = {}
+gazetteers_lock = threading.Lock()
+
+
+def get_gazetteer(config):
+    """
+    Get the shared gazetteer, if configured
+    ---
+    Args:
+    - config: Configuration dictionary
+        - tool_gazetteer_path: Path to the gazetteer index (null = no offline geocoding).
+        - tool_gazetteer_fuzzy_threshold: Minimum similarity (0-1) of a fuzzy place name match.
+
+    Returns:
+    - gazetteer: Shared Gazetteer instance, or None if no index is available
+    """
+
+    path = config.get("tool_gazetteer_path")
+    if path is None or not os.path.exists(path):
+        return None
+    with gazetteers_lock:
+        if path not in gazetteers:
+            gazetteers[path] = Gazetteer(
+                path, config.get("tool_gazetteer_fuzzy_threshold", 0.8)
+            )
+        return gazetteers[path]
@@ -0,0 +1,127 @@
+import json
+
+# Closing bracket of each opening bracket
+BRACKETS = {"{": "}", "[": "]"}
+
+
+class JSONStreamParser:
+    """
+    JSONStreamParser finds the first complete top-level JSON object (or list) in streamed text
+    ---
+    NOTE: Brackets are matched outside of strings (respecting escapes), so nested objects and braces inside strings are handled.
+    Candidates that close but fail to parse (e.g. "[see below]") are skipped and scanning resumes after their opening bracket.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.value = None
+        self.end = None
+        self.done = False
+        self.invalid = 0
+        self.strings = 0
+        self._partial = (None, None, None)
+        self._reset(0)
+
+    def _reset(self, position):
+        self.position = position
+        self.start = None
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, chunk):
+        """
+        Consume a chunk of text
+        ---
+        Args:
+        - chunk: Text chunk
+
+        Returns:
+        - done: Whether a complete JSON value has been found (the rest of the stream can be dropped)
+        """
+
+        if self.done:
+            return True
+        self.buffer += chunk
+
+        while self.position < len(self.buffer):
+            char = self.buffer[self.position]
+            self.position += 1
+
+            # Look for the start of a candidate
+            if self.start is None:
+                if char in BRACKETS:
+                    self.start = self.position - 1
+                    self.stack = [char]
+                continue
+
+            # Skip string contents
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    self.strings += 1
+                continue
+
+            # Match brackets
+            if char == '"':
+                self.in_string = True
+            elif char in BRACKETS:
+                self.stack.append(char)
+            elif char in BRACKETS.values():
+                if BRACKETS[self.stack.pop()] != char:
+                    self.invalid += 1
+                    self._reset(self.start + 1)
+                    continue
+                if not len(self.stack):
+                    # Candidate closed, parse it
+                    try:
+                        self.value = json.loads(self.buffer[self.start : self.position])
+                    except json.JSONDecodeError:
+                        self.invalid += 1
+                        self._reset(self.start + 1)
+                        continue
+                    self.end = self.position
+                    self.done = True
+                    return True
+
+        return False
+
+    def partial(self):
+        """
+        Parse the incomplete candidate as if its open brackets were closed now
+        ---
+        NOTE: Fails inside strings, so a string value is only returned once it is complete.
+        The candidate is only parsed again once a string closed since the previous call, otherwise the previous result is returned.
+
+        Returns:
+        - value: Partial JSON value (the value itself once done), or None if the candidate cannot be closed here
+        """
+
+        if self.done:
+            return self.value
+        if self.start is None or self.in_string:
+            return None
+        start, strings, value = self._partial
+        if (start, strings) == (self.start, self.strings):
+            return value
+        text = self.buffer[self.start : self.position].rstrip().rstrip(",")
+        closers = "".join(BRACKETS[bracket] for bracket in reversed(self.stack))
+        try:
+            value = json.loads(text + closers)
+        except json.JSONDecodeError:
+            value = None
+        self._partial = (self.start, self.strings, value)
+        return value
+
+    @property
+    def text(self):
+        """
+        Text consumed up to and including the JSON value (all text if none was found)
+        ---
+        """
+
+        return self.buffer if self.end is None else self.buffer[: self.end]
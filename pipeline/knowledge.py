@@ -0,0 +1,232 @@
+import os
+import re
+import bz2
+import gzip
+import json
+import sqlite3
+import threading
+from urllib import parse
+from .utils import get_logger, truncate_text
+from .gazetteer import normalize_name
+
+# N-Triples statement with an English text literal: <subject> <predicate> "text"@en .
+TRIPLE_PATTERN = re.compile(r'^<([^>]+)>\s+<([^>]+)>\s+"((?:[^"\\]|\\.)*)"@en\s*\.\s*$')
+TEXT_PREDICATES = (
+    "http://www.w3.org/2000/01/rdf-schema#comment",
+    "http://dbpedia.org/ontology/abstract",
+)
+
+# N-Triples string escapes: ECHAR (e.g. \n) and UCHAR (\uXXXX, \UXXXXXXXX)
+ESCAPE_PATTERN = re.compile(r"\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))")
+ESCAPES = {"t": "\t", "b": "\b", "n": "\n", "r": "\r", "f": "\f", '"': '"', "'": "'", "\\": "\\"}
+
+
+def unescape_literal(text):
+    """
+    Decode the escapes of an N-Triples string literal
+    ---
+    Args:
+    - text: Literal text between the quotes
+
+    Returns:
+    - text: Decoded text
+    """
+
+    def decode(match):
+        code = match.group(1) or match.group(2)
+        if code is not None:
+            if int(code, 16) > 0x10FFFF:
+                raise ValueError(f"Invalid code point \\U{code}")
+            return chr(int(code, 16))
+        if match.group(3) not in ESCAPES:
+            raise ValueError(f"Invalid escape \\{match.group(3)}")
+        return ESCAPES[match.group(3)]
+
+    text = ESCAPE_PATTERN.sub(decode, text)
+    # Join UTF-16 surrogate pairs escaped as two \uXXXX (lone surrogates are invalid)
+    return text.encode("utf-16", "surrogatepass").decode("utf-16")
+
+
+class KnowledgeIndex:
+    """
+    KnowledgeIndex searches article abstracts offline in a SQLite FTS5 index
+    ---
+    NOTE: Exact title matches come first, other keywords are ranked with BM25 (title matches weigh more).
+    The database is memory-mapped, so lookups take milliseconds once the pages are cached.
+    """
+
+    def __init__(self, path, mmap_size=256 * 1024**2):
+        """
+        Open the knowledge index
+        ---
+        Args:
+        - path: Path to the SQLite index (created if it does not exist)
+        - mmap_size (default = 256 MiB): Number of bytes of the database to memory-map
+        """
+
+        self.logger = get_logger()
+        self.path = path
+        self.lock = threading.Lock()
+
+        # Open database
+        directory = os.path.dirname(path)
+        if len(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS articles (id INTEGER PRIMARY KEY, key TEXT, title TEXT, abstract TEXT);
+            CREATE INDEX IF NOT EXISTS articles_key ON articles (key);
+            CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+                title, abstract, content = 'articles', content_rowid = 'id'
+            );
+            """
+        )
+        self.db.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def build(self, dump_path, batch_size=10000):
+        """
+        Import an abstracts dump into the index, replacing its contents
+        ---
+        Args:
+        - dump_path: Path to a dump, optionally compressed (.bz2, .gz)
+            - DBpedia N-Triples/Turtle (.nt, .ttl): English rdfs:comment or dbo:abstract literals.
+            - JSON lines (.jsonl): Objects with "title" and "abstract" keys.
+        - batch_size (default = 10000): Number of articles inserted per batch
+
+        Returns:
+        - count: Number of imported articles
+        """
+
+        self.logger.info(f"Building knowledge index {self.path} from {dump_path}")
+        with self.lock:
+            try:
+                self.db.execute("DELETE FROM articles")
+                count = 0
+                batch = []
+                for title, abstract in self._read_dump(dump_path):
+                    batch.append((normalize_name(title), title, abstract))
+                    count += 1
+                    if len(batch) >= batch_size:
+                        self._insert(batch)
+                        batch = []
+                self._insert(batch)
+
+                # Rebuild full-text index from the articles
+                self.db.execute("INSERT INTO articles_fts (articles_fts) VALUES ('rebuild')")
+                self.db.execute("INSERT INTO articles_fts (articles_fts) VALUES ('optimize')")
+                self.db.commit()
+            except BaseException:
+                # Keep the previous contents of the index
+                self.db.rollback()
+                raise
+
+        self.logger.info(f"Imported {count} articles")
+        return count
+
+    def _open_dump(self, dump_path):
+        if dump_path.endswith(".bz2"):
+            return bz2.open(dump_path, "rt", encoding="utf-8")
+        if dump_path.endswith(".gz"):
+            return gzip.open(dump_path, "rt", encoding="utf-8")
+        return open(dump_path, "r", encoding="utf-8")
+
+    def _read_dump(self, dump_path):
+        # Yield (title, abstract) pairs from a dump, skipping malformed lines
+        name = re.sub(r"\.(bz2|gz)$", "", dump_path)
+        skipped = 0
+        with self._open_dump(dump_path) as f:
+            for number, line in enumerate(f, start=1):
+                try:
+                    if name.endswith(".jsonl"):
+                        if len(line.strip()):
+                            article = json.loads(line)
+                            yield article["title"], article["abstract"]
+                        continue
+                    match = TRIPLE_PATTERN.match(line)
+                    if match is None or match.group(2) not in TEXT_PREDICATES:
+                        continue
+                    subject, _, text = match.groups()
+                    title = parse.unquote(subject.rsplit("/", 1)[-1]).replace("_", " ")
+                    yield title, unescape_literal(text)
+                except (ValueError, KeyError, TypeError) as err:
+                    skipped += 1
+                    self.logger.debug(f"Skipping malformed line {number} of {dump_path}: {err}")
+        if skipped:
+            self.logger.warning(f"Skipped {skipped} malformed lines of {dump_path}")
+
+    def _insert(self, batch):
+        self.db.executemany(
+            "INSERT INTO articles (key, title, abstract) VALUES (?, ?, ?)", batch
+        )
+
+    def search(self, keyword, max_chars=None):
+        """
+        Find the abstract of the article best matching a keyword
+        ---
+        Args:
+        - keyword: Keyword to search for
+        - max_chars (default = None): Maximum length of the returned abstract
+
+        Returns:
+        - title: Title of the article, or None if no article matches
+        - abstract: (Truncated) abstract of the article, or None if no article matches
+        """
+
+        key = normalize_name(keyword)
+        words = key.split()
+        if not len(words):
+            return None, None
+
+        with self.lock:
+            # Exact title match (the longest abstract if several were imported)
+            row = self.db.execute(
+                "SELECT title, abstract FROM articles WHERE key = ? ORDER BY LENGTH(abstract) DESC LIMIT 1",
+                (key,),
+            ).fetchone()
+
+            # Ranked full-text match, requiring all words (partial matches are left to the remote search)
+            if row is None:
+                row = self.db.execute(
+                    """
+                    SELECT a.title, a.abstract FROM articles_fts f JOIN articles a ON a.id = f.rowid
+                    WHERE articles_fts MATCH ? ORDER BY bm25(articles_fts, 10.0, 1.0) LIMIT 1
+                    """,
+                    (" AND ".join(f'"{word}"' for word in words),),
+                ).fetchone()
+
+        if row is None:
+            return None, None
+        title, abstract = row
+        return title, truncate_text(abstract, max_chars)
+
+
+# Shared knowledge indices by path
+indices = {}
+indices_lock = threading.Lock()
+
+
+def get_knowledge_index(config):
+    """
+    Get the shared knowledge index, if configured
+    ---
+    Args:
+    - config: Configuration dictionary
+        - tool_knowledge_path: Path to the knowledge index (null = no offline search).
+
+    Returns:
+    - index: Shared KnowledgeIndex instance, or None if no index is available
+    """
+
+    path = config.get("tool_knowledge_path")
+    if path is None or not os.path.exists(path):
+        return None
+    with indices_lock:
+        if path not in indices:
+            indices[path] = KnowledgeIndex(path)
+        return indices[path]
@@ -1,7 +1,17 @@
 import openai
-import requests
+import httpx
+import json
+import time
+import queue
+import threading
 from dotenv import load_dotenv
-from .utils import get_logger
+from .utils import get_logger, count_tokens
+from .metrics import get_metrics
+from .session import get_session
+from .cache import Cache, get_cache
+from .singleflight import SingleFlight
+from .endpoints import EndpointPool
+from .replay import ReplayStore, replay_chunks
 import os
 
 
@@ -29,26 +39,243 @@ class LLM:
         # Initialize model
         self.model = providers[self.provider]["class"](config)
 
-    def __call__(self, prompt, system_prompt=None):
+        # Initialize response cache
+        self.cache = get_cache(config, "llm")
+
+        # Coalesce concurrent identical calls
+        self.flights = None
+        if config.get("llm_coalesce", False):
+            self.flights = SingleFlight("llm", config.get("llm_coalesce_timeout"))
+
+    def warmup(self, system_prompt=None):
+        """
+        Prepare the LLM for prompts with the given system prompt
+        ---
+        Args:
+        - system_prompt: System prompt to prepare for
+        """
+
+        self.logger.debug("Warming up LLM")
+        self.model.warmup(system_prompt=system_prompt)
+
+    def _get_cache_key(self, prompt, system_prompt=None, history=None):
+        """
+        Build the response cache key for a prompt
+        ---
+        Args:
+        - prompt: Prompt to send to the LLM
+        - system_prompt: System prompt to send to the LLM
+        - history: Previous chat messages to send before the prompt
+
+        Returns:
+        - key: Cache key
+        """
+
+        if system_prompt is None:
+            system_prompt = self.model.system_message
+        return Cache.key(
+            self.provider, self.model.model_name, system_prompt, history or [], prompt
+        )
+
+    def __call__(
+        self, prompt, system_prompt=None, history=None, use_cache=True, tags=None
+    ):
         """
         Prompt the LLM
         ---
         Args:
         - prompt: Prompt to send to the LLM
         - system_prompt: System prompt to send to the LLM
+        - history: Previous chat messages to send before the prompt
+        - use_cache (default = True): Whether to use the response cache (if enabled)
+        - tags: Dictionary of extra metric tags (e.g. ToolLLM iteration)
 
         Returns:
         - response: Response from the LLM
         """
 
+        def generate():
+            return "".join(
+                self._generate(prompt, system_prompt, history, use_cache, tags)
+            )
+
+        # Share the result of an identical in-flight call (callers bypassing the cache want a fresh response)
+        if self.flights is not None and use_cache:
+            key = self._get_cache_key(prompt, system_prompt, history)
+            return self.flights.do(key, generate)
+        return generate()
+
+    def stream(
+        self, prompt, system_prompt=None, history=None, use_cache=True, tags=None
+    ):
+        """
+        Prompt the LLM and stream the response as it is generated
+        ---
+        Args:
+        - prompt: Prompt to send to the LLM
+        - system_prompt: System prompt to send to the LLM
+        - history: Previous chat messages to send before the prompt
+        - use_cache (default = True): Whether to use the response cache (if enabled)
+        - tags: Dictionary of extra metric tags (e.g. ToolLLM iteration)
+
+        Returns:
+        - chunks: Generator of response text chunks
+        """
+
+        yield from self._generate(prompt, system_prompt, history, use_cache, tags)
+
+    def _generate(self, prompt, system_prompt, history, use_cache, tags):
+        """
+        Prompt the LLM model, with response caching and metrics
+        ---
+        Returns:
+        - chunks: Generator of response text chunks
+        """
+
         self.logger.info(f"Prompting LLM")
         self.logger.info(f"Prompt:\n{prompt}")
         if system_prompt is not None:
             self.logger.debug(f"System prompt: {system_prompt}")
+        if history is not None:
+            self.logger.debug(f"History: {len(history)} messages")
+        tags = {"provider": self.provider, "model": self.model.model_name, **(tags or {})}
+        metrics = get_metrics()
+
+        # Look up cached response
+        use_cache = use_cache and self.cache is not None
+        if use_cache:
+            cache_key = self._get_cache_key(prompt, system_prompt, history)
+            response = self.cache.get(cache_key)
+            if response is not None:
+                self.logger.info(f"LLM response (cached):\n{response}")
+                self.logger.debug(f"LLM cache: {self.cache.stats()}")
+                metrics.increment("llm_cache_hits", tags=tags)
+                yield response
+                return
 
-        response = self.model(prompt, system_prompt=system_prompt)
+        # Generate response
+        self.model._start_call()
+        start_time = time.time()
+        first_token_time = None
+        response = ""
+        chunks = self.model.stream(prompt, system_prompt=system_prompt, history=history)
+        try:
+            for chunk in chunks:
+                if first_token_time is None:
+                    first_token_time = time.time()
+                response += chunk
+                yield chunk
+        except GeneratorExit:
+            # Consumer stopped early (e.g. tool call complete): close the provider stream, don't cache
+            chunks.close()
+            self.logger.info(f"LLM response (stopped early):\n{response}")
+            metrics.increment("llm_early_stops", tags=tags)
+            messages = self.model._get_messages(prompt, system_prompt, history)
+            self._record_call_metrics(
+                messages, response, start_time, first_token_time, time.time(), tags
+            )
+            raise
+        end_time = time.time()
         self.logger.info(f"LLM response:\n{response}")
-        return response
+
+        # Record call metrics
+        messages = self.model._get_messages(prompt, system_prompt, history)
+        self._record_call_metrics(
+            messages, response, start_time, first_token_time, end_time, tags
+        )
+
+        # Cache complete response
+        if use_cache:
+            self.cache.set(cache_key, response)
+            self.logger.debug(f"LLM cache: {self.cache.stats()}")
+
+    def call_tools(self, messages, tool_schemas, tags=None):
+        """
+        Prompt the LLM with native function calling
+        ---
+        Args:
+        - messages: Chat messages, including system prompt, tool calls and tool results
+        - tool_schemas: List of OpenAI-style function tool schemas
+        - tags: Dictionary of extra metric tags (e.g. ToolLLM iteration)
+
+        Returns:
+        - result: Dictionary with the response "content" and a list of "tool_calls" ({id, name, arguments})
+        """
+
+        self.logger.info(f"Prompting LLM with tools")
+        self.logger.info(f"Prompt:\n{messages[-1].get('content')}")
+        tags = {"provider": self.provider, "model": self.model.model_name, **(tags or {})}
+
+        # Call model
+        self.model._start_call()
+        start_time = time.time()
+        result = self.model.call_tools(messages, tool_schemas)
+        end_time = time.time()
+        self.logger.info(f"LLM response:\n{result}")
+
+        # Record call metrics
+        response = (result.get("content") or "") + json.dumps(result["tool_calls"])
+        self._record_call_metrics(messages, response, start_time, None, end_time, tags)
+        return result
+
+    def _record_call_metrics(
+        self, messages, response, start_time, first_token_time, end_time, tags
+    ):
+        """
+        Compute, log and register latency and token throughput metrics of a call
+        ---
+        Args:
+        - messages: Chat messages sent to the model
+        - response: Response text
+        - start_time: Time the call started
+        - first_token_time: Time the first token was received (None if not streamed)
+        - end_time: Time the call ended
+        - tags: Dictionary of metric tags
+
+        Returns:
+        - call_metrics: Dictionary with queue time, time to first token, latency, token counts and tokens/sec
+        """
+
+        model_metrics = self.model.get_call_metrics()
+
+        # Token counts, from the provider usage when available
+        usage = model_metrics.get("usage") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = sum(
+                count_tokens(m.get("content") or json.dumps(m.get("tool_calls", "")))
+                for m in messages
+            )
+        completion_tokens = usage.get("completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = count_tokens(response)
+
+        # Timings
+        sent_time = model_metrics.get("sent_time")
+        queue_time = sent_time - start_time if sent_time is not None else None
+        first_token = first_token_time - start_time if first_token_time else None
+        latency = end_time - start_time
+        decode_time = end_time - (first_token_time or start_time)
+        if decode_time <= 0:
+            decode_time = latency
+        tokens_per_second = completion_tokens / decode_time if decode_time > 0 else None
+
+        call_metrics = {
+            "queue_time": queue_time,
+            "first_token_time": first_token,
+            "latency": latency,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "tokens_per_second": tokens_per_second,
+        }
+
+        # Log & register metrics
+        self.logger.info(f"LLM metrics ({tags}): {call_metrics}")
+        metrics = get_metrics()
+        metrics.increment("llm_calls", tags=tags)
+        for name, value in call_metrics.items():
+            metrics.observe(f"llm_{name}", value, tags=tags)
+        return call_metrics
 
 
 class LLMModel:
@@ -70,12 +297,83 @@ class LLMModel:
         self.model_name = config.get("llm_model")
         self.system_message = config.get("llm_system_message")
 
-    def __call__(self, prompt):
+        # Per-thread metrics of the current call
+        self.local = threading.local()
+
+    def _start_call(self):
+        """
+        Reset the metrics of the current call
+        ---
+        """
+
+        self.local.call_metrics = {"sent_time": None, "usage": None}
+
+    def _mark_sent(self):
+        """
+        Register that the request of the current call is sent to the provider
+        ---
+        """
+
+        metrics = self.get_call_metrics()
+        if metrics.get("sent_time") is None:
+            metrics["sent_time"] = time.time()
+
+    def _set_usage(self, usage):
+        """
+        Register the token usage of the current call, as reported by the provider
+        ---
+        Args:
+        - usage: Dictionary with prompt_tokens and completion_tokens
+        """
+
+        self.get_call_metrics()["usage"] = usage
+
+    def get_call_metrics(self):
+        """
+        Get the metrics of the current call in this thread
+        ---
+        Returns:
+        - call_metrics: Dictionary with sent_time and usage
+        """
+
+        if not hasattr(self.local, "call_metrics"):
+            self._start_call()
+        return self.local.call_metrics
+
+    def _get_messages(self, prompt, system_prompt=None, history=None):
+        """
+        Construct the chat messages for a prompt
+        ---
+        NOTE: Messages are ordered from most to least stable (system, history, prompt),
+        so consecutive calls share a prefix for provider-side prompt / KV caching.
+
+        Args:
+        - prompt: Prompt to send to the LLM model
+        - system_prompt: System prompt, defaults to the configured system message
+        - history: Previous chat messages to send before the prompt
+
+        Returns:
+        - messages: List of chat messages
+        """
+
+        # Default system prompt
+        if system_prompt is None:
+            system_prompt = self.system_message
+
+        return [
+            {"role": "system", "content": system_prompt},
+            *(history or []),
+            {"role": "user", "content": prompt},
+        ]
+
+    def __call__(self, prompt, system_prompt=None, history=None):
         """
         Perform inference with the LLM model
         ---
         Args:
         - prompt: Prompt to send to the LLM model
+        - system_prompt: System prompt to send to the LLM model
+        - history: Previous chat messages to send before the prompt
 
         Returns:
         - response: Response from the LLM model
@@ -83,6 +381,103 @@ class LLMModel:
 
         raise NotImplementedError("__call__() is not implemented in base class")
 
+    def stream(self, prompt, system_prompt=None, history=None):
+        """
+        Perform inference with the LLM model, streaming the response
+        ---
+        NOTE: Models without streaming support yield the full response at once
+
+        Args:
+        - prompt: Prompt to send to the LLM model
+        - system_prompt: System prompt to send to the LLM model
+        - history: Previous chat messages to send before the prompt
+
+        Returns:
+        - chunks: Generator of response text chunks
+        """
+
+        yield self(prompt, system_prompt=system_prompt, history=history)
+
+    def warmup(self, system_prompt=None):
+        """
+        Prepare the LLM model for prompts with the given system prompt
+        ---
+        NOTE: Only models with local state (e.g. a KV cache) need to implement this
+
+        Args:
+        - system_prompt: System prompt to prepare for
+        """
+
+        pass
+
+    def call_tools(self, messages, tool_schemas):
+        """
+        Perform inference with native function calling
+        ---
+        Args:
+        - messages: Chat messages, including system prompt, tool calls and tool results
+        - tool_schemas: List of OpenAI-style function tool schemas
+
+        Returns:
+        - result: Dictionary with the response "content" and a list of "tool_calls" ({id, name, arguments})
+        """
+
+        raise NotImplementedError("call_tools() is not implemented in base class")
+
+    def _parse_tool_calls(self, message):
+        """
+        Parse an OpenAI-style assistant message with tool calls
+        ---
+        Args:
+        - message: Assistant message dictionary
+
+        Returns:
+        - result: Dictionary with the response "content" and a list of "tool_calls" ({id, name, arguments})
+        """
+
+        tool_calls = []
+        for index, tool_call in enumerate(message.get("tool_calls") or []):
+            function = tool_call.get("function", {})
+            arguments = function.get("arguments") or "{}"
+            if isinstance(arguments, str):
+                try:
+                    arguments = json.loads(arguments)
+                except json.JSONDecodeError:
+                    arguments = {}
+            tool_calls.append(
+                {
+                    "id": tool_call.get("id") or f"call_{index}",
+                    "name": function.get("name", ""),
+                    "arguments": arguments,
+                }
+            )
+        return {"content": message.get("content"), "tool_calls": tool_calls}
+
+    def _get_json_tool_messages(self, messages):
+        """
+        Convert tool call and tool result messages for models without native function calling
+        ---
+        Args:
+        - messages: Chat messages, including tool calls and tool results
+
+        Returns:
+        - messages: Chat messages with JSON tool calls and tool results as user messages
+        """
+
+        converted = []
+        for message in messages:
+            if message["role"] == "assistant" and message.get("tool_calls"):
+                function = message["tool_calls"][0]["function"]
+                arguments = json.loads(function["arguments"])
+                arg = next(iter(arguments.values()), "")
+                content = json.dumps({"tool": function["name"], "arg": arg})
+                converted.append({"role": "assistant", "content": content})
+            elif message["role"] == "tool":
+                converted.append({"role": "user", "content": message["content"]})
+            else:
+                converted.append(message)
+        return converted
+
 
 class OpenAIModel(LLMModel):
     """
@@ -99,36 +494,84 @@ class OpenAIModel(LLMModel):
         self.client = openai.Client(
             api_key=os.getenv("OPENAI_API_KEY"),
             base_url=self.base_url,
+            timeout=httpx.Timeout(
+                config.get("llm_read_timeout", 120),
+                connect=config.get("llm_connect_timeout", 5),
+            ),
+            max_retries=config.get("llm_max_retries", 2),
         )
 
-    def __call__(self, prompt, system_prompt=None):
-        # Default system prompt
-        if system_prompt is None:
-            system_prompt = self.system_message
-
+    def __call__(self, prompt, system_prompt=None, history=None):
         # Construct messages
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt},
-        ]
+        messages = self._get_messages(prompt, system_prompt, history)
 
         # Call API
         self.logger.debug("Calling OpenAI API")
+        self._mark_sent()
         chat = self.client.chat.completions.create(
             model=self.model_name, messages=messages
         )
 
         # Parse response
         response_text = chat.choices[0].message.content
+        if chat.usage is not None:
+            self._set_usage(chat.usage.model_dump())
 
         return response_text
 
+    def stream(self, prompt, system_prompt=None, history=None):
+        # Construct messages
+        messages = self._get_messages(prompt, system_prompt, history)
+
+        # Call API
+        self.logger.debug("Calling OpenAI API (streaming)")
+        self._mark_sent()
+        chat = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        # Yield response deltas, closing the connection when done or stopped early
+        try:
+            for chunk in chat:
+                if chunk.usage is not None:
+                    self._set_usage(chunk.usage.model_dump())
+                if not len(chunk.choices):
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            chat.close()
+
+    def call_tools(self, messages, tool_schemas):
+        # Call API
+        self.logger.debug("Calling OpenAI API (tools)")
+        self._mark_sent()
+        chat = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            tools=tool_schemas,
+            tool_choice="auto",
+        )
+        if chat.usage is not None:
+            self._set_usage(chat.usage.model_dump())
+
+        # Parse response
+        message = chat.choices[0].message.model_dump()
+        return self._parse_tool_calls(message)
+
 
 class LlamaEdgeModel(LLMModel):
     """
     LlamaEdgeModel interfaces with LlamaEdge's large language model
     ---
-    NOTE: It requires a LlamaEdge instance running on the configured IP address
+    NOTE: It requires a LlamaEdge instance running on the configured IP address.
+    When multiple urls are configured, requests are balanced over the instances and
+    optionally hedged: if no token arrives within the (p95) hedge delay, the request
+    is also sent to a second instance and the slower one is cancelled.
     """
 
     def __init__(self, config):
@@ -137,27 +580,118 @@ class LlamaEdgeModel(LLMModel):
         if self.base_url is None:
             self.base_url = "http://localhost:8080/v1"
 
-    def __call__(self, prompt, system_prompt=None):
-        # Default system prompt
-        if system_prompt is None:
-            system_prompt = self.system_message
+        # Shared keep-alive session
+        self.session = get_session(config, "llm")
 
-        # Construct messages
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt},
-        ]
+        # Endpoint pool
+        urls = self.base_url if isinstance(self.base_url, list) else [self.base_url]
+        self.pool = EndpointPool(urls, self.session, config)
 
-        # Perform API call
-        self.logger.debug("Calling Llama Edge API")
-        response = requests.post(
-            f"{self.base_url}/chat/completions",
-            json={
-                "messages": messages,
-                "model": self.model_name,
-            },
-            headers={"Content-Type": "application/json"},
-        )
+    def _parse_events(self, response):
+        """
+        Parse server-sent events of a streamed response
+        ---
+        Args:
+        - response: Streamed requests Response
+
+        Returns:
+        - events: Generator of parsed event data dictionaries
+        """
+
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:") :].strip()
+            if data == "[DONE]":
+                break
+            yield json.loads(data)
+
+    def _run_attempt(self, attempt, payload, events):
+        """
+        Send a streamed request to one endpoint, forwarding its deltas to the events queue
+        ---
+        Args:
+        - attempt: Attempt to run
+        - payload: Request body
+        - events: Queue receiving (attempt, kind, value) tuples
+        """
+
+        endpoint = attempt.endpoint
+        start_time = time.time()
+        first_token_latency = None
+        total_latency = None
+        error = False
+        try:
+            attempt.response = self.session.post(
+                f"{endpoint.url}/chat/completions",
+                json=payload,
+                headers={"Content-Type": "application/json"},
+                stream=True,
+            )
+            if attempt.cancelled:
+                return
+
+            # Confirm response success
+            if attempt.response.status_code != 200:
+                raise Exception(f"Error calling API: {attempt.response.text}")
+
+            # Forward deltas
+            for data in self._parse_events(attempt.response):
+                if attempt.cancelled:
+                    break
+                if data.get("usage"):
+                    attempt.usage = data["usage"]
+                choices = data.get("choices", [])
+                if not len(choices):
+                    continue
+                delta = choices[0].get("delta", {}).get("content")
+                if not delta:
+                    continue
+                if first_token_latency is None:
+                    first_token_latency = time.time() - start_time
+                events.put((attempt, "chunk", delta))
+            else:
+                total_latency = time.time() - start_time
+            events.put((attempt, "done", None))
+        except Exception as err:
+            error = not attempt.cancelled
+            events.put((attempt, "error", err))
+        finally:
+            if attempt.response is not None:
+                attempt.response.close()
+            self.pool.release(endpoint, first_token_latency, total_latency, error)
+
+    def call_tools(self, messages, tool_schemas):
+        payload = {
+            "messages": messages,
+            "model": self.model_name,
+            "tools": tool_schemas,
+            "tool_choice": "auto",
+        }
+
+        # Try endpoints until one succeeds
+        tried = []
+        while True:
+            endpoint = self.pool.select(exclude=tried)
+            if endpoint is None:
+                raise Exception("Error calling API: no endpoint available")
+            tried.append(endpoint)
+            self.logger.debug(f"Calling Llama Edge API ({endpoint.url}, tools)")
+            self._mark_sent()
+            start_time = time.time()
+            try:
+                response = self.session.post(
+                    f"{endpoint.url}/chat/completions",
+                    json=payload,
+                    headers={"Content-Type": "application/json"},
+                )
+            except Exception as err:
+                self.logger.warning(f"{endpoint.url}: {err}")
+                self.pool.release(endpoint, error=True)
+                continue
+            latency = time.time() - start_time
+            self.pool.release(endpoint, total_latency=latency)
+            break
 
         # Confirm response success
         if response.status_code != 200:
@@ -165,10 +699,351 @@ class LlamaEdgeModel(LLMModel):
 
         # Parse response
         response_body = response.json()
-        response_text = response_body["choices"][0]["message"]["content"]
+        if response_body.get("usage"):
+            self._set_usage(response_body["usage"])
+        return self._parse_tool_calls(response_body["choices"][0]["message"])
+
+    def __call__(self, prompt, system_prompt=None, history=None):
+        return "".join(self.stream(prompt, system_prompt, history))
+
+    def stream(self, prompt, system_prompt=None, history=None):
+        # Construct messages
+        messages = self._get_messages(prompt, system_prompt, history)
+        payload = {
+            "messages": messages,
+            "model": self.model_name,
+            "stream": True,
+        }
+
+        # Keep track of requests sent
+        events = queue.Queue()
+        attempts = []
+        winner = None
+        hedged = not self.pool.hedge
+        start_time = time.time()
+
+        def start_attempt():
+            endpoint = self.pool.select(exclude=[a.endpoint for a in attempts])
+            if endpoint is None:
+                return False
+            self.logger.debug(f"Calling Llama Edge API ({endpoint.url})")
+            self._mark_sent()
+            attempt = Attempt(endpoint)
+            attempts.append(attempt)
+            threading.Thread(
+                target=self._run_attempt, args=(attempt, payload, events), daemon=True
+            ).start()
+            return True
+
+        try:
+            start_attempt()
+            while True:
+                # Wait for the next event, or until the hedge delay expires
+                timeout = None
+                if winner is None and not hedged:
+                    elapsed = time.time() - start_time
+                    timeout = max(self.pool.hedge_delay() - elapsed, 0)
+                try:
+                    attempt, kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedged = True
+                    if start_attempt():
+                        self.logger.debug("No token within hedge delay, hedging request")
+                    continue
+                if kind != "chunk":
+                    attempt.finished = True
+
+                # Select the first endpoint producing a token, cancel the others
+                if winner is None:
+                    if kind == "error":
+                        self.logger.warning(f"{attempt.endpoint.url}: {value}")
+                        if any(not a.finished for a in attempts):
+                            continue
+                        # Fail over to another endpoint
+                        hedged = True
+                        if start_attempt():
+                            continue
+                        raise Exception(value)
+                    winner = attempt
+                    if len(attempts) > 1:
+                        winner.endpoint.hedges_won += 1
+                    for other in attempts:
+                        if other is not winner:
+                            other.cancel()
+
+                # Forward events of the winning request
+                if attempt is not winner:
+                    continue
+                if kind == "chunk":
+                    yield value
+                elif kind == "error":
+                    raise Exception(value)
+                else:
+                    if winner.usage is not None:
+                        self._set_usage(winner.usage)
+                    break
+        finally:
+            # Cancel outstanding requests (e.g. when the consumer stops early)
+            for attempt in attempts:
+                attempt.cancel()
+            self.logger.debug(f"Llama Edge connections: {self.session.stats()}")
+            self.logger.debug(f"Llama Edge endpoints: {self.pool.stats()}")
+
+
+class Attempt:
+    """
+    Attempt keeps track of one (possibly hedged) request to an endpoint
+    ---
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.response = None
+        self.usage = None
+        self.cancelled = False
+        self.finished = False
+
+    def cancel(self):
+        """
+        Cancel the request, closing its connection
+        ---
+        """
+
+        self.cancelled = True
+        if self.response is not None and not self.finished:
+            self.response.close()
+
+
+class LlamaCppModel(LLMModel):
+    """
+    LlamaCppModel runs a GGUF model in process with llama.cpp
+    https://github.com/abetlen/llama-cpp-python
+    ---
+    NOTE: The KV cache of previous prompts is kept in memory, so prompts sharing a prefix
+    (e.g. the system message and tools prompt) only need to prefill the new text.
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        from llama_cpp import Llama, LlamaRAMCache
+
+        # Config
+        self.model_path = config.get("llm_model_path")
+        self.context_length = config.get("llm_context_length", 2048)
+        self.threads = config.get("llm_threads")
+        self.max_tokens = config.get("llm_max_tokens", 512)
+        self.kv_cache_bytes = config.get("llm_kv_cache_bytes", 2 << 30)
+
+        # Load model
+        self.logger.debug(f"Loading LLM model {self.model_path}")
+        self.llama = Llama(
+            model_path=self.model_path,
+            n_ctx=self.context_length,
+            n_threads=self.threads,
+            n_gpu_layers=0,
+            verbose=False,
+        )
+
+        # Keep KV cache states of previous prompts
+        self.llama.set_cache(LlamaRAMCache(capacity_bytes=self.kv_cache_bytes))
+
+        # Prefill default system message
+        self.warmup()
+
+    def __call__(self, prompt, system_prompt=None, history=None):
+        # Construct messages
+        messages = self._get_messages(prompt, system_prompt, history)
+
+        # Run model
+        self.logger.debug("Running llama.cpp model")
+        self._mark_sent()
+        chat = self.llama.create_chat_completion(
+            messages=messages, max_tokens=self.max_tokens
+        )
+
+        # Parse response
+        response_text = chat["choices"][0]["message"]["content"]
+        self._set_usage(chat.get("usage"))
 
         return response_text
 
+    def stream(self, prompt, system_prompt=None, history=None):
+        # Construct messages
+        messages = self._get_messages(prompt, system_prompt, history)
+
+        # Run model
+        self.logger.debug("Running llama.cpp model (streaming)")
+        self._mark_sent()
+        chat = self.llama.create_chat_completion(
+            messages=messages, max_tokens=self.max_tokens, stream=True
+        )
+
+        # Yield response deltas, stopping generation when the consumer stops early
+        try:
+            for chunk in chat:
+                delta = chunk["choices"][0]["delta"].get("content")
+                if delta:
+                    yield delta
+        finally:
+            chat.close()
+
+    def call_tools(self, messages, tool_schemas):
+        # Constrain decoding to a {"tool": ..., "arg": ...} object
+        schema = {
+            "type": "object",
+            "properties": {
+                "tool": {"enum": [t["function"]["name"] for t in tool_schemas]},
+                "arg": {"type": "string"},
+            },
+            "required": ["tool", "arg"],
+        }
+
+        # Run model
+        self.logger.debug("Running llama.cpp model (tools)")
+        self._mark_sent()
+        chat = self.llama.create_chat_completion(
+            messages=self._get_json_tool_messages(messages),
+            max_tokens=self.max_tokens,
+            response_format={"type": "json_object", "schema": schema},
+        )
+        self._set_usage(chat.get("usage"))
+
+        # Parse response into a tool call
+        result = json.loads(chat["choices"][0]["message"]["content"])
+        function = next(
+            t["function"] for t in tool_schemas if t["function"]["name"] == result["tool"]
+        )
+        parameter = next(iter(function["parameters"]["properties"]), "arg")
+        return {
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": f"call_{len(messages)}",
+                    "name": result["tool"],
+                    "arguments": {parameter: result["arg"]},
+                }
+            ],
+        }
+
+    def warmup(self, system_prompt=None):
+        # Prefill the system prompt, so its KV cache state is stored for later prompts
+        self.logger.debug("Prefilling system prompt")
+        self.llama.create_chat_completion(
+            messages=self._get_messages("", system_prompt), max_tokens=1
+        )
+
+
+class RecordingModel(LLMModel):
+    """
+    RecordingModel wraps another provider and records its requests and streamed responses
+    ---
+    NOTE: Recordings can be served back by the replay provider or the replay server
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+
+        # Wrapped provider
+        self.provider = config.get("llm_record_provider", "openai")
+        self.model = providers[self.provider]["class"](config)
+
+        # Recording store
+        self.store = ReplayStore(config.get("llm_record_path", "./recordings/llm.jsonl"))
+
+    def _start_call(self):
+        self.model._start_call()
+
+    def get_call_metrics(self):
+        return self.model.get_call_metrics()
+
+    def warmup(self, system_prompt=None):
+        self.model.warmup(system_prompt=system_prompt)
+
+    def call_tools(self, messages, tool_schemas):
+        # Forward & record the response content and tool calls
+        start_time = time.time()
+        result = self.model.call_tools(messages, tool_schemas)
+        chunks = [(time.time() - start_time, result.get("content") or "")]
+        usage = self.get_call_metrics().get("usage")
+        self.store.add(
+            self.model_name, messages, chunks, usage,
+            tools=tool_schemas, tool_calls=result["tool_calls"],
+        )
+        self.logger.debug(f"Recorded LLM tool calls ({len(result['tool_calls'])} calls)")
+        return result
+
+    def __call__(self, prompt, system_prompt=None, history=None):
+        return "".join(self.stream(prompt, system_prompt, history))
+
+    def stream(self, prompt, system_prompt=None, history=None):
+        # Construct messages
+        messages = self._get_messages(prompt, system_prompt, history)
+
+        # Forward & record chunks with their time offsets
+        # NOTE: Responses stopped early by the consumer are recorded up to that point
+        start_time = time.time()
+        chunks = []
+        stream = self.model.stream(prompt, system_prompt, history)
+        try:
+            for chunk in stream:
+                chunks.append((time.time() - start_time, chunk))
+                yield chunk
+        except GeneratorExit:
+            stream.close()
+            self._record(messages, chunks)
+            raise
+        self._record(messages, chunks)
+
+    def _record(self, messages, chunks):
+        # Store recording
+        usage = self.get_call_metrics().get("usage")
+        self.store.add(self.model_name, messages, chunks, usage)
+        self.logger.debug(f"Recorded LLM response ({len(chunks)} chunks)")
+
+
+class ReplayModel(LLMModel):
+    """
+    ReplayModel serves recorded responses without calling a provider
+    ---
+    NOTE: Requests which were not recorded raise an exception
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+
+        # Recording store & simulated latency profile
+        self.store = ReplayStore(config.get("llm_record_path", "./recordings/llm.jsonl"))
+        self.latency = config.get("llm_replay_latency")
+
+    def __call__(self, prompt, system_prompt=None, history=None):
+        return "".join(self.stream(prompt, system_prompt, history))
+
+    def stream(self, prompt, system_prompt=None, history=None):
+        # Construct messages
+        messages = self._get_messages(prompt, system_prompt, history)
+
+        # Find recording
+        self._mark_sent()
+        record = self.store.get(self.model_name, messages)
+        if record is None:
+            raise Exception(f"No recording for prompt: {prompt}")
+
+        # Replay recorded chunks
+        self._set_usage(record.get("usage"))
+        yield from replay_chunks(record, self.latency)
+
+    def call_tools(self, messages, tool_schemas):
+        # Find recording
+        self._mark_sent()
+        record = self.store.get(self.model_name, messages, tool_schemas)
+        if record is None:
+            raise Exception(f"No recording for prompt: {messages[-1].get('content')}")
+
+        # Replay recorded response content and tool calls
+        self._set_usage(record.get("usage"))
+        content = "".join(replay_chunks(record, self.latency))
+        return {"content": content or None, "tool_calls": record.get("tool_calls") or []}
+
 
 providers = {
     "openai": {
@@ -177,4 +1052,13 @@ providers = {
     "llama-edge": {
         "class": LlamaEdgeModel,
     },
+    "llama-cpp": {
+        "class": LlamaCppModel,
+    },
+    "record": {
+        "class": RecordingModel,
+    },
+    "replay": {
+        "class": ReplayModel,
+    },
 }
@@ -0,0 +1,169 @@
+import time
+import threading
+from .utils import get_logger, count_tokens
+
+
+class ConversationMemory:
+    """
+    ConversationMemory keeps the recent turns of a conversation within a token budget
+    ---
+    NOTE: When the budget is exceeded, all but the most recent turns are rolled into a summary at once.
+    Between compactions the history only grows at the end, so the message prefix stays stable for provider caching.
+    """
+
+    def __init__(self, config, llm=None):
+        """
+        Initialize the conversation memory
+        ---
+        Args:
+        - config: Configuration dictionary
+            - memory_max_tokens: Token budget of the conversation history.
+            - memory_recent_turns: Number of most recent turns kept verbatim when compacting.
+            - memory_idle_timeout: Seconds of inactivity after which the conversation is forgotten.
+        - llm (default = None): LLM used to summarize older turns (if None, older turns are truncated)
+        """
+
+        # Logger
+        self.logger = get_logger()
+        self.logger.debug("Configuring conversation memory")
+
+        # Config
+        self.max_tokens = config.get("memory_max_tokens", 1000)
+        self.recent_turns = config.get("memory_recent_turns", 2)
+        self.idle_timeout = config.get("memory_idle_timeout", 300)
+        self.llm = llm
+
+        # State
+        self.lock = threading.Lock()
+        self.summary = ""
+        self.turns = []
+        self.last_active = None
+
+    def _is_expired(self):
+        return (
+            self.last_active is not None
+            and self.idle_timeout is not None
+            and time.time() - self.last_active > self.idle_timeout
+        )
+
+    def clear(self):
+        """
+        Forget the conversation
+        ---
+        """
+
+        with self.lock:
+            self.summary = ""
+            self.turns = []
+            self.last_active = None
+
+    def get_history(self):
+        """
+        Get the conversation history as chat messages
+        ---
+        Returns:
+        - history: List of chat messages (summary first, then the recent turns)
+        """
+
+        if self._is_expired():
+            self.logger.debug("Conversation expired")
+            self.clear()
+
+        with self.lock:
+            history = []
+            if len(self.summary):
+                history += [
+                    {
+                        "role": "user",
+                        "content": f"Summary of our conversation so far:\n{self.summary}",
+                    },
+                    {"role": "assistant", "content": "Understood."},
+                ]
+            for prompt, response in self.turns:
+                history += [
+                    {"role": "user", "content": prompt},
+                    {"role": "assistant", "content": response},
+                ]
+            return history
+
+    def count_tokens(self):
+        """
+        Count the tokens of the conversation history
+        ---
+        Returns:
+        - count: Number of tokens
+        """
+
+        return sum(count_tokens(m["content"]) for m in self.get_history())
+
+    def add(self, prompt, response):
+        """
+        Add a turn to the conversation, compacting older turns if the token budget is exceeded
+        ---
+        Args:
+        - prompt: User prompt
+        - response: Assistant response
+        """
+
+        if self._is_expired():
+            self.clear()
+        with self.lock:
+            self.turns.append((prompt, response))
+            self.last_active = time.time()
+
+        # Enforce token budget
+        if self.count_tokens() > self.max_tokens:
+            self.compact()
+
+    def compact(self):
+        """
+        Roll all but the most recent turns into the summary
+        ---
+        """
+
+        with self.lock:
+            if len(self.turns) <= self.recent_turns:
+                old_turns = []
+            else:
+                split = len(self.turns) - self.recent_turns
+                old_turns, self.turns = self.turns[:split], self.turns[split:]
+            summary = self.summary
+        if not len(old_turns):
+            return
+
+        self.logger.debug(f"Summarizing {len(old_turns)} conversation turns")
+        summary = self._summarize(summary, old_turns)
+        with self.lock:
+            self.summary = summary
+
+    def _summarize(self, summary, turns):
+        """
+        Summarize a conversation
+        ---
+        Args:
+        - summary: Previous summary
+        - turns: List of (prompt, response) turns to add to the summary
+
+        Returns:
+        - summary: New summary
+        """
+
+        transcript = "\n".join(
+            f"User: {prompt}\nAssistant: {response}" for prompt, response in turns
+        )
+
+        # Summarize with the LLM
+        if self.llm is not None:
+            prompt = "Summarize the following conversation in a few short sentences, keeping names, places and numbers.\n"
+            if len(summary):
+                prompt += f"Earlier summary:\n{summary}\n"
+            prompt += f"Conversation:\n{transcript}"
+            try:
+                return self.llm(prompt, use_cache=False).strip()
+            except Exception as err:
+                self.logger.warning(f"Error summarizing conversation: {err}")
+
+        # Fall back to keeping the end of the transcript within half the budget
+        summary = f"{summary}\n{transcript}".strip()
+        max_chars = self.max_tokens * 2
+        return summary[-max_chars:]
@@ -0,0 +1,164 @@
+import math
+import threading
+from collections import deque
+
+
+def percentile(values, q):
+    """
+    Compute a percentile of a list of values (nearest rank)
+    ---
+    Args:
+    - values: List of values
+    - q: Percentile in [0, 100]
+
+    Returns:
+    - value: Percentile value, or None if there are no values
+    """
+
+    if not len(values):
+        return None
+    values = sorted(values)
+    rank = math.ceil(q / 100 * len(values))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+class Histogram:
+    """
+    Histogram keeps the count and sum of all observations and a window of recent values
+    ---
+    """
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+        self.values = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = value if self.max is None else max(self.max, value)
+        self.values.append(value)
+
+    def summary(self):
+        values = list(self.values)
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """
+    Metrics implements an in-process registry of tagged counters and histograms
+    ---
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, tags):
+        return (name, tuple(sorted((tags or {}).items())))
+
+    def increment(self, name, value=1, tags=None):
+        """
+        Increment a counter
+        ---
+        Args:
+        - name: Name of the counter
+        - value (default = 1): Value to add
+        - tags: Dictionary of tags (e.g. provider, model)
+        """
+
+        key = self._key(name, tags)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, tags=None):
+        """
+        Add an observation to a histogram
+        ---
+        Args:
+        - name: Name of the histogram
+        - value: Observed value
+        - tags: Dictionary of tags (e.g. provider, model)
+        """
+
+        if value is None:
+            return
+        key = self._key(name, tags)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def get_counter(self, name, tags=None):
+        """
+        Get the value of a counter, summed over all tags containing the given tags
+        ---
+        Args:
+        - name: Name of the counter
+        - tags: Dictionary of tags to filter on
+
+        Returns:
+        - value: Counter value
+        """
+
+        tags = set((tags or {}).items())
+        with self.lock:
+            return sum(
+                value
+                for (key_name, key_tags), value in self.counters.items()
+                if key_name == name and tags.issubset(key_tags)
+            )
+
+    def summary(self):
+        """
+        Summarize all metrics
+        ---
+        Returns:
+        - summary: Dictionary with "counters" and "histograms", each a list of {name, tags, ...} entries
+        """
+
+        with self.lock:
+            counters = [
+                {"name": name, "tags": dict(tags), "value": value}
+                for (name, tags), value in self.counters.items()
+            ]
+            histograms = [
+                {"name": name, "tags": dict(tags), **histogram.summary()}
+                for (name, tags), histogram in self.histograms.items()
+            ]
+        return {"counters": counters, "histograms": histograms}
+
+    def reset(self):
+        """
+        Remove all metrics
+        ---
+        """
+
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+# Shared metrics registry
+metrics = Metrics()
+
+
+def get_metrics():
+    """
+    Get the shared metrics registry
+    ---
+    Returns:
+    - metrics: Metrics instance
+    """
+
+    return metrics
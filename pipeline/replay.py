@@ -0,0 +1,321 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from .utils import get_logger
+
+
+class ReplayStore:
+    """
+    ReplayStore keeps recorded LLM requests and their streamed responses in a JSONL file
+    ---
+    NOTE: Each line holds the model, messages, streamed chunks with their time offsets and the token usage.
+    Requests with native function calling also hold the tool schemas and the tool calls of the response.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the store, loading existing records
+        ---
+        Args:
+        - path: Path to the JSONL file
+        """
+
+        self.logger = get_logger()
+        self.path = path
+        self.lock = threading.Lock()
+        self.records = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    if len(line.strip()):
+                        record = json.loads(line)
+                        self.records[record["key"]] = record
+        self.logger.debug(f"Loaded {len(self.records)} LLM recordings from {path}")
+
+    @staticmethod
+    def key(model, messages, tools=None):
+        """
+        Build the key of a request
+        ---
+        Args:
+        - model: Model name
+        - messages: Chat messages
+        - tools (default = None): Tool schemas of a native function calling request
+
+        Returns:
+        - key: Hex digest of the request
+        """
+
+        request = [model, messages] if tools is None else [model, messages, tools]
+        data = json.dumps(request, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get(self, model, messages, tools=None):
+        """
+        Find the recording of a request
+        ---
+        Args:
+        - model: Model name
+        - messages: Chat messages
+        - tools (default = None): Tool schemas of a native function calling request
+
+        Returns:
+        - record: Recorded request, or None if it was not recorded
+        """
+
+        return self.records.get(self.key(model, messages, tools))
+
+    def add(self, model, messages, chunks, usage=None, tools=None, tool_calls=None):
+        """
+        Record a request and its streamed response
+        ---
+        Args:
+        - model: Model name
+        - messages: Chat messages
+        - chunks: List of (time offset in seconds, text) pairs
+        - usage: Token usage reported by the provider
+        - tools (default = None): Tool schemas of a native function calling request
+        - tool_calls (default = None): Tool calls of the response ({id, name, arguments})
+        """
+
+        record = {
+            "key": self.key(model, messages, tools),
+            "model": model,
+            "messages": messages,
+            "chunks": [[round(offset, 4), text] for offset, text in chunks],
+            "usage": usage,
+        }
+        if tools is not None:
+            record["tools"] = tools
+            record["tool_calls"] = tool_calls or []
+        with self.lock:
+            self.records[record["key"]] = record
+            directory = os.path.dirname(self.path)
+            if len(directory):
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def format_tool_calls(record):
+    """
+    Format the tool calls of a recording as OpenAI-style tool calls
+    ---
+    Args:
+    - record: Recorded request
+
+    Returns:
+    - tool_calls: List of OpenAI-style tool calls, or None if the response has no tool calls
+    """
+
+    if not len(record.get("tool_calls") or []):
+        return None
+    return [
+        {
+            "id": tool_call["id"],
+            "type": "function",
+            "function": {
+                "name": tool_call["name"],
+                "arguments": json.dumps(tool_call["arguments"]),
+            },
+        }
+        for tool_call in record["tool_calls"]
+    ]
+
+
+def replay_chunks(record, latency=None):
+    """
+    Replay the chunks of a recording with simulated latency
+    ---
+    Args:
+    - record: Recorded request
+    - latency (default = None): Latency profile
+        - None / "none": Return chunks immediately.
+        - "recorded": Reproduce the recorded chunk timing.
+        - {"first_token_time": seconds, "tokens_per_second": rate}: Synthetic timing.
+
+    Returns:
+    - chunks: Generator of response text chunks
+    """
+
+    start_time = time.time()
+    for index, (offset, text) in enumerate(record["chunks"]):
+        # Target time of the chunk
+        if latency == "recorded":
+            target = offset
+        elif isinstance(latency, dict):
+            target = latency.get("first_token_time", 0.0)
+            if index > 0 and latency.get("tokens_per_second"):
+                target += index / latency["tokens_per_second"]
+        else:
+            target = 0.0
+
+        # Wait until the target time
+        delay = start_time + target - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        yield text
+
+
+class ReplayServer:
+    """
+    ReplayServer serves recordings through an OpenAI-compatible chat completions API
+    ---
+    NOTE: Point the openai or llama-edge provider to http://host:port/v1 to use it
+    """
+
+    def __init__(self, store, host="127.0.0.1", port=8090, latency=None):
+        """
+        Initialize the server
+        ---
+        Args:
+        - store: ReplayStore to serve
+        - host (default = "127.0.0.1"): Host to bind to
+        - port (default = 8090): Port to bind to
+        - latency (default = None): Latency profile (see replay_chunks)
+        """
+
+        self.logger = get_logger()
+        self.store = store
+        self.latency = latency
+        self.server = ThreadingHTTPServer((host, port), self._get_handler())
+
+    def _get_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                server.logger.debug(f"Replay server: {format % args}")
+
+            def _send_json(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if not self.path.rstrip("/").endswith("/models"):
+                    self._send_json(404, {"error": {"message": "Not found"}})
+                    return
+                models = sorted(set(r["model"] for r in server.store.records.values()))
+                self._send_json(
+                    200,
+                    {
+                        "object": "list",
+                        "data": [{"id": m, "object": "model"} for m in models],
+                    },
+                )
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "Not found"}})
+                    return
+
+                # Find recording
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length))
+                record = server.store.get(
+                    body.get("model"), body.get("messages"), body.get("tools")
+                )
+                if record is None:
+                    self._send_json(
+                        404, {"error": {"message": "Request was not recorded"}}
+                    )
+                    return
+                chunks = replay_chunks(record, server.latency)
+                tool_calls = format_tool_calls(record)
+                finish_reason = "stop" if tool_calls is None else "tool_calls"
+                base = {"id": record["key"][:24], "model": record["model"]}
+
+                # Non-streamed response
+                if not body.get("stream", False):
+                    self._send_json(
+                        200,
+                        {
+                            **base,
+                            "object": "chat.completion",
+                            "created": int(time.time()),
+                            "choices": [
+                                {
+                                    "index": 0,
+                                    "message": {
+                                        "role": "assistant",
+                                        "content": "".join(chunks),
+                                        **({"tool_calls": tool_calls} if tool_calls else {}),
+                                    },
+                                    "finish_reason": finish_reason,
+                                }
+                            ],
+                            "usage": record.get("usage"),
+                        },
+                    )
+                    return
+
+                # Streamed response
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+
+                def send_event(data):
+                    self.wfile.write(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                base = {**base, "object": "chat.completion.chunk", "created": int(time.time())}
+                try:
+                    for text in chunks:
+                        send_event(
+                            {
+                                **base,
+                                "choices": [
+                                    {"index": 0, "delta": {"content": text}, "finish_reason": None}
+                                ],
+                            }
+                        )
+                    if tool_calls is not None:
+                        deltas = [{"index": i, **c} for i, c in enumerate(tool_calls)]
+                        send_event(
+                            {
+                                **base,
+                                "choices": [
+                                    {"index": 0, "delta": {"tool_calls": deltas}, "finish_reason": None}
+                                ],
+                            }
+                        )
+                    send_event(
+                        {
+                            **base,
+                            "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+                            "usage": record.get("usage"),
+                        }
+                    )
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client stopped reading (e.g. a cancelled request)
+                    server.logger.debug("Replay server: client disconnected")
+
+        return Handler
+
+    def serve_forever(self):
+        """
+        Serve requests until shut down
+        ---
+        """
+
+        host, port = self.server.server_address
+        self.logger.info(f"Replay server listening on http://{host}:{port}/v1")
+        self.server.serve_forever()
+
+    def shutdown(self):
+        """
+        Stop serving requests
+        ---
+        """
+
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,326 @@
+import re
+import math
+import time
+from collections import Counter
+from .utils import get_logger
+from .tools import tools, ToolError
+from .cache import get_cache
+from .metrics import get_metrics
+from .arithmetic import UNITS, TENS, SCALES, parse_spoken_expression, ExpressionError
+
+# Patterns extracting the slots of each intent
+PATTERNS = {
+    "arithmetic": re.compile(
+        r"^(?:(?:what|how much) is|what's|calculate|compute|solve)\s+(?P<expression>.+)$"
+    ),
+    "weather": re.compile(
+        r"^(?:what is|what's|how is|how's)?\s*the (?:current )?weather(?: like)?(?: right now| today)?"
+        r"\s+(?:in|at|for)\s+(?P<location>[\w\s,.'-]+?)(?:\s+(?:right now|today|now))?$"
+    ),
+    "identity": re.compile(
+        r"^(?:what is your name|what's your name|tell me your name|who are you|what are you)(?: exactly| again)?$"
+    ),
+    "capability": re.compile(
+        r"^(?:what can you do|what are you able to do|how can you help(?: me)?|what do you know how to do|help me)$"
+    ),
+}
+
+# Weather prompts left to the LLM: other times than now (forecasts) and several locations
+WEATHER_FALLTHROUGH = re.compile(
+    r"\b(?:tomorrow|tonight|yesterday|morning|afternoon|evening|weekend|week|month|later|next|"
+    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday|and|or)\b|&"
+)
+
+# Short descriptions of what the assistant can do with each tool
+CAPABILITIES = {
+    "algebra": "do arithmetic",
+    "weather": "look up the current weather",
+    "search": "look up information on DBpedia",
+}
+
+# Spoken form of the equation operators
+SPOKEN_OPERATORS = {
+    "+": "plus",
+    "-": "minus",
+    "*": "times",
+    "/": "divided by",
+    "//": "floor divided by",
+    "%": "modulo",
+    "**": "to the power of",
+    "(": "open parenthesis",
+    ")": "close parenthesis",
+}
+
+# Example utterances of each intent, used to train the classifier
+EXAMPLES = {
+    "arithmetic": [
+        "what is fifty seven times three hundred twenty one",
+        "what is 12 plus 30",
+        "how much is two hundred divided by eight",
+        "calculate seven times eight",
+        "compute 3 minus 9",
+        "what's one thousand over four",
+        "what is twenty multiplied by thirty",
+        "solve five plus five",
+        "what is two to the power of ten",
+        "what is five squared",
+        "what is three point one four times two",
+    ],
+    "weather": [
+        "what is the weather in paris",
+        "what's the weather like in new york",
+        "how is the weather in ghent today",
+        "weather in london",
+        "what is the current weather at the eiffel tower",
+        "how's the weather in tokyo right now",
+    ],
+    "identity": [
+        "what is your name",
+        "who are you",
+        "what's your name",
+        "what are you",
+        "tell me your name",
+        "who are you exactly",
+        "what should i call you",
+        "who am i talking to",
+        "introduce yourself",
+        "are you a robot",
+    ],
+    "capability": [
+        "what can you do",
+        "how can you help me",
+        "what are you able to do",
+        "help me",
+        "what do you know how to do",
+    ],
+    "none": [
+        "who is the president of france",
+        "what is the capital of spain",
+        "tell me about albert einstein",
+        "how tall is the eiffel tower",
+        "what is the meaning of life",
+        "what is the weather going to be like next week",
+        "what will the weather be like tomorrow",
+        "why is the sky blue",
+        "what is a black hole",
+        "who wrote hamlet",
+        "how many people live in london",
+        "what time is it in tokyo",
+        "can you tell me a joke",
+        "what happened in nineteen sixty nine",
+        "how old is the universe",
+    ],
+}
+
+
+class IntentClassifier:
+    """
+    IntentClassifier is a small multinomial naive Bayes classifier over words of an utterance
+    ---
+    NOTE: Numbers (digits or spoken) are mapped to a single token, so arithmetic generalizes to unseen numbers
+    """
+
+    def __init__(self, examples=EXAMPLES):
+        """
+        Train the classifier
+        ---
+        Args:
+        - examples (default = EXAMPLES): Dictionary of intent to example utterances
+        """
+
+        self.word_counts = {intent: Counter() for intent in examples}
+        self.priors = {}
+        total = sum(len(utterances) for utterances in examples.values())
+        for intent, utterances in examples.items():
+            self.priors[intent] = math.log(len(utterances) / total)
+            for utterance in utterances:
+                self.word_counts[intent].update(self.tokenize(utterance))
+        self.vocabulary = set().union(*self.word_counts.values())
+        self.totals = {i: sum(c.values()) for i, c in self.word_counts.items()}
+
+    @staticmethod
+    def tokenize(text):
+        words = re.findall(r"\d+(?:\.\d+)?|[a-z']+", text.lower())
+        return [
+            "<num>" if w[0].isdigit() or w in UNITS or w in TENS or w in SCALES else w
+            for w in words
+        ]
+
+    def predict(self, text):
+        """
+        Classify an utterance
+        ---
+        Args:
+        - text: Utterance
+
+        Returns:
+        - intent: Most likely intent
+        - confidence: Posterior probability of the intent
+        """
+
+        # Log likelihoods with Laplace smoothing
+        words = self.tokenize(text)
+        scores = {}
+        for intent, counts in self.word_counts.items():
+            denominator = self.totals[intent] + len(self.vocabulary) + 1
+            scores[intent] = self.priors[intent] + sum(
+                math.log((counts[w] + 1) / denominator) for w in words
+            )
+
+        # Normalize into posteriors
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, 1 / norm
+
+
+class Router:
+    """
+    Router answers high-confidence intents locally, before the prompt reaches the LLM
+    ---
+    NOTE: An intent is only handled when the classifier is confident and its pattern extracts the slots,
+    otherwise (or when a tool fails) the prompt falls through to the LLM.
+    """
+
+    def __init__(self, config):
+        """
+        Initialize the router
+        ---
+        Args:
+        - config: Configuration dictionary
+            - router_threshold: Minimum classifier confidence to handle an intent locally.
+            - router_identity_response: Response to identity questions.
+            - llm_tools: Tools available to the assistant (null = all).
+            - llm_tool_timeout: Deadline in seconds of tool calls.
+        """
+
+        # Logger
+        self.logger = get_logger()
+        self.logger.debug("Configuring router")
+
+        # Config
+        self.threshold = config.get("router_threshold", 0.6)
+        self.identity_response = config.get(
+            "router_identity_response", "I am your offline voice assistant."
+        )
+        self.tool_timeout = config.get("llm_tool_timeout", 15)
+
+        # Tools, sharing the tool result cache
+        tool_selection = config.get("llm_tools") or list(tools.keys())
+        if not config.get("llm_use_tools", True):
+            tool_selection = []
+        tool_cache = get_cache(config, "tool")
+        self.tools = {}
+        for label in tool_selection:
+            self.tools[label] = tools[label]()
+            self.tools[label].configure(config)
+            self.tools[label].set_cache(
+                tool_cache, config.get("tool_cache_negative_ttl", 3600)
+            )
+
+        # Intent classifier
+        self.classifier = IntentClassifier()
+
+    def route(self, prompt):
+        """
+        Answer a prompt locally, if it has a high-confidence intent
+        ---
+        Args:
+        - prompt: User prompt
+
+        Returns:
+        - response: Response, or None if the prompt should be sent to the LLM
+        """
+
+        metrics = get_metrics()
+        metrics.increment("router_requests")
+
+        # Classify intent
+        text = re.sub(r"\s+", " ", prompt.lower()).strip().rstrip("?.!").strip()
+        intent, confidence = self.classifier.predict(text)
+        self.logger.debug(f"Router intent: {intent} ({confidence:.2f})")
+        if intent == "none" or confidence < self.threshold:
+            return None
+
+        # Extract slots & handle intent
+        match = PATTERNS[intent].search(text)
+        if match is None:
+            return None
+        try:
+            response = getattr(self, f"_handle_{intent}")(match)
+        except ToolError as err:
+            self.logger.warning(f"Router {intent} failed, falling back to LLM: {err}")
+            return None
+        if response is None:
+            return None
+
+        metrics.increment("router_answered", tags={"intent": intent})
+        self.logger.info(f"Routed {intent} locally:\n{response}")
+        self.logger.debug(f"Router: {self.stats()}")
+        return response
+
+    def _handle_arithmetic(self, match):
+        if "algebra" not in self.tools:
+            return None
+        try:
+            equation = parse_spoken_expression(match.group("expression"))
+        except ExpressionError:
+            return None
+        # Require an operation (e.g. not "what is twelve")
+        if not re.search(r"\d\s*[+\-*/%]", equation):
+            return None
+        result = self.tools["algebra"].run(
+            equation, deadline=time.time() + self.tool_timeout
+        )
+        spoken = " ".join(SPOKEN_OPERATORS.get(term, term) for term in equation.split())
+        return f"{spoken} is {result}."
+
+    def _handle_weather(self, match):
+        if "weather" not in self.tools:
+            return None
+        if WEATHER_FALLTHROUGH.search(match.string):
+            return None
+        location = match.group("location").strip(" ,.")
+        weather_data = self.tools["weather"].run(
+            (location,), deadline=time.time() + self.tool_timeout, method="lookup"
+        )[0]
+        descriptions = {
+            "temperature_2m": "temperature",
+            "relative_humidity_2m": "relative humidity",
+            "precipitation_probability": "chance of precipitation",
+            "precipitation": "precipitation",
+            "wind_speed_10m": "wind speed",
+        }
+        values = [
+            f"{label} {weather_data[key]}"
+            for key, label in descriptions.items()
+            if key in weather_data
+        ]
+        if not len(values):
+            return None
+        return f"The current weather in {location.title()}: {', '.join(values)}."
+
+    def _handle_identity(self, match):
+        return self.identity_response
+
+    def _handle_capability(self, match):
+        skills = [CAPABILITIES[label] for label in self.tools if label in CAPABILITIES]
+        if not len(skills):
+            return "I can chat with you and answer your questions."
+        return f"I can answer your questions and {', '.join(skills[:-1])}{' and ' if len(skills) > 1 else ''}{skills[-1]}."
+
+    def stats(self):
+        """
+        Routing statistics
+        ---
+        Returns:
+        - stats: Dictionary with the number of requests, requests answered locally and the fraction answered without an LLM call
+        """
+
+        metrics = get_metrics()
+        requests = metrics.get_counter("router_requests")
+        answered = metrics.get_counter("router_answered")
+        return {
+            "requests": requests,
+            "answered": answered,
+            "answered_ratio": answered / requests if requests else 0.0,
+        }
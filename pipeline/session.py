@@ -0,0 +1,139 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .utils import get_logger
+
+
+class HTTPSession:
+    """
+    HTTPSession wraps a pooled keep-alive requests session with timeouts and bounded retries
+    ---
+    """
+
+    def __init__(self, config, prefix="llm"):
+        """
+        Initialize the session
+        ---
+        Args:
+        - config: Configuration dictionary
+            - {prefix}_connect_timeout: Seconds to wait for a connection to be established.
+            - {prefix}_read_timeout: Seconds to wait between bytes received from the server.
+            - {prefix}_max_retries: Number of retries for failed connections and transient status codes.
+            - {prefix}_retry_backoff: Backoff factor (seconds) between retries.
+            - {prefix}_pool_size: Number of connections kept alive per host.
+        - prefix (default = "llm"): Prefix of the configuration keys
+        """
+
+        # Logger
+        self.logger = get_logger()
+        self.logger.debug(f"Configuring HTTP session ({prefix})")
+
+        # Config
+        self.prefix = prefix
+        self.connect_timeout = config.get(f"{prefix}_connect_timeout", 5)
+        self.read_timeout = config.get(f"{prefix}_read_timeout", 120)
+        self.max_retries = config.get(f"{prefix}_max_retries", 2)
+        self.retry_backoff = config.get(f"{prefix}_retry_backoff", 0.5)
+        self.pool_size = config.get(f"{prefix}_pool_size", 10)
+
+        # Only retry failures where the request was not processed:
+        # connection errors and transient status codes (never read timeouts)
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,
+            status=self.max_retries,
+            backoff_factor=self.retry_backoff,
+            status_forcelist=(429, 502, 503, 504),
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+
+        # Pooled session
+        self.adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+    @property
+    def timeout(self):
+        """
+        Timeout tuple passed to requests
+        ---
+        Returns:
+        - timeout: (connect timeout, read timeout)
+        """
+        return (self.connect_timeout, self.read_timeout)
+
+    def request(self, method, url, **kwargs):
+        """
+        Perform a request over the pooled session
+        ---
+        Args:
+        - method: HTTP method
+        - url: URL to request
+        - **kwargs: Keyword arguments passed to requests
+
+        Returns:
+        - response: requests Response
+        """
+
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """
+        Connection reuse statistics of the session
+        ---
+        Returns:
+        - stats: Dictionary with number of requests, new connections and reused connections
+        """
+
+        num_requests = 0
+        num_connections = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            num_requests += pool.num_requests
+            num_connections += pool.num_connections
+        return {
+            "requests": num_requests,
+            "connections": num_connections,
+            "reused": max(num_requests - num_connections, 0),
+        }
+
+
+# Shared sessions by configuration prefix
+sessions = {}
+sessions_lock = threading.Lock()
+
+
+def get_session(config, prefix="llm"):
+    """
+    Get the shared HTTP session for a configuration prefix
+    ---
+    Args:
+    - config: Configuration dictionary
+    - prefix (default = "llm"): Prefix of the configuration keys
+
+    Returns:
+    - session: Shared HTTPSession instance
+    """
+
+    with sessions_lock:
+        if prefix not in sessions:
+            sessions[prefix] = HTTPSession(config, prefix)
+        return sessions[prefix]
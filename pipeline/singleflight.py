@@ -0,0 +1,125 @@
+import time
+import threading
+from .utils import get_logger
+from .metrics import get_metrics
+
+
+class Flight:
+    """
+    Flight keeps track of one in-flight call shared by concurrent callers
+    ---
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    SingleFlight coalesces concurrent calls with identical keys into a single call
+    ---
+    NOTE: Callers arriving while a call with the same key is in flight wait for its result
+    (or exception) instead of issuing their own call. Finished calls are not cached.
+    """
+
+    # Seconds between interrupt checks of waiting callers
+    poll_interval = 0.05
+
+    def __init__(self, name, timeout=None):
+        """
+        Initialize the single-flight group
+        ---
+        Args:
+        - name: Name of the group, used to tag metrics
+        - timeout (default = None): Default seconds a caller waits for an in-flight call (None = no limit)
+        """
+
+        self.logger = get_logger()
+        self.name = name
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def do(self, key, function, timeout=None, interrupt=None):
+        """
+        Call a function, or wait for the in-flight call with the same key
+        ---
+        Args:
+        - key: Hashable key identifying the call
+        - function: Function without arguments performing the call
+        - timeout (default = None): Seconds to wait for an in-flight call, defaults to the group timeout
+        - interrupt (default = None): Function checked while waiting for an in-flight call, which raises to stop waiting
+
+        Returns:
+        - result: Result of the (shared) call
+
+        Raises:
+        - TimeoutError: If the in-flight call did not finish in time
+        """
+
+        metrics = get_metrics()
+        tags = {"group": self.name}
+        metrics.increment("singleflight_requests", tags=tags)
+
+        # Join the in-flight call, or become its leader
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight()
+                self.flights[key] = flight
+            else:
+                flight.waiters += 1
+
+        # Leader performs the call and shares the outcome
+        if leader:
+            try:
+                flight.result = function()
+            except BaseException as err:
+                flight.error = err
+            finally:
+                with self.lock:
+                    del self.flights[key]
+                flight.done.set()
+            if flight.waiters:
+                self.logger.debug(
+                    f"Shared {self.name} call with {flight.waiters} waiting callers"
+                )
+        # Others wait for the leader
+        else:
+            metrics.increment("singleflight_coalesced", tags=tags)
+            timeout = self.timeout if timeout is None else timeout
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not flight.done.is_set():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"Timed out waiting for in-flight {self.name} call")
+                if interrupt is not None:
+                    interrupt()
+                    remaining = min(remaining or self.poll_interval, self.poll_interval)
+                flight.done.wait(remaining)
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def stats(self):
+        """
+        Coalescing statistics of the group
+        ---
+        Returns:
+        - stats: Dictionary with the number of requests, coalesced requests and the coalescing ratio
+        """
+
+        metrics = get_metrics()
+        tags = {"group": self.name}
+        requests = metrics.get_counter("singleflight_requests", tags)
+        coalesced = metrics.get_counter("singleflight_coalesced", tags)
+        return {
+            "requests": requests,
+            "coalesced": coalesced,
+            "coalescing_ratio": coalesced / requests if requests else 0.0,
+        }
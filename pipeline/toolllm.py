@@ -1,8 +1,28 @@
 import json
-import re
-from .utils import get_logger
-from .tools import tools, ToolError
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from .utils import get_logger, count_tokens, truncate_text
+from .tools import tools, ToolError, ToolContext, tool_context
 from .llm import LLM
+from .cache import get_cache
+from .jsonstream import JSONStreamParser
+from .compaction import LoopContext, compact_messages
+from .metrics import get_metrics
+
+
+class Speculation:
+    """
+    Speculation is a tool call started before the LLM finished generating it
+    ---
+    """
+
+    def __init__(self, future, cancel, start_time):
+        self.future = future
+        self.cancel = cancel
+        self.start_time = start_time
+        self.end_time = None
 
 
 class ToolLLM:
@@ -22,33 +42,173 @@ class ToolLLM:
         if self.tool_selection is None:
             self.tool_selection = list(tools.keys())
 
-        # Initialize tools
+        # Initialize tools, sharing one result cache
+        self.tool_cache = get_cache(config, "tool")
         self.tools = {}
         for label in self.tool_selection:
             self.tools[label] = tools[label]()
+            self.tools[label].configure(config)
+            self.tools[label].set_cache(
+                self.tool_cache, config.get("tool_cache_negative_ttl", 3600)
+            )
 
         # Generate tool prompt
         self.tools_prompt = self._get_tools_prompt()
 
+        # Context compaction: tool result lengths & token budget of the tool loop
+        self.tool_max_chars = config.get("llm_tool_max_chars") or {}
+        self.context_max_tokens = config.get("llm_context_max_tokens")
+
+        # Parallel tool execution, within the latency budget of the request
+        self.tool_timeout = config.get("llm_tool_timeout", 15)
+        self.request_budget = config.get("llm_request_budget")
+        self.executor = ThreadPoolExecutor(
+            max_workers=config.get("llm_tool_workers", 4),
+            thread_name_prefix="tool",
+        )
+
+        # Start read-only tools while the LLM is still generating the tool call
+        self.speculate = config.get("llm_speculative_tools", False)
+
+        # Tool calling mode: tools described in the prompt, or passed as native function schemas
+        self.tool_mode = config.get("llm_tool_mode", "prompt")
+        self.tool_schemas = [
+            self.tools[label].get_schema(label) for label in self.tool_selection
+        ]
+
+        # Static system prompt, shared by all tool loop iterations
+        if self.tool_mode == "native":
+            self.system_prompt = f"{self.llm.model.system_message}\n---\n"
+            self.system_prompt += "Use the tools to look up information you need. "
+            self.system_prompt += 'Once you have enough information, respond to the user directly or with the "answer" tool.'
+        else:
+            self.system_prompt = f"{self.llm.model.system_message}\n---\n{self.tools_prompt}"
+            self.llm.warmup(self.system_prompt)
+        self.system_tokens = count_tokens(self.system_prompt)
+
     def _get_tools_prompt(self):
         tools_prompt = "Here are the tools you can use:\n"
         for label in self.tool_selection:
             tools_prompt += f"- {label}: {self.tools[label]}\n"
         tools_prompt += "You MUST always use one of the tools.\n"
-        tools_prompt += 'Answers MUST be formatted in JSON format with "tool": name-of-tool and "arg": arg-value keys'
-        tools_prompt += "\n---\n"
+        tools_prompt += 'Answers MUST be formatted in JSON format with "tool": name-of-tool and "arg": arg-value keys.\n'
+        tools_prompt += "To use several independent tools at once, answer with a JSON list of such objects.\n"
+        tools_prompt += 'Once you have enough information, make use of the "answer" tool to provide a response to the user.'
         return tools_prompt
 
     def _parse_llm_result(self, result):
-        # Extract JSON string from LLM reply
-        pattern = "\{(?:[^{}]|)*\}"
-        matches = re.findall(pattern, result)
-        assert len(matches), "Response must be in JSON format."
+        # Extract the first JSON value from LLM reply (a list of tool calls, or a single tool call)
+        parser = JSONStreamParser()
+        parser.feed(result)
+        if not parser.done:
+            if parser.invalid:
+                raise json.JSONDecodeError("No valid JSON value", result, 0)
+            raise AssertionError("Response must be in JSON format.")
+
+        # Parse JSON value into a list of dictionaries
+        calls = parser.value if isinstance(parser.value, list) else [parser.value]
+        assert len(calls) and all(
+            isinstance(call, dict) for call in calls
+        ), "Response must be a JSON object with tool and arg keys."
+        return [self._parse_tool_call(call) for call in calls]
+
+    def _generate_tool_call(
+        self, prompt, history, tags=None, tools_called=None, speculation=None
+    ):
+        """
+        Prompt the LLM for a tool call, stopping generation once the JSON value is complete
+        ---
+        Args:
+        - prompt: Prompt to send to the LLM
+        - history: Previous chat messages to send before the prompt
+        - tags: Dictionary of extra metric tags
+        - tools_called (default = None): List of (tool name, argument) pairs called so far, which are not started speculatively
+        - speculation (default = None): Dictionary to which tool calls started speculatively are added, by (tool name, argument)
+
+        Returns:
+        - result: LLM response text, up to the end of the JSON value
+        """
+
+        parser = JSONStreamParser()
+        chunks = self.llm.stream(
+            prompt, system_prompt=self.system_prompt, history=history, tags=tags
+        )
+        try:
+            for chunk in chunks:
+                if parser.feed(chunk):
+                    break
+                if speculation is not None and self.speculate:
+                    self._speculate(parser.partial(), tools_called or [], speculation)
+        finally:
+            chunks.close()
+        return parser.text
+
+    def _speculate(self, value, tools_called, speculation):
+        """
+        Start the read-only tool calls of a partially generated response
+        ---
+        NOTE: A call is only started once its tool name and argument strings are complete.
+        Calls already made in this tool loop are skipped, as the loop would only warn about them.
+
+        Args:
+        - value: Partial JSON value of the response (see JSONStreamParser.partial)
+        - tools_called: List of (tool name, argument) pairs called so far
+        - speculation: Dictionary of speculative tool calls by (tool name, argument), updated in place
+        """
+
+        calls = value if isinstance(value, list) else [value]
+        for call in calls:
+            if not isinstance(call, dict):
+                continue
+            try:
+                tool_name, tool_arg = self._parse_tool_call(call)
+            except AssertionError:
+                continue
+            if (
+                (tool_name, tool_arg) in speculation
+                or (tool_name, tool_arg) in tools_called
+                or not self.tools[tool_name].read_only
+            ):
+                continue
+
+            # Run tool in the background (with its own copy of the calls so far)
+            self.logger.debug(f"Speculatively running tool {tool_name}({tool_arg})")
+            get_metrics().increment("tool_speculations", tags={"tool": tool_name})
+            cancel = threading.Event()
+            speculative = Speculation(None, cancel, time.time())
+
+            def run(tool_name=tool_name, tool_arg=tool_arg, speculative=speculative):
+                try:
+                    return self._run_tool(
+                        tool_name,
+                        tool_arg,
+                        list(tools_called),
+                        time.time() + self.tool_timeout,
+                        speculative.cancel,
+                    )
+                finally:
+                    speculative.end_time = time.time()
+
+            speculative.future = self.executor.submit(contextvars.copy_context().run, run)
+            speculation[(tool_name, tool_arg)] = speculative
 
-        # Parse JSON string into a dictionary
-        result = json.loads(matches[0])
-        tool_name = result.get("tool", "")
-        tool_arg = result.get("arg", "")
+    def _discard_speculation(self, speculation):
+        """
+        Cancel speculative tool calls which the LLM did not make
+        ---
+        Args:
+        - speculation: Dictionary of speculative tool calls by (tool name, argument), emptied
+        """
+
+        for (tool_name, tool_arg), speculative in speculation.items():
+            self.logger.debug(f"Discarding speculative tool call {tool_name}({tool_arg})")
+            get_metrics().increment("tool_speculation_misses", tags={"tool": tool_name})
+            speculative.cancel.set()
+        speculation.clear()
+
+    def _parse_tool_call(self, call):
+        tool_name = call.get("tool", "")
+        tool_arg = call.get("arg", "")
 
         # Perform assertions
         assert (
@@ -58,69 +218,367 @@ class ToolLLM:
 
         return tool_name, tool_arg
 
-    def __call__(self, prompt: str, max_iterations: int = 5) -> str:
-        # Keep track of response, context & whether we are finished
+    def _step(self, result, tools_called, speculation=None):
+        """
+        Handle one LLM result of the tool loop: parse it and run the requested tool
+        ---
+        Args:
+        - result: LLM response text
+        - tools_called: List of (tool name, argument) pairs called so far (updated in place)
+        - speculation (default = None): Dictionary of speculative tool calls by (tool name, argument), matching calls are taken from it
+
+        Returns:
+        - response: Final response, or None if the loop should continue
+        - prompt: Next prompt (tool results or warning) for the LLM, with compacted tool results
+        - full_prompt: Next prompt with the full tool results
+        """
+
+        # Parse LLM response
+        try:
+            calls = self._parse_llm_result(result)
+        # Catch Exceptions and re-prompt LLM
+        except AssertionError as err:
+            warning_message = f"{err}"
+            self.logger.warning(warning_message)
+            return None, f"WARNING: {warning_message}", f"WARNING: {warning_message}"
+        except json.JSONDecodeError as err:
+            warning_message = "Response must be in valid JSON format."
+            self.logger.warning(warning_message)
+            return None, f"WARNING: {warning_message}", f"WARNING: {warning_message}"
+
+        # Check if we are done
+        answers = [tool_arg for tool_name, tool_arg in calls if tool_name == "answer"]
+        calls = [call for call in calls if call[0] != "answer"]
+        if len(answers) and not len(calls):
+            return answers[0], None, None
+
+        # Run tools
+        # NOTE: An answer given together with other tool calls was written without their results,
+        # so the tools are run first and the LLM is asked to answer again
+        if len(answers):
+            self.logger.warning(
+                f"Ignoring answer given together with tool calls {calls}: {answers[0]}"
+            )
+        calls = list(dict.fromkeys(calls))
+        results = self._run_tools(calls, tools_called, speculation)
+        prompts = []
+        for compact in (True, False):
+            prompt = "\n".join(
+                self._format_result(tool_name, tool_arg, text, success, compact)
+                for (tool_name, tool_arg), (text, success) in zip(calls, results)
+            )
+            if len(answers):
+                prompt += '\nYour answer was ignored, because it was given before these tool results. Make use of the "answer" tool on its own to respond to the user.'
+            elif any(success for text, success in results):
+                prompt += '\nOnce you have enough information, make use of the "answer" tool to provide a response to the user.'
+            prompts.append(prompt)
+        return None, *prompts
+
+    def _format_result(self, tool_name, tool_arg, text, success, compact=True):
+        """
+        Format the result of a tool call for the LLM
+        ---
+        Args:
+        - tool_name: Name of the tool
+        - tool_arg: Argument of the tool
+        - text: Tool result, or warning message if the call failed
+        - success: Whether the tool returned a result
+        - compact (default = True): Whether to truncate the result to the length set for the tool (llm_tool_max_chars)
+
+        Returns:
+        - message: Message for the LLM
+        """
+
+        if not success:
+            return text
+        if compact:
+            text = truncate_text(text, self.tool_max_chars.get(tool_name))
+        return f'Tool "{tool_name}" with argument "{tool_arg}" returned "{text}"'
+
+    def _run_tools(self, calls, tools_called, speculation=None):
+        """
+        Run independent tool calls concurrently
+        ---
+        NOTE: All calls share one deadline of llm_tool_timeout seconds, identical calls run once
+
+        Args:
+        - calls: List of (tool name, argument) pairs
+        - tools_called: List of (tool name, argument) pairs called so far (updated in place)
+        - speculation (default = None): Dictionary of speculative tool calls by (tool name, argument), matching calls are taken from it
+
+        Returns:
+        - results: List of (result or warning message, success) pairs, in the order of the calls
+        """
+
+        # Drop duplicate calls
+        unique_calls = list(dict.fromkeys(calls))
+
+        # Each call gets the tool timeout, capped by the request budget (see ToolContext)
+        deadline = time.time() + self.tool_timeout
+
+        # Take over speculative calls the LLM did make
+        speculated = {}
+        for call in unique_calls:
+            if speculation is not None and call in speculation and call not in tools_called:
+                speculated[call] = speculation.pop(call)
+
+        # A single call runs inline
+        if len(unique_calls) <= 1 and not len(speculated):
+            results = [
+                self._run_tool(tool_name, tool_arg, tools_called, deadline)
+                for tool_name, tool_arg in unique_calls
+            ]
+            return [results[0] for _ in calls]
+
+        # Submit calls to the thread pool (each gets its own copy of the calls so far)
+        cancel = threading.Event()
+        futures = []
+        for call in unique_calls:
+            if call in speculated:
+                futures.append(speculated[call].future)
+                continue
+            tool_name, tool_arg = call
+            futures.append(
+                self.executor.submit(
+                    contextvars.copy_context().run,
+                    self._run_tool,
+                    tool_name,
+                    tool_arg,
+                    list(tools_called),
+                    deadline,
+                    cancel,
+                )
+            )
+
+        # Collect results within the deadline, in order
+        results = {}
+        metrics = get_metrics()
+        for call, future in zip(unique_calls, futures):
+            tool_name, tool_arg = call
+            if call in speculated:
+                # Latency hidden behind generation: the speculative call's head start (or its whole duration)
+                speculative = speculated[call]
+                end_time = speculative.end_time or time.time()
+                metrics.increment("tool_speculation_hits", tags={"tool": tool_name})
+                metrics.observe(
+                    "tool_speculation_saved",
+                    end_time - speculative.start_time,
+                    tags={"tool": tool_name},
+                )
+            try:
+                results[call] = future.result(timeout=max(deadline - time.time(), 0))
+            except TimeoutError:
+                warning_message = f'Tool "{tool_name}" with argument "{tool_arg}" timed out.'
+                self.logger.warning(warning_message)
+                results[call] = f"WARNING: {warning_message}", False
+            if results[call][1]:
+                tools_called.append(call)
+
+        # Stop calls which did not finish in time
+        cancel.set()
+        for speculative in speculated.values():
+            speculative.cancel.set()
+        return [results[call] for call in calls]
+
+    def _run_tool(self, tool_name, tool_arg, tools_called, deadline=None, cancel=None):
+        """
+        Run a tool requested by the LLM
+        ---
+        Args:
+        - tool_name: Name of the tool
+        - tool_arg: Argument of the tool
+        - tools_called: List of (tool name, argument) pairs called so far (updated in place)
+        - deadline (default = None): Time (time.time()) by which the tool must finish
+        - cancel (default = None): threading.Event set to cancel the tool call
+
+        Returns:
+        - text: Tool result, or warning message for the LLM
+        - success: Whether the tool returned a result
+        """
+
+        # Check if tool has already been called with the same argument
+        if (tool_name, tool_arg) in tools_called:
+            warning_message = f'Tool "{tool_name}" with argument "{tool_arg}" has already been called. Try to make use of the "answer" tool.'
+            self.logger.warning(warning_message)
+            return f"WARNING: {warning_message}", False
+
+        # Run tool
+        try:
+            self.logger.info(f"Running tool {tool_name}({tool_arg})")
+            tool_result = self.tools[tool_name].run(
+                tool_arg, deadline=deadline, cancel=cancel
+            )
+            tools_called.append((tool_name, tool_arg))
+        except ToolError as err:
+            warning_message = f'Tool "{tool_name}" raised an error: {err}'
+            self.logger.warning(warning_message)
+            return f"WARNING: {warning_message}", False
+        finally:
+            if self.tool_cache is not None:
+                self.logger.debug(f"Tool cache: {self.tool_cache.stats()}")
+
+        return f"{tool_result}", True
+
+    def _call_native(self, prompt, max_iterations, history):
+        """
+        Run the tool loop with native function calling
+        ---
+        NOTE: Tool calls are returned as structured data, so no iterations are spent on re-prompting for valid JSON.
+        The messages are compacted to llm_context_max_tokens, like the prompts of the prompt-based loop.
+
+        Args:
+        - prompt: Prompt to respond to
+        - max_iterations: Maximum number of tool loop iterations
+        - history: Previous chat messages of the conversation
+
+        Returns:
+        - response: Final response
+        """
+
+        # Message history: system prompt, conversation, prompt, then exchanges of tool calls & results
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            *history,
+            {"role": "user", "content": prompt},
+        ]
+        exchanges = []
+        schema_tokens = count_tokens(json.dumps(self.tool_schemas))
+        tools_called = []
+
+        for iteration in range(max_iterations):
+            # Prompt LLM
+            result = self.llm.call_tools(
+                compact_messages(messages, exchanges, self.context_max_tokens, schema_tokens),
+                self.tool_schemas,
+                tags={"iteration": iteration},
+            )
+            tool_calls = result["tool_calls"]
+
+            # Respond directly
+            if not len(tool_calls):
+                return result.get("content") or ""
+
+            # Respond with the answer tool
+            # NOTE: An answer given together with other tool calls is ignored, like in the prompt-based loop
+            answers = [tool_call for tool_call in tool_calls if tool_call["name"] == "answer"]
+            if len(answers) == len(tool_calls):
+                return str(next(iter(answers[0]["arguments"].values()), ""))
+            if len(answers):
+                self.logger.warning(
+                    f"Ignoring answer given together with tool calls: {answers[0]['arguments']}"
+                )
+
+            # Run tools
+            exchange = [
+                {
+                    "role": "assistant",
+                    "content": result.get("content"),
+                    "tool_calls": [
+                        {
+                            "id": tool_call["id"],
+                            "type": "function",
+                            "function": {
+                                "name": tool_call["name"],
+                                "arguments": json.dumps(tool_call["arguments"]),
+                            },
+                        }
+                        for tool_call in tool_calls
+                    ],
+                }
+            ]
+            valid_calls = []
+            tool_messages = {}
+            for tool_call in tool_calls:
+                tool_name = tool_call["name"]
+                tool_arg = next(iter(tool_call["arguments"].values()), "")
+                if tool_name == "answer":
+                    tool_messages[tool_call["id"]] = 'WARNING: Answer ignored, because it was given before the other tool results. Make use of the "answer" tool on its own to respond to the user.'
+                elif tool_name not in self.tools:
+                    tool_messages[tool_call["id"]] = f"WARNING: Unknown tool {tool_name}"
+                elif not isinstance(tool_arg, str) or not len(tool_arg):
+                    tool_messages[tool_call["id"]] = "WARNING: Tool argument must be a string of non-zero length."
+                else:
+                    valid_calls.append((tool_call["id"], (tool_name, tool_arg)))
+            results = self._run_tools([call for _, call in valid_calls], tools_called)
+            for (tool_call_id, call), (text, success) in zip(valid_calls, results):
+                tool_messages[tool_call_id] = self._format_result(*call, text, success)
+            for tool_call in tool_calls:
+                exchange.append(
+                    {
+                        "role": "tool",
+                        "tool_call_id": tool_call["id"],
+                        "content": tool_messages[tool_call["id"]],
+                    }
+                )
+            exchanges.append(exchange)
+
+        # Loop did not return - warning
+        self.logger.warning(
+            f"Max iterations ({max_iterations}) reached. Falling back to pure LLM."
+        )
+        return self.llm(prompt, history=history, tags={"iteration": "fallback"})
+
+    def _get_request_context(self):
+        """
+        Build the tool context of a request
+        ---
+        Returns:
+        - context: ToolContext with the deadline of the request budget (llm_request_budget)
+        """
+
+        deadline = None
+        if self.request_budget is not None:
+            deadline = time.time() + self.request_budget
+        return ToolContext(deadline, parent=tool_context.get())
+
+    def __call__(
+        self, prompt: str, max_iterations: int = 5, history: list = None
+    ) -> str:
+        # Tool calls of the request share its latency budget
+        token = tool_context.set(self._get_request_context())
+        try:
+            return self._run_loop(prompt, max_iterations, history)
+        finally:
+            tool_context.reset(token)
+
+    def _run_loop(self, prompt, max_iterations, history):
+        # Keep track of response, message history & tools called
+        # NOTE: The tool loop extends the (conversation) history it is given
+        conversation = list(history or [])
+        if self.tool_mode == "native":
+            return self._call_native(prompt, max_iterations, conversation)
         response = ""
-        context = ""
+        context = LoopContext(conversation, self.context_max_tokens, self.system_tokens)
         initial_prompt = prompt
+        full_prompt = prompt
         tools_called = []
 
         # Prompt the LLM until we have a final response
+        # NOTE: Every iteration appends to the message history, so each prompt extends the previous one,
+        # until repeated warnings are collapsed or the context is compacted to its token budget
         for iteration in range(max_iterations):
             try:
-                # Build system prompt
-                prompt = f"{self.llm.model.system_message}\n---\n{self.tools_prompt}"
-                if len(context) > 0:
-                    prompt += (
-                        f"By using the tools you have obtained this information:\n"
-                    )
-                    prompt += f"{context}"
-                    prompt += 'Once you have enough information, make use of the "answer" tool to provide a response to the user.'
-                    prompt += "\n---\n"
-                # Add actual prompt
-                prompt += initial_prompt
-
                 # Prompt LLM
-                result = self.llm(prompt)
-
-                # Parse LLM response
+                history, prompt = context.build(prompt, full_prompt)
+                speculation = {}
                 try:
-                    tool_name, tool_arg = self._parse_llm_result(result)
-                # Catch Exceptions and re-prompt LLM
-                except AssertionError as err:
-                    warning_message = f"{err}"
-                    context += f"WARNING: {warning_message}\n"
-                    self.logger.warning(warning_message)
-                    continue
-                except json.JSONDecodeError as err:
-                    warning_message = "Response must be in valid JSON format."
-                    context += f"WARNING: {warning_message}\n"
-                    self.logger.warning(warning_message)
-                    continue
-
-                # Check if we are done
-                if tool_name == "answer":
-                    response = tool_arg
-                    break
-
-                # Check if tool has already been called with the same argument
-                if (tool_name, tool_arg) in tools_called:
-                    warning_message = f'Tool "{tool_name}" with argument "{tool_arg}" has already been called. Try to make use of the "answer" tool.'
-                    context += f"WARNING: {warning_message}\n"
-                    self.logger.warning(warning_message)
-                    continue
+                    result = self._generate_tool_call(
+                        prompt,
+                        history,
+                        tags={"iteration": iteration},
+                        tools_called=tools_called,
+                        speculation=speculation,
+                    )
+                    context.add(result)
 
-                # Run tool
-                try:
-                    self.logger.info(f"Running tool {tool_name}({tool_arg})")
-                    tool_result = self.tools[tool_name](tool_arg)
-                    tools_called.append((tool_name, tool_arg))
-                    context += f'Tool "{tool_name}" with argument "{tool_arg}" returned "{tool_result}"\n'
-                except ToolError as err:
-                    warning_message = f'Tool "{tool_name}" raised an error: {err}'
-                    context += f"WARNING: {warning_message}\n"
-                    self.logger.warning(warning_message)
-                    continue
+                    # Parse LLM response & run tool (taking over matching speculative calls)
+                    response, prompt, full_prompt = self._step(
+                        result, tools_called, speculation
+                    )
+                finally:
+                    self._discard_speculation(speculation)
+                if response is not None:
+                    break
 
             except Exception as e:
                 self.logger.error(e)
@@ -131,6 +589,25 @@ class ToolLLM:
                 f"Max iterations ({max_iterations}) reached. Falling back to pure LLM."
             )
             # Return pure LLM response to initial prompt
-            return self.llm(initial_prompt)
+            return self.llm(
+                initial_prompt, history=conversation, tags={"iteration": "fallback"}
+            )
 
         return response
+
+    def stream(self, prompt: str, max_iterations: int = 5, history: list = None):
+        """
+        Run the tool loop and yield the final response
+        ---
+        NOTE: Intermediate tool calls are not spoken, so the response is yielded once complete
+
+        Args:
+        - prompt: Prompt to respond to
+        - max_iterations: Maximum number of tool loop iterations
+        - history: Previous chat messages of the conversation
+
+        Returns:
+        - chunks: Generator of response text chunks
+        """
+
+        yield self(prompt, max_iterations=max_iterations, history=history)
@@ -3,9 +3,26 @@ import sys
 import numpy as np
 import requests
 import re
+import time
+import asyncio
 import inspect
+import threading
+import contextvars
 from urllib import parse
-from .utils import get_logger
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from .utils import get_logger, truncate_text
+from .singleflight import SingleFlight
+from .cache import Cache
+from .metrics import get_metrics
+from .gazetteer import get_gazetteer
+from .knowledge import get_knowledge_index
+from .session import get_session
+from .breaker import get_breaker
+from .arithmetic import Evaluator, ExpressionError, parse_spoken_expression, format_number
+
+# Concurrent identical tool calls share one upstream call
+tool_flights = SingleFlight("tool", timeout=60)
 
 
 class ToolError(Exception):
@@ -17,12 +34,149 @@ class ToolError(Exception):
     pass
 
 
+class NoResultsError(ToolError):
+    """
+    NoResultsError is raised when a tool lookup succeeded but found nothing, so the outcome can be cached.
+    ---
+    """
+
+    pass
+
+
+class ToolTimeoutError(ToolError):
+    """
+    ToolTimeoutError is raised when a tool call exceeds its deadline.
+    ---
+    """
+
+    pass
+
+
+class ToolCancelledError(ToolError):
+    """
+    ToolCancelledError is raised when a tool call is cancelled.
+    ---
+    """
+
+    pass
+
+
+class ToolContext:
+    """
+    ToolContext carries the deadline and cancellation event of a tool call and of its callers
+    ---
+    NOTE: Tools check the context cooperatively, before and after each upstream request
+    """
+
+    def __init__(self, deadline=None, cancel=None, parent=None):
+        """
+        Initialize the context
+        ---
+        Args:
+        - deadline (default = None): Time (time.time()) by which the call must finish (None = no deadline)
+        - cancel (default = None): threading.Event set to cancel the call
+        - parent (default = None): Context of the caller, whose deadline and cancellation also apply
+        """
+
+        self.deadline = deadline
+        self.cancel = cancel
+        self.parent = parent
+
+    def cancelled(self):
+        """
+        Whether the call or one of its callers was cancelled
+        ---
+        """
+
+        if self.cancel is not None and self.cancel.is_set():
+            return True
+        return self.parent is not None and self.parent.cancelled()
+
+    def remaining(self):
+        """
+        Seconds left until the earliest deadline (None = no deadline)
+        ---
+        """
+
+        remaining = [
+            value
+            for value in (
+                self.deadline - time.time() if self.deadline is not None else None,
+                self.parent.remaining() if self.parent is not None else None,
+            )
+            if value is not None
+        ]
+        return min(remaining) if len(remaining) else None
+
+    def check(self):
+        """
+        Raise if the call was cancelled or its deadline passed
+        ---
+        Returns:
+        - remaining: Seconds left until the deadline (None = no deadline)
+        """
+
+        if self.cancelled():
+            raise ToolCancelledError("Tool call cancelled")
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise ToolTimeoutError("Tool call deadline exceeded")
+        return remaining
+
+
+class SharedToolContext(ToolContext):
+    """
+    SharedToolContext is the context of a tool call coalesced from several callers
+    ---
+    NOTE: The call is only cancelled once all of its callers have cancelled, and runs until the latest of their deadlines
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.callers = []
+
+    def join(self, context):
+        with self.lock:
+            self.callers.append(context)
+
+    def leave(self, context):
+        with self.lock:
+            self.callers.remove(context)
+
+    def _active(self):
+        with self.lock:
+            return [c for c in self.callers if not c.cancelled()]
+
+    def cancelled(self):
+        return not len(self._active())
+
+    def remaining(self):
+        remaining = [c.remaining() for c in self._active()]
+        if not len(remaining) or None in remaining:
+            return None
+        return max(remaining)
+
+
+# Context of the running tool call (copied into worker threads and asyncio tasks)
+tool_context = contextvars.ContextVar("tool_context", default=None)
+
+# Shared contexts of the in-flight tool calls, by flight key
+flight_contexts = {}
+flight_contexts_lock = threading.Lock()
+
+
 class Tool:
     """
     A tool is a function that can be used by a ToolLLM. It exposes complex APIs through simple interfaces.
     ---
+    NOTE: cache_ttls maps the cached lookups of a tool to their time-to-live in seconds (None = cache default).
+    Read-only tools have no side effects, so they may be run speculatively and their result discarded.
     """
 
+    cache_ttls = {}
+    read_only = False
+
     def __init__(self, name, description):
         """
         Initialize the tool with a name and description.
@@ -35,6 +189,134 @@ class Tool:
         self.name = name
         self.description = description
         self.logger = get_logger()
+        self.cache = None
+        self.negative_ttl = None
+        self.session = None
+        self.breaker_failures = 3
+        self.breaker_reset = 30
+
+    def configure(self, config):
+        """
+        Configure the tool
+        ---
+        NOTE: Tools with their own configuration options extend this
+
+        Args:
+        - config: Configuration dictionary
+            - tool_*: HTTP session options (timeouts, retries, pool size), see HTTPSession.
+        """
+
+        self.session = get_session(config, "tool")
+        self.breaker_failures = config.get("tool_breaker_failures", 3)
+        self.breaker_reset = config.get("tool_breaker_reset", 30)
+
+    def _get(self, url, **kwargs):
+        """
+        Perform a GET request over the shared (pooled) tool HTTP session
+        ---
+        NOTE: The timeout is capped by the deadline of the tool call, and upstreams that keep failing
+        are short-circuited by their circuit breaker
+
+        Args:
+        - url: URL to request
+        - **kwargs: Keyword arguments passed to requests
+
+        Returns:
+        - response: requests Response
+        """
+
+        if self.session is None:
+            self.session = get_session({}, "tool")
+
+        # Cap timeout by the remaining deadline
+        timeout = self.session.timeout
+        context = tool_context.get()
+        remaining = context.check() if context is not None else None
+        if remaining is not None:
+            timeout = tuple(min(t, remaining) for t in timeout)
+
+        # Fail fast on unavailable upstreams
+        host = parse.urlparse(url).netloc
+        breaker = get_breaker(host, self.breaker_failures, self.breaker_reset)
+        if not breaker.allow():
+            raise ToolError(f"{host} is unavailable, try again later")
+
+        # Perform request
+        start_time = time.time()
+        try:
+            response = self.session.get(url, timeout=timeout, **kwargs)
+        except requests.Timeout:
+            # Only count timeouts of the upstream itself (not of a short deadline)
+            if timeout == self.session.timeout:
+                breaker.record(False)
+            else:
+                breaker.release()
+            raise ToolTimeoutError(f"Request to {host} timed out")
+        except requests.RequestException as err:
+            breaker.record(False)
+            raise ToolError(f"Request to {host} failed: {err}")
+        finally:
+            get_metrics().observe(
+                "tool_request_latency", time.time() - start_time, tags={"host": host}
+            )
+        breaker.record(response.status_code < 500)
+
+        # Stop if cancelled while waiting
+        if context is not None:
+            context.check()
+        return response
+
+    def set_cache(self, cache, negative_ttl=None):
+        """
+        Set the cache used for the lookups of the tool
+        ---
+        Args:
+        - cache: Cache instance (None = no caching)
+        - negative_ttl (default = None): Time-to-live of cached "no results" errors in seconds (None = cache default)
+        """
+
+        self.cache = cache
+        self.negative_ttl = negative_ttl
+
+    def _cached(self, lookup, args, function):
+        """
+        Perform a lookup through the tool cache
+        ---
+        NOTE: Results are cached with the ttl of the lookup in cache_ttls, NoResultsErrors with the negative ttl
+
+        Args:
+        - lookup: Name of the lookup
+        - args: JSON-serializable arguments of the lookup
+        - function: Function without arguments performing the lookup
+
+        Returns:
+        - result: JSON-serializable result of the lookup
+        """
+
+        if self.cache is None:
+            return function()
+
+        # Look up cached result or error
+        metrics = get_metrics()
+        tags = {"tool": self.name, "lookup": lookup}
+        key = Cache.key("tool", self.name, lookup, args)
+        entry = self.cache.get(key)
+        if entry is not None:
+            metrics.increment("tool_cache_hits", tags=tags)
+            self.logger.debug(f"Tool cache hit for {self.name} {lookup}({args})")
+            if "error" in entry:
+                raise NoResultsError(entry["error"])
+            return entry["result"]
+        metrics.increment("tool_cache_misses", tags=tags)
+
+        # Perform lookup and cache the outcome
+        try:
+            result = function()
+        except NoResultsError as err:
+            self.cache.set(key, {"error": f"{err}"}, ttl=self.negative_ttl)
+            raise
+        self.cache.set(key, {"result": result}, ttl=self.cache_ttls.get(lookup))
+        return result
 
     def __call__(self, *args, **kwargs):
         """
@@ -50,6 +332,118 @@ class Tool:
 
         raise NotImplementedError("__call__() is not implemented in base class")
 
+    def run(self, *args, deadline=None, cancel=None, method=None):
+        """
+        Run the tool, sharing the result of an identical in-flight call
+        ---
+        NOTE: Callers of a shared call keep their own deadline and cancellation: the call itself only stops
+        once all of them have cancelled (or their deadlines have passed)
+
+        Args:
+        - *args: Positional arguments
+        - deadline (default = None): Time (time.time()) by which the call must finish (None = no deadline)
+        - cancel (default = None): threading.Event set to cancel the call
+        - method (default = None): Name of the tool method to call (None = the tool itself)
+
+        Returns:
+        - result: Result of the tool
+        """
+
+        function = self if method is None else getattr(self, method)
+        context = ToolContext(deadline, cancel, parent=tool_context.get())
+        token = tool_context.set(context)
+        start_time = time.time()
+        outcome = "error"
+
+        # Join the shared context of the (in-flight) call
+        key = (self.name, method, args)
+        with flight_contexts_lock:
+            shared = flight_contexts.setdefault(key, SharedToolContext())
+            shared.join(context)
+
+        def call():
+            shared_token = tool_context.set(shared)
+            try:
+                return function(*args)
+            finally:
+                tool_context.reset(shared_token)
+                with flight_contexts_lock:
+                    if flight_contexts.get(key) is shared:
+                        del flight_contexts[key]
+
+        try:
+            remaining = context.check()
+            result = tool_flights.do(
+                key, call, timeout=remaining, interrupt=context.check
+            )
+            outcome = "ok"
+            return result
+        except TimeoutError as err:
+            outcome = "timeout"
+            raise ToolTimeoutError(f"{err}")
+        except ToolTimeoutError:
+            outcome = "timeout"
+            raise
+        except ToolCancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            shared.leave(context)
+            tool_context.reset(token)
+            get_metrics().observe(
+                "tool_latency",
+                time.time() - start_time,
+                tags={"tool": self.name, "outcome": outcome},
+            )
+
+    async def arun(self, *args, deadline=None):
+        """
+        Run the tool from asyncio, off the event loop
+        ---
+        NOTE: Cancelling the awaiting task cancels the tool call at its next checkpoint
+
+        Args:
+        - *args: Positional arguments
+        - deadline (default = None): Time (time.time()) by which the call must finish (None = no deadline)
+
+        Returns:
+        - result: Result of the tool
+        """
+
+        cancel = threading.Event()
+        try:
+            return await asyncio.to_thread(
+                self.run, *args, deadline=deadline, cancel=cancel
+            )
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
+
+    def get_schema(self, label):
+        """
+        Return the OpenAI-style function schema of the tool.
+        ---
+        Args:
+        - label: Name under which the tool is exposed to the LLM
+
+        Returns:
+        - schema: Function tool schema
+        """
+
+        parameters = inspect.signature(self.__call__).parameters
+        return {
+            "type": "function",
+            "function": {
+                "name": label,
+                "description": self.description,
+                "parameters": {
+                    "type": "object",
+                    "properties": {name: {"type": "string"} for name in parameters},
+                    "required": list(parameters),
+                },
+            },
+        }
+
     def __str__(self):
         """
         Return a string representation of the tool.
@@ -76,35 +470,45 @@ class Answer(Tool):
 
 class Algebra(Tool):
     """
-    The algebra tool allows solving algebraic equations.
+    The algebra tool allows solving arithmetic expressions.
     ---
+    NOTE: Expressions are evaluated from their syntax tree (no eval), within limits on the result size and evaluation time
     """
 
+    read_only = True
+
     def __init__(self):
-        super().__init__("Algebra", "Solve algebraic equations using python (+ - * /).")
+        super().__init__(
+            "Algebra",
+            "Solve arithmetic expressions with numbers, parentheses and + - * / ** operators.",
+        )
+        self.evaluator = Evaluator()
+
+    def configure(self, config):
+        super().configure(config)
+        self.evaluator = Evaluator(
+            max_digits=config.get("tool_algebra_max_digits", 100),
+            timeout=config.get("tool_algebra_timeout", 0.1),
+        )
 
     def __call__(self, equation):
         """
-        Solve an algebraic equation.
+        Solve an arithmetic expression.
         ---
         Args:
-        - equation: Equation to solve
+        - equation: Expression to solve, with digits or spoken numbers (e.g. "(2 + 3) ** 2", "fifty seven times three")
 
         Returns:
-        - solution: Solution to the equation
+        - solution: Solution to the expression
         """
 
-        # Verify pattern
-        regex_pattern = (
-            r"^(\s*-?\s*(\d+(\.\d+)?)(\s*[\+\-\*\/]\s*-?\s*(\d+(\.\d+)?))*)+$"
-        )
-        if not re.match(regex_pattern, equation):
-            raise ToolError(f"Invalid equation: {equation}")
-
-        # Solving equation
-        self.logger.debug(f"Solving equation {equation}")
-        solution = eval(equation)
-        result = f"{solution}"
+        # Solving expression
+        try:
+            expression = parse_spoken_expression(equation)
+            self.logger.debug(f"Solving expression {expression}")
+            result = format_number(self.evaluator(expression))
+        except ExpressionError as err:
+            raise ToolError(f"Invalid equation {equation}: {err}")
         self.logger.debug(f"Result = {result}")
 
         # Returning solution
@@ -113,12 +517,48 @@ class Algebra(Tool):
 
 class Weather(Tool):
     """
-    The weather tool allows looking up the current weather at a given location.
+    The weather tool allows looking up the current weather at one or more locations.
     ---
+    NOTE: Locations are geocoded concurrently and their weather is fetched in a single Open-Meteo request
     """
 
+    # Coordinates practically never change, weather does
+    cache_ttls = {"coordinates": 365 * 24 * 3600, "weather": 10 * 60}
+    read_only = True
+
+    # Current weather variables (Open-Meteo) and their names
+    variables = {
+        "temperature_2m": "temperature",
+        "relative_humidity_2m": "humidity",
+        "precipitation_probability": "precipitation probability",
+        "precipitation": "precipitation",
+        "wind_speed_10m": "wind speed",
+    }
+
+    # Separators between multiple locations (not "and" or commas, which occur in place names)
+    separator_pattern = r"[;|]"
+
     def __init__(self):
-        super().__init__("Weather", "Get the current weather at a location.")
+        super().__init__(
+            "Weather",
+            "Get the current weather at one or more locations (separate locations with ;).",
+        )
+        self.gazetteer = None
+        self.geocoder_fallback = True
+
+    def configure(self, config):
+        super().configure(config)
+
+        # Offline geocoding, with Nominatim as (optional) fallback
+        self.gazetteer = get_gazetteer(config)
+        self.geocoder_fallback = config.get("tool_geocoder_fallback", True)
+
+        # Reported weather variables
+        variables = config.get("tool_weather_variables")
+        if variables is not None:
+            self.variables = {
+                key: name for key, name in Weather.variables.items() if key in variables
+            }
 
     def _get_location_coordinates(self, location):
         """
@@ -131,11 +571,20 @@ class Weather(Tool):
         - coords: Coordinates (latitude, longitude) for the given location, or None if no coordinates could be found.
         """
 
+        # Look up location in the offline gazetteer
+        if self.gazetteer is not None:
+            coords = self.gazetteer.lookup(location)
+            if coords is not None:
+                return coords
+            if not self.geocoder_fallback:
+                raise NoResultsError(f"No coordinates found for location {location}")
+
         # Fetching coordinates for requested location
         self.logger.debug(f"Obtaining coordinates for location {location}")
-        url = f"https://nominatim.openstreetmap.org/search?q={parse.quote(location)}&format=json&polygon=1&addressdetails=1"
-        self.logger.debug(f"URL: {url}")
-        response = requests.get(url)
+        response = self._get(
+            "https://nominatim.openstreetmap.org/search",
+            params={"q": location, "format": "json", "limit": 1},
+        )
 
         # Error handling
         if response.status_code != 200:
@@ -146,150 +595,230 @@ class Weather(Tool):
         try:
             lat, lon = data[0]["lat"], data[0]["lon"]
         except (KeyError, IndexError):
-            raise ToolError(f"No coordinates found for location {location}")
+            raise NoResultsError(f"No coordinates found for location {location}")
         return lat, lon
 
-    def _get_weather_data(self, coords):
+    def _get_weather_data(self, coords_list):
         """
-        Get weather data for a given location
+        Get weather data for a list of locations, in one request
         ---
         Args:
-        - coords: Coordinates (latitude, longitude) for the location to get weather data for
+        - coords_list: List of coordinates (latitude, longitude) of the locations to get weather data for
 
         Returns:
-        - weather_data: Weather data for the given location, or None if no weather data could be found.
+        - weather_data: List of dictionaries with the weather data (value and unit) of each location
         """
 
         # Fetching weather data for requested coordinates
-        lat, lon = coords
-        self.logger.debug(f"Obtaining weather data for coordinates {lat}, {lon}")
-        url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&current=temperature_2m,relative_humidity_2m,precipitation_probability,precipitation,wind_speed_10m"
-        self.logger.debug(f"URL: {url}")
-        response = requests.get(url)
+        self.logger.debug(f"Obtaining weather data for coordinates {coords_list}")
+        response = self._get(
+            "https://api.open-meteo.com/v1/forecast",
+            params={
+                "latitude": ",".join(f"{lat}" for lat, lon in coords_list),
+                "longitude": ",".join(f"{lon}" for lat, lon in coords_list),
+                "current": ",".join(self.variables),
+            },
+        )
 
         # Error handling exception
         if response.status_code != 200:
-            raise ToolError(f"Error getting weather data for coordinates {lat}, {lon}")
+            raise ToolError(f"Error getting weather data for coordinates {coords_list}")
 
-        # Parsing data
+        # Parsing data (a list for multiple locations)
         data = response.json()
-        weather_data = data.get("current", {})
-        weather_units = data.get("current_units", {})
-        for key, value in weather_data.items():
-            weather_data[key] = f"{value} ({weather_units.get(key, '')})"
+        if isinstance(data, dict):
+            data = [data]
+        weather_data = []
+        for location_data in data:
+            current = location_data.get("current", {})
+            units = location_data.get("current_units", {})
+            weather_data.append(
+                {
+                    key: f"{current[key]} {units.get(key, '')}".strip()
+                    for key in self.variables
+                    if key in current
+                }
+            )
 
         return weather_data
 
-    def __call__(self, location):
+    def lookup(self, locations):
         """
-        Get weather data for a given location
+        Get weather data for a list of locations
         ---
         Args:
-        - location: Location to get weather data for
+        - locations: List of locations
 
         Returns:
-        - weather_data: Weather data for the given location, or None if no weather data could be found.
+        - weather_data: List of weather data dictionaries, None for locations without coordinates
         """
 
-        # Get coordinates for the given location
-        coords = self._get_location_coordinates(location)
-
-        # Get weather data for the given coordinates
-        weather_data = self._get_weather_data(coords)
-        return weather_data
-
-
-class Search(Tool):
-    """
-    The search tool allows searching for information about a keyword on DBPedia.
-    ---
-    """
-
-    def __init__(self):
-        super().__init__("Search", "Search for information about a keyword on DBPedia.")
+        # Geocode locations concurrently
+        with ThreadPoolExecutor(max_workers=min(len(locations), 8)) as executor:
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self._cached,
+                    "coordinates",
+                    location.strip().lower(),
+                    partial(self._get_location_coordinates, location),
+                )
+                for location in locations
+            ]
+        coords_list = []
+        for future in futures:
+            try:
+                coords_list.append(future.result())
+            except NoResultsError:
+                coords_list.append(None)
+        found = [coords for coords in coords_list if coords is not None]
+        if not len(found):
+            raise NoResultsError(f"No coordinates found for location {'; '.join(locations)}")
+
+        # Get weather data for all coordinates at once
+        found_data = iter(
+            self._cached(
+                "weather", [found, list(self.variables)], lambda: self._get_weather_data(found)
+            )
+        )
+        return [
+            next(found_data) if coords is not None else None for coords in coords_list
+        ]
 
-    def _lookup_keyword_url(self, keyword: str):
+    def __call__(self, locations):
         """
-        Find DBPedia resource url for a given keyword
+        Get weather data for one or more locations
         ---
         Args:
-        - keyword: Keyword to search for
+        - locations: Location(s) to get weather data for, separated by ";"
 
         Returns:
-        - resource_url: DBPedia resource url for the given keyword, or None if no resource could be found.
+        - weather_table: Table with the weather data of each location
         """
 
-        # Look up keyword with dbpedia api
-        url = f"https://lookup.dbpedia.org/api/search?format=JSON&maxResults=1&query={parse.quote(keyword)}"
-        response = requests.get(url)
+        # Get weather data for the given locations
+        locations = [
+            location.strip()
+            for location in re.split(self.separator_pattern, locations)
+            if len(location.strip())
+        ]
+        if not len(locations):
+            raise ToolError("No location given")
+        weather_data = self.lookup(locations)
+
+        # Format table
+        columns = [
+            key
+            for key in self.variables
+            if any(key in data for data in weather_data if data is not None)
+        ]
+        lines = [" | ".join(["location"] + [self.variables[key] for key in columns])]
+        for location, data in zip(locations, weather_data):
+            if data is None:
+                lines.append(f"{location} | no coordinates found")
+            else:
+                lines.append(" | ".join([location] + [data.get(key, "-") for key in columns]))
+        return "\n".join(lines)
 
-        # Error handling
-        if response.status_code != 200:
-            raise ToolError(f"Error looking up keyword {keyword}")
 
-        # Parsing results from data
-        data = response.json()
-        docs = data.get("docs", [])
-        if not len(docs):
-            raise ToolError(f"No results for keyword {keyword}")
+class Search(Tool):
+    """
+    The search tool allows searching for information about a keyword on DBPedia.
+    ---
+    """
+
+    # DBPedia content changes slowly
+    cache_ttls = {"candidates": 7 * 24 * 3600}
+    read_only = True
+
+    # Single query matching resource labels containing all words and returning their English description
+    # NOTE: Exact label matches rank first, then shorter labels and longer articles
+    query_template = """
+    SELECT DISTINCT ?label ?description ?length
+    WHERE {{
+        ?resource rdfs:label ?label .
+        ?label bif:contains '{words}' .
+        FILTER ( LANG(?label) = "en" )
+        FILTER NOT EXISTS {{ ?resource dbo:wikiPageRedirects ?target }}
+        FILTER NOT EXISTS {{ ?resource dbo:wikiPageDisambiguates ?option }}
+        ?resource rdfs:comment ?description .
+        FILTER ( LANG(?description) = "en" )
+        OPTIONAL {{ ?resource dbo:wikiPageLength ?length }}
+    }}
+    ORDER BY DESC(IF(LCASE(STR(?label)) = "{phrase}", 1, 0)) ASC(STRLEN(STR(?label))) DESC(?length)
+    LIMIT {limit}
+    """
 
-        # Parsing resource from results
-        resource = docs[0].get("resource", [])
-        if not len(resource):
-            raise ToolError(f"No resource for keyword {keyword}")
+    def __init__(self):
+        super().__init__("Search", "Search for information about a keyword on DBPedia.")
+        self.knowledge = None
+        self.remote_fallback = True
+        self.max_chars = 500
+        self.num_candidates = 3
 
-        keyword_url = resource[0]
+    def configure(self, config):
+        super().configure(config)
 
-        return keyword_url
+        # Offline knowledge index, with DBPedia as (optional) fallback
+        self.knowledge = get_knowledge_index(config)
+        self.remote_fallback = config.get("tool_search_fallback", True)
+        self.max_chars = config.get("tool_search_max_chars", 500)
+        self.num_candidates = config.get("tool_search_candidates", 3)
 
-    def _lookup_keyword_url_description(self, keyword_url):
+    def _lookup_candidates(self, keyword):
         """
-        Find description for a given keyword url
+        Find the best matching DBPedia resources for a keyword and their descriptions, in one SPARQL query
         ---
         Args:
-        - keyword_url: Keyword url to search for
+        - keyword: Keyword to search for
 
         Returns:
-        - description: Description for the given keyword url, or None if no description could be found.
+        - candidates: List of (label, description) pairs, best match first
         """
 
-        # Verify if keyword_url has valid format
-        if not keyword_url.startswith("http"):
-            raise ToolError(f"Invalid keyword_url {keyword_url}")
-
-        # Look up keyword url description with dbpedia api
-        ## Build query
-        query = f"""
-        SELECT *
-        WHERE
-        {{
-            <{keyword_url}> rdfs:comment ?description.
-            FILTER ( LANG(?description) = "en" )
-        }} LIMIT 1
-        """
-        ## Remove whitespace
+        # Build query (only words, so the keyword cannot break out of the query)
+        words = re.findall(r"\w+", keyword.lower())
+        if not len(words):
+            raise NoResultsError(f"No results for keyword {keyword}")
+        query = self.query_template.format(
+            words=" AND ".join(f'"{word}"' for word in words),
+            phrase=" ".join(words),
+            limit=self.num_candidates,
+        )
         query = re.sub(r"\s+", " ", query)
         self.logger.debug(f"Query: {query}")
-        ## Build URL
-        url = f"https://dbpedia.org/sparql?default-graph-uri=http%3A%2F%2Fdbpedia.org&query={parse.quote(query)}&format=application%2Fsparql-results%2Bjson&timeout=30000&signal_void=on&signal_unconnected=on"
-        self.logger.debug(f"URL: {url}")
 
-        # Request url
-        response = requests.get(url)
+        # Query timeout (ms) within the read timeout and the deadline of the tool call
+        timeout = self.session.timeout[1]
+        context = tool_context.get()
+        remaining = context.remaining() if context is not None else None
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+
+        # Request results
+        response = self._get(
+            "https://dbpedia.org/sparql",
+            params={
+                "default-graph-uri": "http://dbpedia.org",
+                "query": query,
+                "format": "application/sparql-results+json",
+                "timeout": max(int(timeout * 1000), 1),
+            },
+        )
         if response.status_code != 200:
-            raise ToolError(f"Error looking up keyword url {keyword_url}")
-
-        # Parse response
-        data = response.json()
-        results = data.get("results", {})
-        bindings = results.get("bindings", [])
-        if not len(bindings):
-            raise ToolError(f"No bindings available for url {keyword_url}")
-
-        # Parse description
-        description = bindings[0].get("description", {}).get("value", None)
+            raise ToolError(f"Error looking up keyword {keyword}")
 
-        return description
+        # Parse candidates
+        bindings = response.json().get("results", {}).get("bindings", [])
+        candidates = []
+        for binding in bindings:
+            label = binding.get("label", {}).get("value")
+            description = binding.get("description", {}).get("value")
+            if label and description and label not in [c[0] for c in candidates]:
+                candidates.append((label, description.strip()))
+        if not len(candidates):
+            raise NoResultsError(f"No results for keyword {keyword}")
+        return candidates
 
     def __call__(self, keyword):
         """
@@ -299,14 +828,35 @@ class Search(Tool):
         - keyword: Keyword to search for
 
         Returns:
-        - description: Description for the given keyword, or None if no description could be found.
+        - description: Description of the best match for the given keyword, followed by the other matches
         """
 
-        # Obtain keyword url
-        keyword_url = self._lookup_keyword_url(keyword)
+        # Search the offline knowledge index
+        if self.knowledge is not None:
+            title, description = self.knowledge.search(keyword, self.max_chars)
+            if description is not None:
+                self.logger.debug(f"Found {keyword} offline: {title}")
+                return description
+            if not self.remote_fallback:
+                raise NoResultsError(f"No results for keyword {keyword}")
+
+        # Look up candidates on DBPedia
+        candidates = self._cached(
+            "candidates",
+            [keyword.strip().lower(), self.num_candidates],
+            lambda: self._lookup_candidates(keyword),
+        )
 
-        # Return keyword url description
-        return self._lookup_keyword_url_description(keyword_url)
+        # Best match, followed by the alternatives (in case the best match is not the one intended)
+        label, description = candidates[0]
+        result = truncate_text(description, self.max_chars)
+        if len(candidates) > 1:
+            alternatives = "; ".join(
+                f"{label}: {truncate_text(description, 100)}"
+                for label, description in candidates[1:]
+            )
+            result += f" (Other matches: {alternatives})"
+        return result
 
 
 # Export dictionary with all available tools
@@ -1,6 +1,8 @@
 import os
 import wave
 import re
+import queue
+import threading
 from urllib.request import urlretrieve
 from piper.voice import PiperVoice
 from num2words import num2words
@@ -8,7 +10,7 @@ import torch
 from TTS.api import TTS as CoquiTTS
 from mycroft_plugin_tts_mimic3 import Mimic3TTSPlugin
 from .utils import get_logger
-from .audio import play_wave_file
+from .audio import play_wave_file, WavePlayer
 
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
@@ -34,6 +36,8 @@ class TTS:
         # Config
         self.model_config = models[config.get("tts_model")]
         self.model = self.model_config["class"](config)
+        self.stream_min_chars = config.get("tts_stream_min_chars", 40)
+        self.stream_max_chars = config.get("tts_stream_max_chars", 200)
         self.character_map = {
             "°": "degree",
             "%": "percent",
@@ -83,16 +87,146 @@ class TTS:
 
         return text
 
+    def _normalize(self, text):
+        """
+        Normalize text for synthesis
+        ---
+        Args:
+        - text: Text to be processed
+        """
+
+        text = self._replace_numbers_with_words(text)
+        text = self._replace_special_characters_with_words(text)
+        return text
+
+    def _split_segments(self, text, final=False):
+        """
+        Split complete sentences (or long clauses) from streamed text
+        ---
+        Args:
+        - text: Buffered text to be split
+        - final (default = False): Whether the stream has ended
+
+        Returns:
+        - segments: List of complete segments
+        - remainder: Text which does not form a complete segment yet
+        """
+
+        segments = []
+        while True:
+            # Split on sentence boundaries, once the segment is long enough
+            match = None
+            for candidate in re.finditer(r"[.!?;:\n]+(\s+|$)", text):
+                if candidate.end() < len(text) or final:
+                    if candidate.end() >= self.stream_min_chars:
+                        match = candidate
+                        break
+            # Split long runs on clause boundaries
+            if match is None and len(text) > self.stream_max_chars:
+                for candidate in re.finditer(r",\s+", text):
+                    if candidate.end() >= self.stream_min_chars:
+                        match = candidate
+                        break
+            if match is None:
+                break
+            segments.append(text[: match.end()].strip())
+            text = text[match.end() :]
+
+        # Flush remaining text at the end of the stream
+        if final and len(text.strip()):
+            segments.append(text.strip())
+            text = ""
+
+        return [segment for segment in segments if len(segment)], text
+
     def speak(self, text):
         text = text.strip()
         if len(text) == 0:
             self.logger.warning("Empty text, skipping tts")
             return
-        text = self._replace_numbers_with_words(text)
-        text = self._replace_special_characters_with_words(text)
+        text = self._normalize(text)
         self.logger.debug(f"Speaking text: {text}")
         self.model.speak(text)
 
+    def speak_stream(self, chunks):
+        """
+        Speak streamed text, synthesizing and playing segments while later ones are generated
+        ---
+        Args:
+        - chunks: Iterable of text chunks (e.g. streamed LLM response)
+
+        Returns:
+        - text: Full text that was spoken
+        """
+
+        text_queue = queue.Queue()
+        audio_queue = queue.Queue()
+
+        def synthesize_worker():
+            # Synthesize segments to numbered files
+            # NOTE: Playback is always ended, even if the worker fails, so speak_stream cannot hang
+            index = 0
+            try:
+                while True:
+                    segment = text_queue.get()
+                    if segment is None:
+                        break
+                    try:
+                        segment = self._normalize(segment)
+                        self.logger.debug(f"Synthesizing segment: {segment}")
+                        file_path = self.model.get_segment_file(index)
+                        self.model.synthesize(segment, file_path)
+                        audio_queue.put(file_path)
+                    except Exception as err:
+                        self.logger.error(f"Error synthesizing segment: {err}")
+                    index += 1
+            finally:
+                audio_queue.put(None)
+
+        def playback_worker():
+            # Play synthesized segments back to back
+            player = WavePlayer()
+            try:
+                while True:
+                    file_path = audio_queue.get()
+                    if file_path is None:
+                        break
+                    player.play(file_path)
+                    os.remove(file_path)
+            finally:
+                player.close()
+
+        # Start workers
+        workers = [
+            threading.Thread(target=synthesize_worker, daemon=True),
+            threading.Thread(target=playback_worker, daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
+
+        # Segment streamed text
+        text = ""
+        buffer = ""
+        try:
+            for chunk in chunks:
+                text += chunk
+                buffer += chunk
+                segments, buffer = self._split_segments(buffer)
+                for segment in segments:
+                    text_queue.put(segment)
+            segments, buffer = self._split_segments(buffer, final=True)
+            for segment in segments:
+                text_queue.put(segment)
+        finally:
+            # Wait for synthesis and playback to finish
+            text_queue.put(None)
+            for worker in workers:
+                worker.join()
+
+        if not len(text.strip()):
+            self.logger.warning("Empty text, skipping tts")
+        return text
+
 
 class TTSModel:
     """
@@ -146,6 +280,17 @@ class TTSModel:
 
         raise NotImplementedError("load_model() is not implemented in the base class")
 
+    def synthesize(self, text, file_path):
+        """
+        Synthesize speech from text into a wav file
+        ---
+        Args:
+        - text: Text to be synthesized
+        - file_path: Path of the wav file to write
+        """
+
+        raise NotImplementedError("synthesize() is not implemented in the base class")
+
     def speak(self, text):
         """
         Synthesize speech from text and play on the speakers
@@ -154,7 +299,22 @@ class TTSModel:
         - text: Text to be spoken
         """
 
-        raise NotImplementedError("speak() is not implemented in the base class")
+        self.synthesize(text, self.file)
+        self.speak_file()
+
+    def get_segment_file(self, index):
+        """
+        Get the temporary wav file path for a streamed segment
+        ---
+        Args:
+        - index: Index of the segment
+
+        Returns:
+        - file_path: Path of the segment wav file
+        """
+
+        root, ext = os.path.splitext(self.file)
+        return f"{root}_{index}{ext}"
 
     def speak_file(self):
         """
@@ -193,10 +353,9 @@ class PiperModel(TTSModel):
         self.logger.debug("Loading TTS model")
         self.model = PiperVoice.load(os.path.join(self.model_path, "model.onnx"))
 
-    def speak(self, text):
-        with wave.open(self.file, "wb") as wav_file:
+    def synthesize(self, text, file_path):
+        with wave.open(file_path, "wb") as wav_file:
             self.model.synthesize(text, wav_file)
-        self.speak_file()
 
 
 class CoquiModel(TTSModel):
@@ -216,9 +375,8 @@ class CoquiModel(TTSModel):
         # (Down)Load model
         self.model = CoquiTTS(self.voice).to(device)
 
-    def speak(self, text):
-        self.model.tts_to_file(text=text, file_path=self.file)
-        self.speak_file()
+    def synthesize(self, text, file_path):
+        self.model.tts_to_file(text=text, file_path=file_path)
 
 
 class Mimic3TTS(TTSModel):
@@ -243,9 +401,8 @@ class Mimic3TTS(TTSModel):
         # (Down)Load model
         self.model = Mimic3TTSPlugin("en", model_config)
 
-    def speak(self, text):
-        self.model.get_tts(text, self.file)
-        self.speak_file()
+    def synthesize(self, text, file_path):
+        self.model.get_tts(text, file_path)
 
 
 models = {
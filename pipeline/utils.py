@@ -43,3 +43,53 @@ def get_logger(log_level="INFO"):
         logger = logging.getLogger(name)
         logger.setLevel(log_level)
     return logger
+
+
+tokenizer = None
+
+
+def count_tokens(text):
+    """
+    Estimate the number of tokens in a text
+    ---
+    NOTE: Uses the tiktoken cl100k_base encoding when available, and ~4 characters per token otherwise
+
+    Args:
+    - text: Text to count tokens in
+
+    Returns:
+    - count: Number of tokens
+    """
+
+    global tokenizer
+    if tokenizer is None:
+        try:
+            import tiktoken
+
+            tokenizer = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            tokenizer = False
+    if tokenizer:
+        return len(tokenizer.encode(text, disallowed_special=()))
+    return max(1, round(len(text) / 4)) if len(text) else 0
+
+
+def truncate_text(text, max_chars):
+    """
+    Truncate a text to a maximum length, preferably at the end of a sentence
+    ---
+    Args:
+    - text: Text to truncate
+    - max_chars: Maximum number of characters (None = no limit)
+
+    Returns:
+    - text: Truncated text
+    """
+
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    text = text[:max_chars]
+    end = max(text.rfind(". "), text.rfind("! "), text.rfind("? "))
+    if end > max_chars // 2:
+        return text[: end + 1]
+    return text[: text.rfind(" ")].rstrip(",;:") + "..."
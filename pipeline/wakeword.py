@@ -44,12 +44,13 @@ class Wakeword:
             inference_framework=self.framework,
         )
 
-    def detect(self, verbose=True):
+    def detect(self, verbose=True, stop=None):
         """
         Detect wakeword in audio chunk
         ---
         Args:
-        - mic: Microphone object
+        - verbose (default = True): Log prediction values
+        - stop (default = None): Callable returning True when detection should be aborted
         ---
         Returns:
         - True if wakeword detected, False otherwise
@@ -64,6 +65,10 @@ class Wakeword:
         self.logger.debug("Detecting wakeword")
 
         while True:
+            # Abort detection on request
+            if stop is not None and stop():
+                return False
+
             # Read audio chunk
             audio_chunk = self.mic.read_chunk()
             if not (np.any(audio_chunk) or len(audio_chunk)):
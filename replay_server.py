@@ -0,0 +1,45 @@
+import json
+import typer
+from pipeline.utils import get_logger
+from pipeline.replay import ReplayStore, ReplayServer
+
+
+def replay_server(
+    record_path: str = "./recordings/llm.jsonl",
+    host: str = "127.0.0.1",
+    port: int = 8090,
+    latency: str = "none",
+    log_level: str = "INFO",
+):
+    """
+    OpenAI-compatible LLM stub server replaying recorded responses
+    ---
+    Args:
+    - record_path: Path to the recordings (made with the "record" LLM provider)
+    - host: Host to bind to
+    - port: Port to bind to
+    - latency: Latency profile: "none", "recorded" or a JSON object like '{"first_token_time": 0.5, "tokens_per_second": 20}'
+    - log_level: Level of logs to be reported
+    """
+
+    # Logger
+    logger = get_logger(log_level)
+
+    # Parse latency profile
+    if latency.startswith("{"):
+        latency = json.loads(latency)
+    elif latency == "none":
+        latency = None
+
+    # Serve recordings
+    store = ReplayStore(record_path)
+    server = ReplayServer(store, host=host, port=port, latency=latency)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down replay server")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    typer.run(replay_server)
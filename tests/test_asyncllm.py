@@ -0,0 +1,109 @@
+import time
+import typer
+import asyncio
+import threading
+import tempfile
+import os
+import sys
+
+# Add main dir to system path
+main_dir = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir))
+sys.path.append(main_dir)
+from pipeline.utils import get_logger
+from pipeline.asyncllm import AsyncLLM
+from pipeline.replay import ReplayStore, ReplayServer
+from pipeline.metrics import get_metrics
+
+
+async def stream_response(llm, prompt):
+    # Collect the streamed chunks of a response
+    chunks = []
+    async for chunk in llm.stream(prompt):
+        chunks.append(chunk)
+    return chunks
+
+
+async def cancel_response(llm, prompt, logger):
+    # Cancel the response after its first chunk
+    first_chunk = asyncio.Event()
+
+    async def consume():
+        async for chunk in llm.stream(prompt):
+            first_chunk.set()
+
+    task = asyncio.create_task(consume())
+    await first_chunk.wait()
+    start_time = time.time()
+    task.cancel()
+    try:
+        await task
+        raise AssertionError("Response was not cancelled")
+    except asyncio.CancelledError:
+        logger.info(f"Response cancelled in {time.time() - start_time:.3f}s")
+
+
+async def run(llm, prompt, logger):
+    try:
+        # Streaming (the first endpoint is down, so the request fails over to the replay server)
+        chunks = await stream_response(llm, prompt)
+        logger.info(f"Streamed chunks: {chunks}")
+        assert "".join(chunks) == "Hello, I am Sola.", chunks
+
+        # Cancellation during generation
+        await cancel_response(llm, prompt, logger)
+    finally:
+        await llm.model.session.close()
+
+
+def main(
+    log_level: str = "DEBUG",
+):
+    """
+    Async LLM streaming and cancellation test script, against the replay server
+    """
+
+    # Initialize program
+    logger = get_logger(log_level=log_level)
+    logger.info("Program Initialized")
+
+    with tempfile.TemporaryDirectory() as directory:
+        config = {
+            "llm_provider": "llama-edge",
+            "llm_provider_url": ["http://127.0.0.1:9/v1"],
+            "llm_model": "replay-model",
+            "llm_system_message": "You are a helpful voice assistant.",
+        }
+        prompt = "What is your name?"
+
+        # Record a slowly streamed response and serve it
+        store = ReplayStore(os.path.join(directory, "llm.jsonl"))
+        server = ReplayServer(
+            store, port=0, latency={"first_token_time": 0.1, "tokens_per_second": 5}
+        )
+        host, port = server.server.server_address
+        config["llm_provider_url"].append(f"http://{host}:{port}/v1")
+        llm = AsyncLLM(config)
+        messages = llm.model._get_messages(prompt, config["llm_system_message"])
+        store.add("replay-model", messages, [(0.0, "Hello, "), (0.1, "I am "), (0.2, "Sola.")])
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            asyncio.run(run(llm, prompt, logger))
+        finally:
+            server.shutdown()
+
+        # Every request was released to the endpoint pool
+        stats = llm.model.pool.stats()
+        logger.info(f"Endpoints: {stats}")
+        assert all(endpoint["outstanding"] == 0 for endpoint in stats), stats
+
+        # The completed call was measured, the cancelled one counted
+        metrics = get_metrics()
+        calls = metrics.get_counter("llm_calls", tags={"model": "replay-model"})
+        cancelled = metrics.get_counter("llm_cancelled", tags={"model": "replay-model"})
+        logger.info(f"Calls: {calls}, cancelled: {cancelled}")
+        assert calls == 1 and cancelled == 1, (calls, cancelled)
+
+
+if __name__ == "__main__":
+    typer.run(main)
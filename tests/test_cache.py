@@ -0,0 +1,62 @@
+import time
+import typer
+import os
+import sys
+import tempfile
+
+# Add main dir to system path
+main_dir = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir))
+sys.path.append(main_dir)
+from pipeline.utils import get_config, get_logger
+from pipeline.llm import LLM
+from pipeline.cache import Cache
+
+
+def test_disk_expiry(logger):
+    # Entries promoted from disk (e.g. after a restart) keep their own expiry
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.sqlite")
+        Cache(disk_path=path, ttl=86400).set("weather", "sunny", ttl=0.5)
+        cache = Cache(disk_path=path, ttl=86400)
+        assert cache.get("weather") == "sunny"
+        time.sleep(0.6)
+        value = cache.get("weather")
+        logger.info(f"Disk-promoted entry after its ttl: {value} ({cache.stats()})")
+        assert value is None, "Disk-promoted entry outlived its ttl"
+
+
+def main(
+    config_path: str = os.path.join(main_dir, "config.json"),
+    log_level: str = "DEBUG",
+):
+    """
+    LLM response cache test script
+    """
+
+    # Initialize program
+    config = get_config(config_path)
+    config["llm_cache"] = True
+    logger = get_logger(log_level=log_level)
+    logger.info("Program Initialized")
+
+    # Test cache expiry
+    test_disk_expiry(logger)
+
+    # Intialize llm
+    llm = LLM(config)
+
+    # Prompt twice, second response should be served from the cache
+    prompt = "What is your name?"
+    for i in range(2):
+        start_time = time.time()
+        response = llm(prompt)
+        logger.info(f"Response {i} ({time.time() - start_time:.6f}s): {response}")
+    logger.info(f"Cache statistics: {llm.cache.stats()}")
+
+    # Bypass the cache
+    response = llm(prompt, use_cache=False)
+    logger.info(f"Response (uncached): {response}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,97 @@
+import typer
+import os
+import sys
+import tempfile
+
+# Add main dir to system path
+main_dir = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir))
+sys.path.append(main_dir)
+from pipeline.utils import get_logger
+from pipeline.gazetteer import Gazetteer
+
+# GeoNames rows: geonameid, name, asciiname, alternatenames, latitude, longitude, feature class, feature code,
+# country code, cc2, admin1 code, admin2 code, admin3 code, admin4 code, population
+PLACES = [
+    ["5128638", "New York", "New York", "NY,State of New York", "43.00035", "-75.4999", "A", "ADM1", "US", "", "NY", "", "", "", "19274244"],
+    ["5128581", "New York City", "New York City", "New York,NYC", "40.71427", "-74.00597", "P", "PPL", "US", "", "NY", "", "", "", "8804190"],
+    ["3996063", "Mexico", "Mexico", "Mexique,United Mexican States", "23.0", "-102.0", "A", "PCLI", "MX", "", "00", "", "", "", "126014024"],
+    ["3530597", "Mexico City", "Mexico City", "Mexico,Ciudad de Mexico", "19.42847", "-99.12766", "P", "PPLC", "MX", "", "09", "", "", "", "12294193"],
+    ["2797656", "Gent", "Gent", "Ghent,Gand", "51.05", "3.71667", "P", "PPLA2", "BE", "", "VLG", "", "", "", "231493"],
+    ["2911522", "Halle (Saale)", "Halle (Saale)", "Halle", "51.48158", "11.97947", "P", "PPLA2", "DE", "", "14", "", "", "", "238762"],
+    ["2797114", "Halle", "Halle", "Hal", "50.73385", "4.23454", "P", "PPL", "BE", "", "VLG", "", "", "", "38472"],
+    ["2988507", "Paris", "Paris", "Lutetia", "48.85341", "2.3488", "P", "PPLC", "FR", "", "11", "", "", "", "2138551"],
+    ["4717560", "Paris", "Paris", "", "33.66094", "-95.55551", "P", "PPLA2", "US", "", "TX", "", "", "", "24782"],
+]
+
+# GeoNames country names (countryInfo.txt) and state names (admin1CodesASCII.txt)
+COUNTRIES = [
+    ["#ISO", "ISO3", "ISO-Numeric", "fips", "Country"],
+    ["BE", "BEL", "056", "BE", "Belgium"],
+    ["DE", "DEU", "276", "GM", "Germany"],
+    ["FR", "FRA", "250", "FR", "France"],
+    ["MX", "MEX", "484", "MX", "Mexico"],
+    ["US", "USA", "840", "US", "United States"],
+]
+ADMIN1 = [
+    ["US.TX", "Texas", "Texas", "4736286"],
+    ["BE.VLG", "Flanders", "Flanders", "3337388"],
+]
+
+
+def write_rows(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write("\t".join(row) + "\n")
+
+
+def main(
+    log_level: str = "DEBUG",
+):
+    """
+    Offline gazetteer test script
+    """
+
+    # Initialize program
+    logger = get_logger(log_level=log_level)
+    logger.info("Program Initialized")
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Build gazetteer from a small dump
+        dump_path = os.path.join(directory, "places.txt")
+        country_info_path = os.path.join(directory, "countryInfo.txt")
+        admin1_path = os.path.join(directory, "admin1CodesASCII.txt")
+        write_rows(dump_path, PLACES)
+        write_rows(country_info_path, COUNTRIES)
+        write_rows(admin1_path, ADMIN1)
+        gazetteer = Gazetteer(os.path.join(directory, "gazetteer.sqlite"))
+        gazetteer.build(
+            dump_path, country_info_path=country_info_path, admin1_path=admin1_path
+        )
+
+        # Cities win over the state or country with the same name
+        locations = {
+            "New York": (40.71427, -74.00597),
+            "new yrok": (40.71427, -74.00597),
+            "Mexico": (19.42847, -99.12766),
+            "Ghent, BE": (51.05, 3.71667),
+            "Mexique": (23.0, -102.0),
+            "Atlantis": None,
+            # Qualifiers restrict the match to a country or state (unknown ones are left to the online geocoder)
+            "Halle": (51.48158, 11.97947),
+            "Halle, Belgium": (50.73385, 4.23454),
+            "Halle, Flanders, BE": (50.73385, 4.23454),
+            "Paris": (48.85341, 2.3488),
+            "Paris, Texas": (33.66094, -95.55551),
+            "Paris, TX": (33.66094, -95.55551),
+            "Paris, United States": (33.66094, -95.55551),
+            "Paris, Atlantis": None,
+            "Paris, Belgium": None,
+        }
+        for location, expected in locations.items():
+            coords = gazetteer.lookup(location)
+            logger.info(f"{location} -> {coords}")
+            assert coords == expected, f"{location}: expected {expected}, got {coords}"
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,47 @@
+import typer
+import os
+import sys
+
+# Add main dir to system path
+main_dir = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir))
+sys.path.append(main_dir)
+from pipeline.utils import get_config, get_logger
+from pipeline.router import Router
+
+
+def main(
+    config_path: str = os.path.join(main_dir, "config.json"),
+    log_level: str = "DEBUG",
+):
+    """
+    Local intent router test script
+    """
+
+    # Initialize program
+    config = get_config(config_path)
+    logger = get_logger(log_level=log_level)
+    logger.info("Program Initialized")
+
+    # Initialize router
+    router = Router(config)
+
+    # Route prompts (None = sent to the LLM)
+    prompts = [
+        "What is fifty seven times three hundred twenty one?",
+        "What is two to the power of ten?",
+        "What is three point one four times two?",
+        "What's the weather like in New York?",
+        "What's the weather in Paris tomorrow?",
+        "What's the weather in Paris and London?",
+        "Who are you?",
+        "What can you do?",
+        "Who is the president of France?",
+    ]
+    for prompt in prompts:
+        response = router.route(prompt)
+        logger.info(f"{prompt} -> {response}")
+    logger.info(f"Router statistics: {router.stats()}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -23,11 +23,19 @@ def main(
     if test_algebra:
         logger.info("Testing algebra")
         algebra_tool = Algebra()
-        equation = "3 * 4 + 2 * 6"
-        try:
-            algebra_tool(equation)
-        except ToolError as e:
-            logger.error(e)
+        equations = [
+            "3 * 4 + 2 * 6",
+            "(3 + 4) ** 2 / 7",
+            "7 // 2",
+            "fifty seven times three hundred twenty one",
+            "9 ** 9 ** 9",
+        ]
+        for equation in equations:
+            try:
+                result = algebra_tool(equation)
+                logger.info(f"{equation} = {result}")
+            except ToolError as e:
+                logger.error(e)
 
     # Test weather
     if test_weather: